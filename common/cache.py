@@ -0,0 +1,588 @@
+import asyncio
+import math
+import random
+import time
+from enum import Enum
+from typing import Any, Awaitable, Callable, Hashable
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache
+from prometheus_client import REGISTRY
+
+from common.metrics import CACHE_EVENTS
+
+MISSING = object()
+
+
+class ReservationStatus(Enum):
+    RESERVED = 0
+    NOT_CACHED = 1
+    INSUFFICIENT = 2
+
+
+def get_redis_client():
+    """
+    Raw client of the default cache for atomic operations,
+    or None when the cache is not backed by Redis.
+    """
+    backend = caches["default"]
+    if not isinstance(backend, RedisCache):
+        return None
+
+    return backend._cache.get_client(write=True)
+
+
+class CacheStats:
+    """
+    Cache counters of this process, kept in the `cache_events_total`
+    Prometheus metric labelled with the cache name.
+    """
+
+    EVENTS = ["hits", "misses", "recomputes", "early_recomputes"]
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def incr(self, event: str, amount: int = 1) -> None:
+        CACHE_EVENTS.labels(self.name, event).inc(amount)
+
+    def get(self, event: str) -> int:
+        value = REGISTRY.get_sample_value(
+            "cache_events_total", {"cache": self.name, "event": event}
+        )
+        return int(value or 0)
+
+    def as_dict(self) -> dict[str, int]:
+        return {event: self.get(event) for event in self.EVENTS}
+
+
+class ReadThroughCache:
+    """
+    Read-through cache on top of the default Django cache.
+
+    Falsy values (e.g. a zero balance) are regular hits. Only one caller
+    per key recomputes a missing value while the others wait for it, and
+    values are recomputed probabilistically shortly before they expire
+    (XFetch), so a hot key never expires for every caller at once.
+    """
+
+    def __init__(
+        self,
+        key_prefix: str,
+        timeout: int,
+        early_expiration_beta: float = 1.0,
+        lock_timeout: float = 5,
+        lock_poll_interval: float = 0.05,
+        name: str | None = None,
+    ):
+        self.key_prefix = key_prefix
+        self.timeout = timeout
+        self.early_expiration_beta = early_expiration_beta
+        self.lock_timeout = lock_timeout
+        self.lock_poll_interval = lock_poll_interval
+        self.stats = CacheStats(name or key_prefix)
+
+    def make_key(self, key: Hashable) -> str:
+        return f"{self.key_prefix}{key}"
+
+    def get(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        cache_key = self.make_key(key)
+        meta_key = self._get_meta_key(cache_key)
+        entries = cache.get_many([cache_key, meta_key])
+
+        value = entries.get(cache_key, MISSING)
+        if value is not MISSING:
+            self.stats.incr("hits")
+            if self._should_recompute_early(
+                entries.get(meta_key)
+            ) and self._acquire_lock(cache_key):
+                self.stats.incr("early_recomputes")
+                return self._recompute(cache_key, compute)
+
+            return value
+
+        self.stats.incr("misses")
+        if self._acquire_lock(cache_key):
+            return self._recompute_missing(cache_key, compute)
+
+        # Another caller is recomputing the value
+        value = self._wait_for_value(cache_key)
+        if value is not MISSING:
+            return value
+
+        return self._recompute(cache_key, compute, locked=False)
+
+    async def aget(
+        self, key: Hashable, acompute: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Async counterpart of `get`, waiting on a concurrent recompute
+        yields to the event loop instead of blocking the thread.
+        """
+        cache_key = self.make_key(key)
+        meta_key = self._get_meta_key(cache_key)
+        entries = await cache.aget_many([cache_key, meta_key])
+
+        value = entries.get(cache_key, MISSING)
+        if value is not MISSING:
+            self.stats.incr("hits")
+            if self._should_recompute_early(
+                entries.get(meta_key)
+            ) and await self._aacquire_lock(cache_key):
+                self.stats.incr("early_recomputes")
+                return await self._arecompute(cache_key, acompute)
+
+            return value
+
+        self.stats.incr("misses")
+        if await self._aacquire_lock(cache_key):
+            return await self._arecompute_missing(cache_key, acompute)
+
+        # Another caller is recomputing the value
+        value = await self._await_value(cache_key)
+        if value is not MISSING:
+            return value
+
+        return await self._arecompute(cache_key, acompute, locked=False)
+
+    def get_many(
+        self,
+        keys: list[Hashable],
+        compute_many: Callable[[list[Hashable]], dict[Hashable, Any]],
+    ) -> dict[Hashable, Any]:
+        """
+        Fetch many values with one cache round trip and compute
+        all misses with a single `compute_many` call.
+        """
+        cache_keys = {self.make_key(key): key for key in keys}
+        values = {
+            cache_keys[cache_key]: value
+            for cache_key, value in cache.get_many(list(cache_keys)).items()
+        }
+        self.stats.incr("hits", len(values))
+
+        missing_keys = [key for key in keys if key not in values]
+        if missing_keys:
+            self.stats.incr("misses", len(missing_keys))
+            started_at = time.monotonic()
+            computed = compute_many(missing_keys)
+            self.stats.incr("recomputes", len(computed))
+            stored = self._store(
+                {self.make_key(key): value for key, value in computed.items()},
+                time.monotonic() - started_at,
+            )
+            values.update(
+                {key: stored[self.make_key(key)] for key in computed}
+            )
+
+        return values
+
+    def delete_many(self, keys: list[Hashable]) -> None:
+        cache_keys = [self.make_key(key) for key in keys]
+        cache.delete_many(
+            cache_keys
+            + [self._get_meta_key(cache_key) for cache_key in cache_keys]
+        )
+
+    def _recompute_missing(
+        self, cache_key: str, compute: Callable[[], Any]
+    ) -> Any:
+        """
+        Recompute a missing value under the lock, unless a previous
+        lock holder stored it since the miss.
+        """
+        value = cache.get(cache_key, MISSING)
+        if value is MISSING:
+            return self._recompute(cache_key, compute)
+
+        cache.delete(self._get_lock_key(cache_key))
+        return value
+
+    async def _arecompute_missing(
+        self, cache_key: str, acompute: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        value = await cache.aget(cache_key, MISSING)
+        if value is MISSING:
+            return await self._arecompute(cache_key, acompute)
+
+        await cache.adelete(self._get_lock_key(cache_key))
+        return value
+
+    def _recompute(
+        self, cache_key: str, compute: Callable[[], Any], locked: bool = True
+    ) -> Any:
+        try:
+            started_at = time.monotonic()
+            value = compute()
+            self.stats.incr("recomputes")
+            return self._store(
+                {cache_key: value}, time.monotonic() - started_at
+            )[cache_key]
+        finally:
+            if locked:
+                cache.delete(self._get_lock_key(cache_key))
+
+    async def _arecompute(
+        self,
+        cache_key: str,
+        acompute: Callable[[], Awaitable[Any]],
+        locked: bool = True,
+    ) -> Any:
+        try:
+            started_at = time.monotonic()
+            value = await acompute()
+            self.stats.incr("recomputes")
+            stored = await sync_to_async(self._store)(
+                {cache_key: value}, time.monotonic() - started_at
+            )
+            return stored[cache_key]
+        finally:
+            if locked:
+                await cache.adelete(self._get_lock_key(cache_key))
+
+    def _store(
+        self, values: dict[str, Any], compute_time: float
+    ) -> dict[str, Any]:
+        """
+        Store computed values by cache key and return them.
+        """
+        cache.set_many(
+            {**values, **self._build_meta(values, compute_time)},
+            timeout=self.timeout,
+        )
+        return values
+
+    def _build_meta(
+        self, values: dict[str, Any], compute_time: float
+    ) -> dict[str, tuple[float, float]]:
+        expires_at = time.time() + self.timeout
+        return {
+            self._get_meta_key(cache_key): (compute_time, expires_at)
+            for cache_key in values
+        }
+
+    def _should_recompute_early(
+        self, meta: tuple[float, float] | None
+    ) -> bool:
+        """
+        XFetch: the closer the expiry and the slower the recompute,
+        the likelier a caller refreshes the value ahead of time.
+        """
+        if meta is None or not self.early_expiration_beta:
+            return False
+
+        compute_time, expires_at = meta
+        return (
+            time.time()
+            - compute_time
+            * self.early_expiration_beta
+            * math.log(1 - random.random())
+            >= expires_at
+        )
+
+    def _acquire_lock(self, cache_key: str) -> bool:
+        return cache.add(
+            self._get_lock_key(cache_key), 1, timeout=self.lock_timeout
+        )
+
+    def _wait_for_value(self, cache_key: str) -> Any:
+        """
+        Poll for the value of the lock holder. Stops early when the lock
+        is released without a value, e.g. when its compute raised.
+        """
+        lock_key = self._get_lock_key(cache_key)
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.lock_poll_interval)
+            entries = cache.get_many([cache_key, lock_key])
+            if cache_key in entries or lock_key not in entries:
+                return entries.get(cache_key, MISSING)
+
+        return MISSING
+
+    async def _aacquire_lock(self, cache_key: str) -> bool:
+        return await cache.aadd(
+            self._get_lock_key(cache_key), 1, timeout=self.lock_timeout
+        )
+
+    async def _await_value(self, cache_key: str) -> Any:
+        lock_key = self._get_lock_key(cache_key)
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.lock_poll_interval)
+            entries = await cache.aget_many([cache_key, lock_key])
+            if cache_key in entries or lock_key not in entries:
+                return entries.get(cache_key, MISSING)
+
+        return MISSING
+
+    @staticmethod
+    def _get_meta_key(cache_key: str) -> str:
+        return f"{cache_key}:meta"
+
+    @staticmethod
+    def _get_lock_key(cache_key: str) -> str:
+        return f"{cache_key}:lock"
+
+
+class VersionedReadThroughCache(ReadThroughCache):
+    """
+    Read-through cache of integer values that are also updated
+    in place by writers (write-through).
+
+    Computed values come with the version of their source row, and
+    every write to the source bumps that version. On Redis, a value is
+    stored only if it is newer than the cached one, and a delta is
+    applied with INCRBY only if the cached version is the one the write
+    started from; a write that finds no cached value leaves its version
+    behind, so a stale reader or writer can never win. Other
+    backends fall back to invalidation on write.
+    """
+
+    # KEYS: value and version key pairs,
+    # ARGV: timeout, then value and version pairs
+    STORE_SCRIPT = """
+        local stored = {}
+        for i = 1, #KEYS, 2 do
+            local version = tonumber(redis.call('GET', KEYS[i + 1]))
+            local new_version = tonumber(ARGV[i + 2])
+            -- A version without a value is the tombstone of a write,
+            -- only values that include that write are stored
+            if not version
+                or version < new_version
+                or (version == new_version
+                    and redis.call('EXISTS', KEYS[i]) == 0) then
+                redis.call('SET', KEYS[i], ARGV[i + 1], 'EX', ARGV[1])
+                redis.call('SET', KEYS[i + 1], ARGV[i + 2], 'EX', ARGV[1])
+                stored[#stored + 1] = 1
+            else
+                stored[#stored + 1] = 0
+            end
+        end
+        return stored
+    """
+
+    # KEYS: value, version and reserved key triples,
+    # ARGV: timeout, then delta, new version and released amount triples
+    INCR_SCRIPT = """
+        for i = 1, #KEYS, 3 do
+            local version = tonumber(redis.call('GET', KEYS[i + 1]))
+            local new_version = tonumber(ARGV[i + 2])
+            local released = tonumber(ARGV[i + 3])
+            if released > 0
+                and redis.call('DECRBY', KEYS[i + 2], released) <= 0 then
+                redis.call('DEL', KEYS[i + 2])
+            end
+            if version == new_version - 1
+                and redis.call('EXISTS', KEYS[i]) == 1 then
+                redis.call('INCRBY', KEYS[i], ARGV[i + 1])
+                redis.call('SET', KEYS[i + 1], new_version, 'KEEPTTL')
+            elseif not version or version < new_version then
+                -- Leave the version behind as a tombstone, so a reader
+                -- that loaded the balance before this write cannot
+                -- cache it afterwards
+                redis.call('DEL', KEYS[i])
+                redis.call('SET', KEYS[i + 1], new_version, 'EX', ARGV[1])
+            end
+        end
+        return 1
+    """
+
+    # KEYS: value and reserved key pairs,
+    # ARGV: reservation timeout, then amounts.
+    # Returns the status and the 1-based index of the failing pair
+    RESERVE_SCRIPT = """
+        for i = 1, #KEYS, 2 do
+            local index = (i + 1) / 2
+            local value = redis.call('GET', KEYS[i])
+            if not value then
+                return {1, index}
+            end
+            local reserved = tonumber(redis.call('GET', KEYS[i + 1]) or 0)
+            if tonumber(value) - reserved < tonumber(ARGV[index + 1]) then
+                return {2, index}
+            end
+        end
+        for i = 1, #KEYS, 2 do
+            redis.call('INCRBY', KEYS[i + 1], ARGV[(i + 1) / 2 + 1])
+            redis.call('EXPIRE', KEYS[i + 1], ARGV[1])
+        end
+        return {0, 0}
+    """
+
+    # KEYS: reserved keys, ARGV: amounts
+    RELEASE_SCRIPT = """
+        for i = 1, #KEYS do
+            if redis.call('DECRBY', KEYS[i], ARGV[i]) <= 0 then
+                redis.call('DEL', KEYS[i])
+            end
+        end
+        return 1
+    """
+
+    def reserve_many(
+        self, amounts: dict[Hashable, int], timeout: int
+    ) -> tuple[ReservationStatus, Hashable | None]:
+        """
+        Atomically reserve amounts against cached values: either every
+        cached value minus its reservations covers its amount and all
+        amounts are reserved, or nothing is. Reservations expire after
+        `timeout` seconds unless released earlier.
+
+        Returns the status and the key that failed, if any.
+        """
+        client = get_redis_client()
+        if client is None or not amounts:
+            return ReservationStatus.NOT_CACHED, None
+
+        keys = list(amounts)
+        redis_keys = []
+        for key in keys:
+            cache_key = self.make_key(key)
+            redis_keys += [
+                cache.make_key(cache_key),
+                cache.make_key(self._get_reserved_key(cache_key)),
+            ]
+
+        status, index = client.eval(
+            self.RESERVE_SCRIPT,
+            len(redis_keys),
+            *redis_keys,
+            timeout,
+            *amounts.values(),
+        )
+        status = ReservationStatus(status)
+        if status == ReservationStatus.RESERVED:
+            return status, None
+
+        return status, keys[index - 1]
+
+    def release_many(self, amounts: dict[Hashable, int]) -> None:
+        client = get_redis_client()
+        if client is None or not amounts:
+            return
+
+        client.eval(
+            self.RELEASE_SCRIPT,
+            len(amounts),
+            *[
+                cache.make_key(self._get_reserved_key(self.make_key(key)))
+                for key in amounts
+            ],
+            *amounts.values(),
+        )
+
+    def get_versioned_many(
+        self, keys: list[Hashable]
+    ) -> dict[Hashable, tuple[int, int | None]]:
+        """
+        Cached `(value, version)` pairs without recomputing misses.
+        """
+        cache_keys = {self.make_key(key): key for key in keys}
+        entries = cache.get_many(
+            list(cache_keys)
+            + [self._get_version_key(cache_key) for cache_key in cache_keys]
+        )
+        return {
+            key: (
+                entries[cache_key],
+                entries.get(self._get_version_key(cache_key)),
+            )
+            for cache_key, key in cache_keys.items()
+            if cache_key in entries
+        }
+
+    def incr_many(
+        self,
+        deltas: dict[Hashable, tuple[int, int]],
+        released: dict[Hashable, int] | None = None,
+    ) -> None:
+        """
+        Apply `(delta, new_version)` pairs to cached values.
+        Must be called once the write is committed.
+
+        `released` amounts are taken off the reservations of the same
+        keys in the same step, so an applied debit is never counted
+        both in the value and in a reservation.
+        """
+        if not deltas:
+            return
+
+        client = get_redis_client()
+        if client is None:
+            self.delete_many(list(deltas))
+            return
+
+        released = released or {}
+        keys, args = [], [self.timeout]
+        for key, (delta, version) in deltas.items():
+            cache_key = self.make_key(key)
+            keys += [
+                *self._make_redis_keys(cache_key),
+                cache.make_key(self._get_reserved_key(cache_key)),
+            ]
+            args += [delta, version, released.get(key, 0)]
+
+        client.eval(self.INCR_SCRIPT, len(keys), *keys, *args)
+
+    def set_many(self, values: dict[Hashable, tuple[int, int]]) -> None:
+        """
+        Store `(value, version)` pairs unless newer ones are cached.
+        """
+        self._store(
+            {self.make_key(key): value for key, value in values.items()}, 0
+        )
+
+    def delete_many(self, keys: list[Hashable]) -> None:
+        cache_keys = [self.make_key(key) for key in keys]
+        cache.delete_many(
+            cache_keys
+            + [self._get_meta_key(cache_key) for cache_key in cache_keys]
+            + [self._get_version_key(cache_key) for cache_key in cache_keys]
+        )
+
+    def _store(
+        self, values: dict[str, tuple[int, int]], compute_time: float
+    ) -> dict[str, int]:
+        client = get_redis_client()
+        if client is None:
+            cache.set_many(
+                {
+                    **{
+                        cache_key: value
+                        for cache_key, (value, _) in values.items()
+                    },
+                    **{
+                        self._get_version_key(cache_key): version
+                        for cache_key, (_, version) in values.items()
+                    },
+                },
+                timeout=self.timeout,
+            )
+        else:
+            keys, args = [], [self.timeout]
+            for cache_key, (value, version) in values.items():
+                keys += self._make_redis_keys(cache_key)
+                args += [value, version]
+
+            client.eval(self.STORE_SCRIPT, len(keys), *keys, *args)
+
+        cache.set_many(
+            self._build_meta(values, compute_time), timeout=self.timeout
+        )
+        return {cache_key: value for cache_key, (value, _) in values.items()}
+
+    def _make_redis_keys(self, cache_key: str) -> list[str]:
+        return [
+            cache.make_key(cache_key),
+            cache.make_key(self._get_version_key(cache_key)),
+        ]
+
+    @staticmethod
+    def _get_version_key(cache_key: str) -> str:
+        return f"{cache_key}:version"
+
+    @staticmethod
+    def _get_reserved_key(cache_key: str) -> str:
+        return f"{cache_key}:reserved"
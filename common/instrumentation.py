@@ -0,0 +1,131 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Iterator
+
+import redis
+from django.core.cache.backends.redis import RedisCache, RedisCacheClient
+
+
+@dataclass
+class RequestMetrics:
+    """
+    Database and cache work done while serving a request, times in seconds.
+    """
+
+    db_queries: int = 0
+    db_time: float = 0.0
+    cache_calls: int = 0
+    cache_time: float = 0.0
+
+
+# Shared with the threads sync_to_async runs queries in,
+# as they inherit the context of the request
+_request_metrics: ContextVar[RequestMetrics | None] = ContextVar(
+    "request_metrics", default=None
+)
+
+
+def start_request_metrics() -> RequestMetrics:
+    metrics = RequestMetrics()
+    _request_metrics.set(metrics)
+    return metrics
+
+
+def stop_request_metrics() -> None:
+    _request_metrics.set(None)
+
+
+@contextmanager
+def resume_request_metrics(metrics: RequestMetrics) -> Iterator[None]:
+    """
+    Record the work done outside of the request's own context towards
+    its metrics, e.g. while its streaming response is consumed.
+    """
+    token = _request_metrics.set(metrics)
+    try:
+        yield
+    finally:
+        _request_metrics.reset(token)
+
+
+@contextmanager
+def record_cache_call() -> Iterator[None]:
+    metrics = _request_metrics.get()
+    if metrics is None:
+        yield
+        return
+
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.cache_calls += 1
+        metrics.cache_time += time.perf_counter() - started_at
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper, see `install_query_recorder`.
+    """
+    metrics = _request_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+
+    started_at = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_queries += 1
+        metrics.db_time += time.perf_counter() - started_at
+
+
+def install_query_recorder(sender, connection, **kwargs) -> None:
+    """
+    `connection_created` receiver: wrappers stay installed for the
+    lifetime of the connection object, across reconnects.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class InstrumentedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error: bool = True):
+        with record_cache_call():
+            return super().execute(raise_on_error)
+
+
+class InstrumentedRedis(redis.Redis):
+    """
+    Redis client counting commands towards the current request,
+    a pipeline counts as a single call.
+    """
+
+    def execute_command(self, *args, **options):
+        with record_cache_call():
+            return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(
+            self.connection_pool,
+            self.response_callbacks,
+            transaction,
+            shard_hint,
+        )
+
+
+class InstrumentedRedisCacheClient(RedisCacheClient):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._client = InstrumentedRedis
+
+
+class InstrumentedRedisCache(RedisCache):
+    """
+    Redis cache backend recording its calls in the request metrics.
+    """
+
+    def __init__(self, server, params):
+        super().__init__(server, params)
+        self._class = InstrumentedRedisCacheClient
@@ -0,0 +1,29 @@
+import os
+
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    generate_latest,
+    multiprocess,
+)
+
+CACHE_EVENTS = Counter(
+    "cache_events_total",
+    "Read-through cache hits, misses and recomputes",
+    ["cache", "event"],
+)
+
+
+def generate_metrics() -> bytes:
+    """
+    Metrics in the Prometheus text format. With PROMETHEUS_MULTIPROC_DIR
+    set, every worker process writes its samples to that directory and
+    they are aggregated across workers here.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return generate_latest(REGISTRY)
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
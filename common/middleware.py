@@ -0,0 +1,170 @@
+import logging
+import time
+from typing import AsyncIterator, Callable, Iterator
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+
+from common.instrumentation import (
+    RequestMetrics,
+    install_query_recorder,
+    resume_request_metrics,
+    start_request_metrics,
+    stop_request_metrics,
+)
+
+logger = logging.getLogger(__name__)
+
+STREAM_END = object()
+
+
+class RequestMetricsMiddleware:
+    """
+    Record the database queries, cache calls and latency of every request,
+    tagged by URL name, in a `Server-Timing` header and a log record.
+
+    A streaming response is measured until it is closed, after its
+    content has been consumed; its headers are sent before that, so it
+    gets no `Server-Timing` header and is only logged.
+
+    Keep it first in MIDDLEWARE so the latency covers the other middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+        connection_created.connect(
+            install_query_recorder, dispatch_uid="request_metrics"
+        )
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(None, connection)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        started_at = time.perf_counter()
+        metrics = start_request_metrics()
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_request_metrics()
+
+        self._report(request, response, metrics, started_at)
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        started_at = time.perf_counter()
+        metrics = start_request_metrics()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stop_request_metrics()
+
+        self._report(request, response, metrics, started_at)
+        return response
+
+    def _report(
+        self,
+        request: HttpRequest,
+        response: HttpResponse,
+        metrics: RequestMetrics,
+        started_at: float,
+    ) -> None:
+        if isinstance(response, StreamingHttpResponse):
+            content_class = (
+                AsyncMeteredStream if response.is_async else MeteredStream
+            )
+            # The response closes the content it streams
+            response.streaming_content = content_class(
+                response.streaming_content,
+                metrics,
+                lambda: self._log(request, response, metrics, started_at),
+            )
+            return
+
+        duration = self._log(request, response, metrics, started_at)
+        response["Server-Timing"] = (
+            f'db;dur={metrics.db_time * 1000:.2f};desc="{metrics.db_queries} '
+            f'queries", cache;dur={metrics.cache_time * 1000:.2f};'
+            f'desc="{metrics.cache_calls} calls", '
+            f"total;dur={duration * 1000:.2f}"
+        )
+
+    @staticmethod
+    def _log(
+        request: HttpRequest,
+        response: HttpResponse,
+        metrics: RequestMetrics,
+        started_at: float,
+    ) -> float:
+        duration = time.perf_counter() - started_at
+        url_name = (
+            request.resolver_match.url_name if request.resolver_match else None
+        )
+
+        logger.info(
+            "%s %s %s",
+            request.method,
+            url_name,
+            response.status_code,
+            extra={
+                "url_name": url_name,
+                "method": request.method,
+                "status_code": response.status_code,
+                "db_queries": metrics.db_queries,
+                "db_time_ms": round(metrics.db_time * 1000, 2),
+                "cache_calls": metrics.cache_calls,
+                "cache_time_ms": round(metrics.cache_time * 1000, 2),
+                "duration_ms": round(duration * 1000, 2),
+            },
+        )
+        return duration
+
+
+class MeteredStream:
+    """
+    Streaming content recording the work done while it is consumed
+    towards the metrics of its request, reported once it is closed.
+    """
+
+    def __init__(
+        self,
+        content: Iterator[bytes],
+        metrics: RequestMetrics,
+        on_close: Callable[[], object],
+    ):
+        self._content = content
+        self._metrics = metrics
+        self._on_close = on_close
+        self._closed = False
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            with resume_request_metrics(self._metrics):
+                chunk = next(self._content, STREAM_END)
+            if chunk is STREAM_END:
+                return
+            yield chunk
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._on_close()
+
+
+class AsyncMeteredStream(MeteredStream):
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        while True:
+            with resume_request_metrics(self._metrics):
+                chunk = await anext(self._content, STREAM_END)
+            if chunk is STREAM_END:
+                return
+            yield chunk
@@ -0,0 +1,49 @@
+from uuid import uuid4
+
+from django.test import SimpleTestCase
+
+from common.cache import VersionedReadThroughCache, get_redis_client
+
+
+class VersionedReadThroughCacheRedisTests(SimpleTestCase):
+    def setUp(self):
+        if get_redis_client() is None:
+            self.skipTest("Requires the Redis cache backend")
+
+        self.cache = VersionedReadThroughCache(
+            key_prefix=f"test:{uuid4()}:", timeout=60
+        )
+        self.key = uuid4()
+        self.addCleanup(self.cache.delete_many, [self.key])
+
+    def test_stale_read_is_not_stored__after_write_on_cache_miss(self):
+        # A reader loads (500, v5), then a write of -100 commits as v6
+        # while nothing is cached, then the reader stores its value
+        self.cache.incr_many({self.key: (-100, 6)})
+        self.cache.set_many({self.key: (500, 5)})
+
+        self.assertEqual(self.cache.get_versioned_many([self.key]), {})
+
+        # A reader that loaded the balance after the write stores it
+        self.cache.set_many({self.key: (400, 6)})
+
+        self.assertEqual(
+            self.cache.get_versioned_many([self.key]), {self.key: (400, 6)}
+        )
+
+    def test_stale_read_is_not_stored__over_newer_value(self):
+        self.cache.set_many({self.key: (400, 6)})
+        self.cache.set_many({self.key: (500, 5)})
+        self.cache.set_many({self.key: (450, 6)})
+
+        self.assertEqual(
+            self.cache.get_versioned_many([self.key]), {self.key: (400, 6)}
+        )
+
+    def test_write_is_applied__when_cached_version_matches(self):
+        self.cache.set_many({self.key: (500, 5)})
+        self.cache.incr_many({self.key: (-100, 6)})
+
+        self.assertEqual(
+            self.cache.get_versioned_many([self.key]), {self.key: (400, 6)}
+        )
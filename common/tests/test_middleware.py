@@ -0,0 +1,81 @@
+from unittest.mock import patch
+
+import redis
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from common.instrumentation import (
+    InstrumentedRedis,
+    start_request_metrics,
+    stop_request_metrics,
+)
+from users.models import User, UserBalance
+
+
+class RequestMetricsMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(
+            username="username", password="hashed_password"
+        )
+        UserBalance.objects.create(user=self.user, amount=1000)
+        self.url = reverse("user-balance", kwargs={"user_id": self.user.id})
+
+    def test_reports_request_metrics(self):
+        with self.assertLogs("common.middleware", "INFO") as logs:
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(
+            response["Server-Timing"],
+            r'^db;dur=[\d.]+;desc="1 queries", '
+            r'cache;dur=[\d.]+;desc="\d+ calls", total;dur=[\d.]+$',
+        )
+        [record] = logs.records
+        self.assertEqual(record.url_name, "user-balance")
+        self.assertEqual(record.status_code, 200)
+        self.assertEqual(record.db_queries, 1)
+
+    def test_reports_no_queries__when_served_from_cache(self):
+        self.client.get(self.url)
+
+        response = self.client.get(self.url)
+
+        self.assertIn('desc="0 queries"', response["Server-Timing"])
+
+    def test_reports_streaming_response__once_consumed(self):
+        url = reverse(
+            "user-transaction-export", kwargs={"user_id": self.user.id}
+        )
+
+        with self.assertLogs("common.middleware", "INFO") as logs:
+            response = self.client.get(url, {"file_format": "csv"})
+
+            self.assertEqual(logs.records, [])
+            b"".join(response.streaming_content)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Server-Timing", response)
+        [record] = logs.records
+        self.assertEqual(record.url_name, "user-transaction-export")
+        # The user lookup and the statement read while streaming
+        self.assertEqual(record.db_queries, 2)
+
+
+class InstrumentedRedisTests(TestCase):
+    @patch.object(redis.Redis, "execute_command", return_value=b"1")
+    def test_counts_commands_of_current_request(self, mock_execute_command):
+        client = InstrumentedRedis()
+
+        client.execute_command("GET", "outside")
+        metrics = start_request_metrics()
+        try:
+            client.execute_command("GET", "key")
+            client.execute_command("INCRBY", "key", 1)
+        finally:
+            stop_request_metrics()
+
+        self.assertEqual(metrics.cache_calls, 2)
+        self.assertGreater(metrics.cache_time, 0)
+        self.assertEqual(mock_execute_command.call_count, 3)
@@ -0,0 +1,53 @@
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+from io import BytesIO
+from unittest.mock import patch
+from uuid import uuid4
+
+from django.test import SimpleTestCase
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+
+from common.parsers import ORJSONParser
+from common.renderers import ORJSONRenderer
+
+
+class ORJSONRendererTests(SimpleTestCase):
+    def setUp(self):
+        self.data = {
+            "id": uuid4(),
+            "created_at": datetime(
+                2024, 1, 2, 3, 4, 5, 6, tzinfo=timezone.utc
+            ),
+            "amount": Decimal("1.5"),
+            "participants": [{"share": 1}],
+        }
+
+    def test_render__matches_drf_renderer(self):
+        self.assertEqual(
+            json.loads(ORJSONRenderer().render(self.data)),
+            json.loads(JSONRenderer().render(self.data)),
+        )
+
+    @patch("common.renderers.orjson", None)
+    def test_render__falls_back__when_orjson_is_missing(self):
+        self.assertEqual(
+            ORJSONRenderer().render(self.data),
+            JSONRenderer().render(self.data),
+        )
+
+    def test_render__none(self):
+        self.assertEqual(ORJSONRenderer().render(None), b"")
+
+
+class ORJSONParserTests(SimpleTestCase):
+    def test_parse(self):
+        self.assertEqual(
+            ORJSONParser().parse(BytesIO(b'{"user_ids": ["a"], "n": 1}')),
+            {"user_ids": ["a"], "n": 1},
+        )
+
+    def test_parse__raises_error__when_invalid_json(self):
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(BytesIO(b"{"))
@@ -0,0 +1,53 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from users.services import balance_cache
+
+
+class MetricsViewTests(TestCase):
+    def test_metrics(self):
+        balance_cache.stats.incr("hits")
+
+        response = self.client.get(reverse("metrics"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], CONTENT_TYPE_LATEST)
+        content = response.content.decode()
+        self.assertIn(
+            'cache_events_total{cache="user_balance",event="hits"}', content
+        )
+        self.assertIn("transaction_write_seconds", content)
+
+    def test_metrics__forbidden_outside_allowed_networks(self):
+        with self.assertLogs("django.request", "WARNING"):
+            response = self.client.get(
+                reverse("metrics"),
+                REMOTE_ADDR="203.0.113.7",
+                HTTP_X_FORWARDED_FOR="127.0.0.1",
+            )
+
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_ALLOWED_NETWORKS=["10.0.0.0/8"])
+    def test_metrics__allowed_network(self):
+        response = self.client.get(reverse("metrics"), REMOTE_ADDR="10.1.2.3")
+
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics__token(self):
+        url = reverse("metrics")
+
+        response = self.client.get(
+            url, REMOTE_ADDR="203.0.113.7", HTTP_AUTHORIZATION="Bearer secret"
+        )
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertLogs("django.request", "WARNING"):
+            response = self.client.get(
+                url,
+                REMOTE_ADDR="203.0.113.7",
+                HTTP_AUTHORIZATION="Bearer wrong",
+            )
+        self.assertEqual(response.status_code, 403)
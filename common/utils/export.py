@@ -0,0 +1,30 @@
+import csv
+import json
+from typing import Iterable, Iterator
+
+
+class _Echo:
+    """
+    File-like object handing written rows back to the csv writer caller.
+    """
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def stream_csv(rows: Iterable[dict], fieldnames: list[str]) -> Iterator[str]:
+    """
+    Render rows as CSV lines one at a time, without buffering them.
+    """
+    writer = csv.DictWriter(_Echo(), fieldnames=fieldnames)
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_ndjson(rows: Iterable[dict]) -> Iterator[str]:
+    """
+    Render rows as newline-delimited JSON one at a time.
+    """
+    for row in rows:
+        yield json.dumps(row) + "\n"
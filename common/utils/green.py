@@ -0,0 +1,41 @@
+import sys
+
+from django.core.exceptions import ImproperlyConfigured
+
+
+def is_gevent_patched() -> bool:
+    monkey = sys.modules.get("gevent.monkey")
+    return monkey is not None and monkey.is_module_patched("select")
+
+
+def ensure_green_database_driver() -> None:
+    """
+    Fail when gevent patched the process but the PostgreSQL driver
+    still blocks the hub on queries, which would serialise every
+    greenlet of a worker behind the running query.
+    """
+    if not is_gevent_patched():
+        return
+
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+    if is_psycopg3:
+        from psycopg import waiting
+
+        # psycopg picks its wait function on import, the C one ignores
+        # gevent and is only used when psycopg is imported unpatched
+        if waiting.wait is getattr(waiting, "wait_c", None):
+            raise ImproperlyConfigured(
+                "psycopg was imported before gevent patched the process, "
+                "database queries would block the worker. Call "
+                "gevent.monkey.patch_all() before importing Django."
+            )
+        return
+
+    import psycopg2.extensions
+
+    if psycopg2.extensions.get_wait_callback() is None:
+        raise ImproperlyConfigured(
+            "psycopg2 blocks the gevent hub on queries, install psycopg 3 "
+            "or call psycogreen.gevent.patch_psycopg() on startup."
+        )
@@ -0,0 +1,23 @@
+import base64
+from datetime import datetime
+from uuid import UUID
+
+
+def encode_keyset_cursor(created_at: datetime, last_id: UUID) -> str:
+    """
+    Opaque cursor pointing at the `(created_at, id)` of the last
+    item of a page.
+    """
+    return base64.urlsafe_b64encode(
+        f"{created_at.isoformat()}|{last_id}".encode()
+    ).decode()
+
+
+def decode_keyset_cursor(cursor: str) -> tuple[datetime, UUID]:
+    """
+    Raises ValueError when the cursor is malformed.
+    """
+    created_at, last_id = (
+        base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    )
+    return datetime.fromisoformat(created_at), UUID(last_id)
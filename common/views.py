@@ -0,0 +1,38 @@
+import hmac
+import ipaddress
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse, HttpResponseForbidden
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from common.metrics import generate_metrics
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    if not is_metrics_client(request):
+        return HttpResponseForbidden()
+
+    return HttpResponse(generate_metrics(), content_type=CONTENT_TYPE_LATEST)
+
+
+def is_metrics_client(request: HttpRequest) -> bool:
+    """
+    Whether the request comes from METRICS_ALLOWED_NETWORKS or carries
+    METRICS_TOKEN as a bearer token.
+    """
+    if settings.METRICS_TOKEN:
+        authorization = request.headers.get("Authorization", "")
+        if hmac.compare_digest(
+            authorization.encode(), f"Bearer {settings.METRICS_TOKEN}".encode()
+        ):
+            return True
+
+    try:
+        address = ipaddress.ip_address(request.META.get("REMOTE_ADDR", ""))
+    except ValueError:
+        return False
+
+    return any(
+        address in ipaddress.ip_network(network, strict=False)
+        for network in settings.METRICS_ALLOWED_NETWORKS
+    )
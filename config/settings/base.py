@@ -38,6 +38,7 @@ THIRD_PARTY_APPS = [
 INSTALLED_APPS = DJANGO_DEFAULT_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 MIDDLEWARE = [
+    "common.middleware.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -69,24 +70,59 @@ TEMPLATES = [
 WSGI_APPLICATION = "config.wsgi.application"
 
 
+# Requests a gevent worker serves at once, shared with gunicorn.conf.py
+GUNICORN_WORKER_CONNECTIONS = int(
+    os.environ.get("GUNICORN_WORKER_CONNECTIONS", 1000)
+)
+
+# Connections are pooled per worker process. Persistent connections
+# alone do not help gevent workers, as every greenlet gets its own
+# connection; the pool caps the connections of a worker and the other
+# requests wait for one up to DB_POOL_TIMEOUT seconds.
+DB_POOL_ENABLED = os.environ.get("DB_POOL_ENABLED", "true").lower() == "true"
+
+DB_POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", 2))
+
+DB_POOL_MAX_SIZE = min(
+    int(os.environ.get("DB_POOL_MAX_SIZE", 20)), GUNICORN_WORKER_CONNECTIONS
+)
+
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+
+# Seconds a connection is reused when the pool is disabled
+DB_CONN_MAX_AGE = int(os.environ.get("DB_CONN_MAX_AGE", 60))
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql_psycopg2",
+        "ENGINE": "django.db.backends.postgresql",
         "NAME": os.environ.get("DB_NAME"),
         "USER": os.environ.get("DB_USER"),
         "PASSWORD": os.environ.get("DB_PASSWORD"),
         "HOST": os.environ.get("DB_HOST"),
         "PORT": os.environ.get("DB_PORT"),
+        # Pooled connections are handed back to the pool instead
+        "CONN_MAX_AGE": 0 if DB_POOL_ENABLED else DB_CONN_MAX_AGE,
+        # Also checks pooled connections before handing them out
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {},
     }
 }
 
+if DB_POOL_ENABLED:
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": DB_POOL_MIN_SIZE,
+        "max_size": DB_POOL_MAX_SIZE,
+        "timeout": DB_POOL_TIMEOUT,
+    }
+
 REDIS_HOST = os.environ.get("REDIS_HOST", "127.0.0.1")
 REDIS_PORT = os.environ.get("REDIS_PORT", 6379)
 REDIS_CONNECTION_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}"
 
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        # Counts Redis calls towards the request metrics
+        "BACKEND": "common.instrumentation.InstrumentedRedisCache",
         "LOCATION": REDIS_CONNECTION_URL,
     }
 }
@@ -106,7 +142,7 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
-AUTH_USER_MODEL = 'users.User'
+AUTH_USER_MODEL = "users.User"
 
 LANGUAGE_CODE = "en-us"
 
@@ -130,6 +166,15 @@ REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework_simplejwt.authentication.JWTAuthentication",
     ),
+    "DEFAULT_RENDERER_CLASSES": (
+        "common.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "common.parsers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": os.environ.get("PAGE_SIZE", 12),
 }
@@ -145,15 +190,38 @@ SIMPLE_JWT = {
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
+    "formatters": {
+        "request_metrics": {
+            "format": (
+                "%(message)s url_name=%(url_name)s "
+                "db_queries=%(db_queries)s db_time_ms=%(db_time_ms)s "
+                "cache_calls=%(cache_calls)s "
+                "cache_time_ms=%(cache_time_ms)s "
+                "duration_ms=%(duration_ms)s"
+            ),
+        },
+    },
     "handlers": {
         "console": {
             "class": "logging.StreamHandler",
         },
+        "request_metrics": {
+            "class": "logging.StreamHandler",
+            "formatter": "request_metrics",
+        },
     },
     "root": {
         "handlers": ["console"],
         "level": "WARNING",
     },
+    "loggers": {
+        # One record per request with its query and cache metrics
+        "common.middleware": {
+            "handlers": ["request_metrics"],
+            "level": os.environ.get("REQUEST_METRICS_LOG_LEVEL", "INFO"),
+            "propagate": False,
+        },
+    },
 }
 
 ENABLE_DEBUG_TOOLBAR = False
@@ -171,4 +239,67 @@ SERVER_ERROR_ERROR_MESSAGE = (
 )
 
 
-USER_BALANCE_CACHE_KEY_PREFIX = 'user_balance:'
\ No newline at end of file
+USER_BALANCE_CACHE_KEY_PREFIX = "user_balance:"
+
+USER_BALANCE_CACHE_TIMEOUT = int(
+    os.environ.get("USER_BALANCE_CACHE_TIMEOUT", 3600)
+)
+
+# 0 disables probabilistic early recomputation of cached balances
+USER_BALANCE_CACHE_EARLY_EXPIRATION_BETA = float(
+    os.environ.get("USER_BALANCE_CACHE_EARLY_EXPIRATION_BETA", 1.0)
+)
+
+USER_BALANCES_MAX_SIZE = int(os.environ.get("USER_BALANCES_MAX_SIZE", 1000))
+
+# Serve balance reads and transaction creation with native async views,
+# meant for ASGI workers
+ASYNC_VIEWS_ENABLED = (
+    os.environ.get("ASYNC_VIEWS_ENABLED", "false").lower() == "true"
+)
+
+# Reserve sender funds in Redis before writing a transaction
+USER_BALANCE_RESERVATIONS_ENABLED = (
+    os.environ.get("USER_BALANCE_RESERVATIONS_ENABLED", "false").lower()
+    == "true"
+)
+
+USER_BALANCE_RESERVATION_TIMEOUT = int(
+    os.environ.get("USER_BALANCE_RESERVATION_TIMEOUT", 30)
+)
+
+TRANSACTION_IDEMPOTENCY_CACHE_KEY_PREFIX = "transaction_idempotency:"
+
+TRANSACTION_IDEMPOTENCY_CACHE_TIMEOUT = int(
+    os.environ.get("TRANSACTION_IDEMPOTENCY_CACHE_TIMEOUT", 300)
+)
+
+TRANSACTION_BATCH_MAX_SIZE = int(
+    os.environ.get("TRANSACTION_BATCH_MAX_SIZE", 1000)
+)
+
+TRANSACTION_HISTORY_PAGE_SIZE = int(
+    os.environ.get("TRANSACTION_HISTORY_PAGE_SIZE", 50)
+)
+
+TRANSACTION_HISTORY_MAX_PAGE_SIZE = int(
+    os.environ.get("TRANSACTION_HISTORY_MAX_PAGE_SIZE", 200)
+)
+
+# Rows fetched per server-side cursor round trip when exporting statements
+TRANSACTION_EXPORT_CHUNK_SIZE = int(
+    os.environ.get("TRANSACTION_EXPORT_CHUNK_SIZE", 2000)
+)
+
+# Clients allowed to scrape /metrics: peers within these networks
+# (the direct peer, X-Forwarded-For is not trusted), or requests with
+# `Authorization: Bearer <METRICS_TOKEN>` when a token is set
+METRICS_ALLOWED_NETWORKS = [
+    network.strip()
+    for network in os.environ.get(
+        "METRICS_ALLOWED_NETWORKS", "127.0.0.0/8,::1/128"
+    ).split(",")
+    if network.strip()
+]
+
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
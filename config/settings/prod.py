@@ -3,7 +3,7 @@ import os
 import environ
 
 from config.settings.base import *
-from config.settings.base import BASE_DIR
+from config.settings.base import BASE_DIR, INSTALLED_APPS, REST_FRAMEWORK
 
 env = environ.Env()
 
@@ -11,7 +11,8 @@ env.read_env(os.path.join(BASE_DIR, ".env"))
 
 SECRET_KEY = env.str("SECRET_KEY")
 
-DEBUG = True
+# Debug mode keeps every executed query in memory
+DEBUG = env.bool("DEBUG", default=False)
 
 ALLOWED_HOSTS = env.list(
     "DJANGO_ALLOWED_HOSTS",
@@ -19,3 +20,43 @@ ALLOWED_HOSTS = env.list(
 )
 
 SWAGGER_ENABLED = False
+
+# Production only serves the token-authenticated JSON API, it needs
+# no admin, sessions, messages or CSRF protection
+INSTALLED_APPS = [
+    app
+    for app in INSTALLED_APPS
+    if app
+    not in [
+        "django.contrib.admin",
+        "django.contrib.sessions",
+        "django.contrib.messages",
+    ]
+]
+
+MIDDLEWARE = [
+    "common.middleware.RequestMetricsMiddleware",
+    "django.middleware.security.SecurityMiddleware",
+    "corsheaders.middleware.CorsMiddleware",
+    "django.middleware.common.CommonMiddleware",
+]
+
+# Templates are only rendered by error pages, the cached loader is used
+# as DEBUG is off
+TEMPLATES = [
+    {
+        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "DIRS": [os.path.join(BASE_DIR, "common/templates")],
+        "APP_DIRS": True,
+        "OPTIONS": {
+            "context_processors": [
+                "django.template.context_processors.request",
+            ],
+        },
+    },
+]
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    "DEFAULT_RENDERER_CLASSES": ("common.renderers.ORJSONRenderer",),
+}
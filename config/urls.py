@@ -5,6 +5,8 @@ from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
 from rest_framework import permissions
 
+from common.views import metrics_view
+
 schema_view = get_schema_view(
     openapi.Info(
         title="Scramble Transactions Test Task",
@@ -18,6 +20,7 @@ schema_view = get_schema_view(
 urlpatterns: list[URLResolver | URLPattern] = [
     path("", include("transactions.urls")),
     path("", include("users.urls")),
+    path("metrics", metrics_view, name="metrics"),
 ]
 
 if settings.ENABLE_DEBUG_TOOLBAR:
@@ -2,6 +2,11 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
+from common.utils.green import ensure_green_database_driver
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.dev")
 
 application = get_wsgi_application()
+
+# Refuse to serve from gevent workers that would run queries one at a time
+ensure_green_database_driver()
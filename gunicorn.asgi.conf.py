@@ -0,0 +1,37 @@
+# Native async workers for config.asgi, run with ASYNC_VIEWS_ENABLED=true:
+# gunicorn -c gunicorn.asgi.conf.py config.asgi
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+# Workers inherit it and share their metrics through it, otherwise
+# /metrics only shows the samples of the worker serving the scrape
+os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR",
+    os.path.join(tempfile.gettempdir(), "prometheus_multiproc"),
+)
+
+bind = "0.0.0.0:8000"
+
+timeout = 600
+
+log_level = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+access_logfile = "-"
+
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+
+def on_starting(server):
+    # Samples left by a previous run would be aggregated with the new ones
+    directory = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
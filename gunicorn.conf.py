@@ -1,15 +1,45 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+
 import gevent.monkey
 
+# Must run before Django and psycopg are imported, psycopg 3 then waits
+# on queries cooperatively; config.wsgi refuses to start otherwise
 gevent.monkey.patch_all()
 
+# Workers inherit it and share their metrics through it, otherwise
+# /metrics only shows the samples of the worker serving the scrape
+os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR",
+    os.path.join(tempfile.gettempdir(), "prometheus_multiproc"),
+)
+
 
 bind = "0.0.0.0:8000"
 
 timeout = 600
 
-log_level = "debug"
+log_level = os.environ.get("GUNICORN_LOG_LEVEL", "info")
 access_logfile = "-"
 
-workers = 2
+# A gevent worker already serves many requests at once,
+# one per core keeps every core busy
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count()))
 worker_class = "gevent"
-worker_connections = 1000
+# Also caps the database pool of a worker, see DB_POOL_MAX_SIZE
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 1000))
+
+
+def on_starting(server):
+    # Samples left by a previous run would be aggregated with the new ones
+    directory = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,6 +1,13 @@
+from django.conf import settings
 from rest_framework import serializers
 
-from transactions.models import Transaction, TransactionParticipant
+from common.utils.pagination import decode_keyset_cursor
+from transactions.dtos import TransactionBatchItemStatus
+from transactions.models import (
+    Transaction,
+    TransactionParticipant,
+    TransactionParticipantRole,
+)
 
 
 class TransactionParticipantInputSerializer(serializers.Serializer):
@@ -25,8 +32,23 @@ class TransactionCreateInputSerializer(serializers.Serializer):
                 "At least one receiver is required."
             )
 
+        if self._has_duplicated_users(data["senders"]):
+            raise serializers.ValidationError(
+                "Each sender can be listed only once."
+            )
+
+        if self._has_duplicated_users(data["receivers"]):
+            raise serializers.ValidationError(
+                "Each receiver can be listed only once."
+            )
+
         return data
 
+    @staticmethod
+    def _has_duplicated_users(participants: list[dict]) -> bool:
+        user_ids = [participant["user_id"] for participant in participants]
+        return len(user_ids) != len(set(user_ids))
+
 
 class TransactionParticipantOutputSerializer(serializers.ModelSerializer):
     class Meta:
@@ -35,7 +57,9 @@ class TransactionParticipantOutputSerializer(serializers.ModelSerializer):
 
 
 class TransactionOutputSerializer(serializers.ModelSerializer):
-    participants = TransactionParticipantOutputSerializer(many=True)
+    participants = TransactionParticipantOutputSerializer(
+        many=True, source="get_participants"
+    )
 
     class Meta:
         model = Transaction
@@ -46,3 +70,89 @@ class TransactionOutputSerializer(serializers.ModelSerializer):
             "participants",
             "created_at",
         ]
+
+
+class TransactionCreateOutputSerializer(TransactionOutputSerializer):
+    """
+    Expects `replayed` in the context: whether an earlier transaction
+    with the same id was returned instead of creating a new one.
+    """
+
+    replayed = serializers.SerializerMethodField()
+
+    class Meta(TransactionOutputSerializer.Meta):
+        fields = TransactionOutputSerializer.Meta.fields + ["replayed"]
+
+    def get_replayed(self, transaction: Transaction) -> bool:
+        return self.context.get("replayed", False)
+
+
+class TransactionBatchCreateInputSerializer(serializers.Serializer):
+    transactions = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+        max_length=settings.TRANSACTION_BATCH_MAX_SIZE,
+    )
+
+
+class TransactionBatchItemErrorSerializer(serializers.Serializer):
+    message = serializers.JSONField()
+    error_code = serializers.CharField()
+
+
+class TransactionBatchItemOutputSerializer(serializers.Serializer):
+    transaction_id = serializers.CharField()
+    status = serializers.ChoiceField(
+        choices=TransactionBatchItemStatus.choices
+    )
+    transaction = TransactionOutputSerializer(allow_null=True)
+    error = TransactionBatchItemErrorSerializer(allow_null=True)
+
+
+class UserTransactionHistoryQuerySerializer(serializers.Serializer):
+    cursor = serializers.CharField(required=False)
+    limit = serializers.IntegerField(
+        min_value=1,
+        max_value=settings.TRANSACTION_HISTORY_MAX_PAGE_SIZE,
+        default=settings.TRANSACTION_HISTORY_PAGE_SIZE,
+    )
+    role = serializers.ChoiceField(
+        choices=TransactionParticipantRole.choices, required=False
+    )
+    created_from = serializers.DateTimeField(required=False)
+    created_to = serializers.DateTimeField(required=False)
+
+    def validate_cursor(self, value):
+        try:
+            return decode_keyset_cursor(value)
+        except ValueError:
+            raise serializers.ValidationError("Invalid cursor.")
+
+
+class UserTransactionOutputSerializer(serializers.ModelSerializer):
+    external_id = serializers.CharField(source="transaction.external_id")
+    total_amount = serializers.IntegerField(source="transaction.total_amount")
+
+    class Meta:
+        model = TransactionParticipant
+        fields = [
+            "id",
+            "transaction_id",
+            "external_id",
+            "total_amount",
+            "role",
+            "share",
+            "share_amount",
+            "created_at",
+        ]
+
+
+class UserTransactionHistoryOutputSerializer(serializers.Serializer):
+    results = UserTransactionOutputSerializer(many=True)
+    next_cursor = serializers.CharField(allow_null=True)
+
+
+class UserTransactionExportQuerySerializer(serializers.Serializer):
+    file_format = serializers.ChoiceField(
+        choices=["csv", "ndjson"], default="csv"
+    )
@@ -1,17 +1,30 @@
 import json
+from datetime import timedelta
 from unittest.mock import patch
+from uuid import uuid4
 
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.test import APIRequestFactory, APITestCase
 
+from common.exceptions import BadRequestException
 from transactions.api.v1.serializers import TransactionOutputSerializer
+from transactions.api.v1.views import AsyncTransactionCreateAPIView
+from transactions.dtos import (
+    TransactionBatchItemResultDTO,
+    TransactionBatchItemStatus,
+    TransactionCreateResultDTO,
+)
+from transactions.exceptions import UserHasNotEnoughFundsException
 from transactions.models import (
     Transaction,
     TransactionParticipant,
     TransactionParticipantRole,
 )
-from users.models import User
+from users.models import User, UserBalance
 
 
 class TransactionAPITests(APITestCase):
@@ -42,7 +55,9 @@ class TransactionAPITests(APITestCase):
 
     @patch("transactions.api.v1.views.TransactionService.create")
     def test_create_transaction__success(self, mock_create_transaction):
-        mock_create_transaction.return_value = self.transaction
+        mock_create_transaction.return_value = TransactionCreateResultDTO(
+            transaction=self.transaction
+        )
 
         data = {
             "transaction_id": "external_id",
@@ -56,15 +71,36 @@ class TransactionAPITests(APITestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(
-            response.json(), TransactionOutputSerializer(self.transaction).data
+            response.json(),
+            {
+                **TransactionOutputSerializer(self.transaction).data,
+                "replayed": False,
+            },
+        )
+
+    @patch("transactions.api.v1.views.TransactionService.create")
+    def test_create_transaction__replayed(self, mock_create_transaction):
+        mock_create_transaction.return_value = TransactionCreateResultDTO(
+            transaction=self.transaction, replayed=True
+        )
+
+        data = {
+            "transaction_id": "external_id",
+            "total_amount": 1000,
+            "senders": [{"user_id": str(self.user_1.id), "share": 1}],
+            "receivers": [{"user_id": str(self.user_2.id), "share": 1}],
+        }
+        url = reverse("transaction-create")
+        response = self.client.post(
+            url, data=json.dumps(data), content_type="application/json"
         )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(response.json()["replayed"])
 
     @patch("transactions.api.v1.views.TransactionService.create")
     def test_create_transaction__raises_error__when_invalid_data(
         self, mock_create_transaction
     ):
-        mock_create_transaction.return_value = self.transaction
-
         data = {
             "transaction_id": "external_id",
             "total_amount": -1,
@@ -76,3 +112,341 @@ class TransactionAPITests(APITestCase):
             url, data=json.dumps(data), content_type="application/json"
         )
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_create_transaction__query_count_does_not_depend_on_participants(
+        self,
+    ):
+        UserBalance.objects.create(user=self.user_1, amount=100000)
+        url = reverse("transaction-create")
+
+        for receivers_count in (1, 10, 50):
+            with self.subTest(receivers_count=receivers_count):
+                cache.clear()
+                receivers = [
+                    User.objects.create(
+                        username=f"receiver_{receivers_count}_{i}",
+                        password="hashed_password",
+                    )
+                    for i in range(receivers_count)
+                ]
+                data = {
+                    "transaction_id": f"external_id_{receivers_count}",
+                    "total_amount": 1000,
+                    "senders": [{"user_id": str(self.user_1.id), "share": 1}],
+                    "receivers": [
+                        {"user_id": str(receiver.id), "share": 1}
+                        for receiver in receivers
+                    ],
+                }
+
+                with self.assertNumQueries(9):
+                    response = self.client.post(
+                        url,
+                        data=json.dumps(data),
+                        content_type="application/json",
+                    )
+
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                self.assertEqual(
+                    len(response.json()["participants"]), receivers_count + 1
+                )
+
+    def test_create_transaction__raises_error__when_duplicated_participant(
+        self,
+    ):
+        data = {
+            "transaction_id": "external_id",
+            "total_amount": 1000,
+            "senders": [
+                {"user_id": str(self.user_1.id), "share": 1},
+                {"user_id": str(self.user_1.id), "share": 2},
+            ],
+            "receivers": [{"user_id": str(self.user_2.id), "share": 1}],
+        }
+        url = reverse("transaction-create")
+        response = self.client.post(
+            url, data=json.dumps(data), content_type="application/json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @patch("transactions.api.v1.views.TransactionService.create_batch")
+    def test_create_transaction_batch__success(self, mock_create_batch):
+        mock_create_batch.return_value = [
+            TransactionBatchItemResultDTO(
+                transaction_id="external_id",
+                status=TransactionBatchItemStatus.EXISTING,
+                transaction=self.transaction,
+            ),
+            TransactionBatchItemResultDTO(
+                transaction_id="external_id_2",
+                status=TransactionBatchItemStatus.FAILED,
+                error=UserHasNotEnoughFundsException(),
+            ),
+        ]
+
+        transaction_data = {
+            "total_amount": 1000,
+            "senders": [{"user_id": str(self.user_1.id), "share": 1}],
+            "receivers": [{"user_id": str(self.user_2.id), "share": 1}],
+        }
+        data = {
+            "transactions": [
+                {"transaction_id": "external_id", **transaction_data},
+                {"transaction_id": "invalid", "total_amount": -1},
+                {"transaction_id": "external_id_2", **transaction_data},
+            ]
+        }
+        url = reverse("transaction-batch-create")
+        response = self.client.post(
+            url, data=json.dumps(data), content_type="application/json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()["results"]
+        self.assertEqual(
+            [result["status"] for result in results],
+            ["EXISTING", "FAILED", "FAILED"],
+        )
+        self.assertEqual(
+            results[0]["transaction"],
+            TransactionOutputSerializer(self.transaction).data,
+        )
+        self.assertEqual(results[1]["transaction_id"], "invalid")
+        self.assertEqual(
+            results[1]["error"]["error_code"],
+            BadRequestException.error_code,
+        )
+        self.assertEqual(
+            results[2]["error"]["error_code"],
+            UserHasNotEnoughFundsException.error_code,
+        )
+        self.assertEqual(len(mock_create_batch.call_args.args[0]), 2)
+
+    def test_create_transaction_batch__raises_error__when_empty(self):
+        url = reverse("transaction-batch-create")
+        response = self.client.post(
+            url,
+            data=json.dumps({"transactions": []}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncTransactionCreateAPITests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.sender = User.objects.create(
+            username="sender", password="hashed_password"
+        )
+        self.receiver = User.objects.create(
+            username="receiver", password="hashed_password"
+        )
+        UserBalance.objects.create(user=self.sender, amount=1000)
+        self.view = AsyncTransactionCreateAPIView.as_view()
+        self.factory = APIRequestFactory()
+        self.data = {
+            "transaction_id": "external_id",
+            "total_amount": 400,
+            "senders": [{"user_id": str(self.sender.id), "share": 1}],
+            "receivers": [{"user_id": str(self.receiver.id), "share": 1}],
+        }
+
+    def create_transaction(self, data):
+        request = self.factory.post(
+            "/api/v1/transactions/", data=data, format="json"
+        )
+        return async_to_sync(self.view)(request)
+
+    def test_create_transaction__success(self):
+        response = self.create_transaction(self.data)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(response.data["replayed"])
+        self.assertEqual(len(response.data["participants"]), 2)
+        self.assertEqual(UserBalance.objects.get(user=self.sender).amount, 600)
+
+        # Replayed from the idempotency cache
+        with self.assertNumQueries(0):
+            response = self.create_transaction(self.data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(response.data["replayed"])
+
+    def test_create_transaction__raises_error__when_not_enough_funds(self):
+        response = self.create_transaction({**self.data, "total_amount": 2000})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data["error_code"],
+            UserHasNotEnoughFundsException.error_code,
+        )
+
+
+class UserTransactionHistoryAPITests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username="username", password="hashed_password"
+        )
+        self.started_at = timezone.now()
+        self.participants = []
+        for index in range(5):
+            transaction = Transaction.objects.create(
+                external_id=f"external_id_{index}", total_amount=100
+            )
+            self.participants.append(
+                TransactionParticipant.objects.create(
+                    transaction=transaction,
+                    user=self.user,
+                    role=(
+                        TransactionParticipantRole.SENDER
+                        if index % 2
+                        else TransactionParticipantRole.RECEIVER
+                    ),
+                    share=1,
+                    share_amount=100,
+                    created_at=self.started_at + timedelta(minutes=index),
+                )
+            )
+        self.url = reverse(
+            "user-transaction-history", kwargs={"user_id": self.user.id}
+        )
+
+    def test_list_user_transactions__walks_pages_newest_first(self):
+        external_ids = []
+        params = {"limit": 2}
+        while True:
+            with self.assertNumQueries(2):
+                response = self.client.get(self.url, params)
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            body = response.json()
+            external_ids += [item["external_id"] for item in body["results"]]
+            if body["next_cursor"] is None:
+                break
+            params["cursor"] = body["next_cursor"]
+
+        self.assertEqual(
+            external_ids,
+            [f"external_id_{index}" for index in range(4, -1, -1)],
+        )
+
+    def test_list_user_transactions__filters_by_role_and_date_range(self):
+        response = self.client.get(
+            self.url,
+            {
+                "role": TransactionParticipantRole.RECEIVER,
+                "created_from": (
+                    self.started_at + timedelta(minutes=1)
+                ).isoformat(),
+                "created_to": (
+                    self.started_at + timedelta(minutes=4)
+                ).isoformat(),
+            },
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.json(),
+            {
+                "results": [
+                    {
+                        "id": str(self.participants[2].id),
+                        "transaction_id": str(
+                            self.participants[2].transaction_id
+                        ),
+                        "external_id": "external_id_2",
+                        "total_amount": 100,
+                        "role": TransactionParticipantRole.RECEIVER,
+                        "share": 1,
+                        "share_amount": 100,
+                        "created_at": self.participants[2]
+                        .created_at.isoformat()
+                        .replace("+00:00", "Z"),
+                    }
+                ],
+                "next_cursor": None,
+            },
+        )
+
+    def test_list_user_transactions__raises_error__when_invalid_cursor(self):
+        response = self.client.get(self.url, {"cursor": "invalid"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_user_transactions__raises_error__when_user_not_found(self):
+        response = self.client.get(
+            reverse("user-transaction-history", kwargs={"user_id": uuid4()})
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class UserTransactionExportAPITests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username="username", password="hashed_password"
+        )
+        started_at = timezone.now()
+        for index, (role, amount) in enumerate(
+            [
+                (TransactionParticipantRole.RECEIVER, 1000),
+                (TransactionParticipantRole.SENDER, 300),
+                (TransactionParticipantRole.RECEIVER, 50),
+            ]
+        ):
+            transaction = Transaction.objects.create(
+                external_id=f"external_id_{index}", total_amount=amount
+            )
+            TransactionParticipant.objects.create(
+                transaction=transaction,
+                user=self.user,
+                role=role,
+                share=1,
+                share_amount=amount,
+                created_at=started_at + timedelta(minutes=index),
+            )
+        self.url = reverse(
+            "user-transaction-export", kwargs={"user_id": self.user.id}
+        )
+
+    def test_export_user_transactions__csv(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            lines[0],
+            "created_at,transaction_id,external_id,total_amount,role,"
+            "amount,balance",
+        )
+        self.assertEqual(
+            [line.rsplit(",", 3)[1:] for line in lines[1:]],
+            [
+                ["RECEIVER", "1000", "1000"],
+                ["SENDER", "-300", "700"],
+                ["RECEIVER", "50", "750"],
+            ],
+        )
+
+    def test_export_user_transactions__ndjson(self):
+        response = self.client.get(self.url, {"file_format": "ndjson"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual(
+            [row["external_id"] for row in rows],
+            ["external_id_0", "external_id_1", "external_id_2"],
+        )
+        self.assertEqual([row["balance"] for row in rows], [1000, 700, 750])
+
+    def test_export_user_transactions__raises_error__when_user_not_found(
+        self,
+    ):
+        response = self.client.get(
+            reverse("user-transaction-export", kwargs={"user_id": uuid4()})
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
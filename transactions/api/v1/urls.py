@@ -1,11 +1,33 @@
+from django.conf import settings
 from django.urls import path
 
 from transactions.api.v1 import views
 
+# Native async views, for ASGI deployments
+if settings.ASYNC_VIEWS_ENABLED:
+    transaction_create_view = views.AsyncTransactionCreateAPIView.as_view()
+else:
+    transaction_create_view = views.TransactionCreateAPIView.as_view()
+
 urlpatterns = [
     path(
         "api/v1/transactions/",
-        views.TransactionCreateAPIView.as_view(),
+        transaction_create_view,
         name="transaction-create",
     ),
+    path(
+        "api/v1/transactions/batch/",
+        views.TransactionBatchCreateAPIView.as_view(),
+        name="transaction-batch-create",
+    ),
+    path(
+        "api/v1/users/<uuid:user_id>/transactions/",
+        views.UserTransactionHistoryAPIView.as_view(),
+        name="user-transaction-history",
+    ),
+    path(
+        "api/v1/users/<uuid:user_id>/transactions/export/",
+        views.UserTransactionExportAPIView.as_view(),
+        name="user-transaction-export",
+    ),
 ]
@@ -1,21 +1,36 @@
+from uuid import UUID
+
+from adrf.views import APIView as AsyncAPIView
+from django.http import StreamingHttpResponse
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from common.exceptions import BadRequestException
 from common.typing import HttpRequestWithData
 from common.utils.api import (
     get_exception_response,
     get_response,
     is_serializer_valid,
 )
+from common.utils.export import stream_csv, stream_ndjson
+from common.utils.pagination import encode_keyset_cursor
 from transactions.api.v1.serializers import (
+    TransactionBatchCreateInputSerializer,
+    TransactionBatchItemOutputSerializer,
     TransactionCreateInputSerializer,
-    TransactionOutputSerializer,
+    TransactionCreateOutputSerializer,
+    UserTransactionExportQuerySerializer,
+    UserTransactionHistoryOutputSerializer,
+    UserTransactionHistoryQuerySerializer,
 )
 from transactions.dtos import (
+    TransactionBatchItemResultDTO,
+    TransactionBatchItemStatus,
     TransactionCreateDTO,
+    TransactionHistoryQueryDTO,
     TransactionParticipantCreateDTO,
 )
 from transactions.models import TransactionParticipantRole
@@ -24,7 +39,7 @@ from transactions.services import TransactionService
 
 class TransactionCreateAPIView(APIView):
     input_serializer_class = TransactionCreateInputSerializer
-    output_serializer_class = TransactionOutputSerializer
+    output_serializer_class = TransactionCreateOutputSerializer
 
     @swagger_auto_schema(
         tags=["transactions"],
@@ -44,29 +59,235 @@ class TransactionCreateAPIView(APIView):
         if error := is_serializer_valid(serializer):
             return error
 
-        incoming_data = serializer.validated_data
-        senders = incoming_data.pop("senders", [])
-        receivers = incoming_data.pop("receivers", [])
-        data = TransactionCreateDTO(
-            **incoming_data,
-            senders=[
-                TransactionParticipantCreateDTO(
-                    role=TransactionParticipantRole.SENDER, **sender
-                )
-                for sender in senders
-            ],
-            receivers=[
-                TransactionParticipantCreateDTO(
-                    role=TransactionParticipantRole.RECEIVER, **receiver
+        data = build_transaction_create_dto(serializer.validated_data)
+        service = TransactionService()
+        try:
+            result = service.create(data)
+            return get_response(
+                self.output_serializer_class(
+                    result.transaction, context={"replayed": result.replayed}
+                ).data,
+                201,
+            )
+        except Exception as error:
+            return get_exception_response(error)
+
+
+class AsyncTransactionCreateAPIView(AsyncAPIView):
+    input_serializer_class = TransactionCreateInputSerializer
+    output_serializer_class = TransactionCreateOutputSerializer
+
+    @swagger_auto_schema(
+        tags=["transactions"],
+        operation_id="Create a transaction",
+        request_body=input_serializer_class,
+        responses={
+            status.HTTP_201_CREATED: openapi.Response(
+                "Transaction is successfully created", output_serializer_class
+            ),
+            status.HTTP_400_BAD_REQUEST: openapi.Response(
+                "The request validation has failed"
+            ),
+        },
+    )
+    async def post(self, request: HttpRequestWithData) -> Response:
+        serializer = self.input_serializer_class(data=request.data)
+        if error := is_serializer_valid(serializer):
+            return error
+
+        data = build_transaction_create_dto(serializer.validated_data)
+        service = TransactionService()
+        try:
+            result = await service.acreate(data)
+            # Participants are cached on the transaction, serializing it
+            # does not query the database
+            return get_response(
+                self.output_serializer_class(
+                    result.transaction, context={"replayed": result.replayed}
+                ).data,
+                201,
+            )
+        except Exception as error:
+            return get_exception_response(error)
+
+
+class TransactionBatchCreateAPIView(APIView):
+    input_serializer_class = TransactionBatchCreateInputSerializer
+    item_serializer_class = TransactionCreateInputSerializer
+    output_serializer_class = TransactionBatchItemOutputSerializer
+
+    @swagger_auto_schema(
+        tags=["transactions"],
+        operation_id="Create a batch of transactions",
+        request_body=input_serializer_class,
+        responses={
+            status.HTTP_200_OK: openapi.Response(
+                "Status of every transaction in the batch",
+                output_serializer_class(many=True),
+            ),
+            status.HTTP_400_BAD_REQUEST: openapi.Response(
+                "The request validation has failed"
+            ),
+        },
+    )
+    def post(self, request: HttpRequestWithData) -> Response:
+        serializer = self.input_serializer_class(data=request.data)
+        if error := is_serializer_valid(serializer):
+            return error
+
+        results: list[TransactionBatchItemResultDTO | None] = []
+        items: list[TransactionCreateDTO] = []
+        for raw_item in serializer.validated_data["transactions"]:
+            item_serializer = self.item_serializer_class(data=raw_item)
+            if not item_serializer.is_valid():
+                results.append(
+                    TransactionBatchItemResultDTO(
+                        transaction_id=str(raw_item.get("transaction_id", "")),
+                        status=TransactionBatchItemStatus.FAILED,
+                        error=BadRequestException(item_serializer.errors),
+                    )
                 )
-                for receiver in receivers
-            ],
+                continue
+
+            items.append(
+                build_transaction_create_dto(item_serializer.validated_data)
+            )
+            results.append(None)
+
+        service = TransactionService()
+        try:
+            created = iter(service.create_batch(items))
+            results = [
+                result if result is not None else next(created)
+                for result in results
+            ]
+            return get_response(
+                {
+                    "results": self.output_serializer_class(
+                        results, many=True
+                    ).data
+                },
+                200,
+            )
+        except Exception as error:
+            return get_exception_response(error)
+
+
+class UserTransactionHistoryAPIView(APIView):
+    query_serializer_class = UserTransactionHistoryQuerySerializer
+    output_serializer_class = UserTransactionHistoryOutputSerializer
+
+    @swagger_auto_schema(
+        tags=["transactions"],
+        operation_id="List user transactions",
+        query_serializer=query_serializer_class,
+        responses={
+            status.HTTP_200_OK: openapi.Response(
+                "A page of the user's transactions, newest first",
+                output_serializer_class,
+            ),
+            status.HTTP_400_BAD_REQUEST: openapi.Response(
+                "The request validation has failed"
+            ),
+            status.HTTP_404_NOT_FOUND: openapi.Response("User not found"),
+        },
+    )
+    def get(self, request: HttpRequestWithData, user_id: UUID) -> Response:
+        serializer = self.query_serializer_class(data=request.query_params)
+        if error := is_serializer_valid(serializer):
+            return error
+
+        query = TransactionHistoryQueryDTO(
+            user_id=user_id,
+            limit=serializer.validated_data["limit"],
+            role=serializer.validated_data.get("role"),
+            created_from=serializer.validated_data.get("created_from"),
+            created_to=serializer.validated_data.get("created_to"),
+            after=serializer.validated_data.get("cursor"),
         )
         service = TransactionService()
         try:
-            transaction = service.create(data)
+            page = service.get_user_history(query)
+            last = page.participants[-1] if page.has_next else None
             return get_response(
-                self.output_serializer_class(transaction).data, 201
+                self.output_serializer_class(
+                    {
+                        "results": page.participants,
+                        "next_cursor": (
+                            encode_keyset_cursor(last.created_at, last.id)
+                            if last
+                            else None
+                        ),
+                    }
+                ).data,
+                200,
             )
         except Exception as error:
             return get_exception_response(error)
+
+
+class UserTransactionExportAPIView(APIView):
+    query_serializer_class = UserTransactionExportQuerySerializer
+
+    @swagger_auto_schema(
+        tags=["transactions"],
+        operation_id="Export user statement",
+        query_serializer=query_serializer_class,
+        responses={
+            status.HTTP_200_OK: openapi.Response(
+                "The user's full statement with a running balance, "
+                "streamed as CSV or NDJSON"
+            ),
+            status.HTTP_400_BAD_REQUEST: openapi.Response(
+                "The request validation has failed"
+            ),
+            status.HTTP_404_NOT_FOUND: openapi.Response("User not found"),
+        },
+    )
+    def get(
+        self, request: HttpRequestWithData, user_id: UUID
+    ) -> StreamingHttpResponse | Response:
+        serializer = self.query_serializer_class(data=request.query_params)
+        if error := is_serializer_valid(serializer):
+            return error
+
+        file_format = serializer.validated_data["file_format"]
+        service = TransactionService()
+        try:
+            rows = service.get_user_statement(user_id)
+        except Exception as error:
+            return get_exception_response(error)
+
+        if file_format == "csv":
+            response = StreamingHttpResponse(
+                stream_csv(rows, service.STATEMENT_FIELDS),
+                content_type="text/csv",
+            )
+        else:
+            response = StreamingHttpResponse(
+                stream_ndjson(rows), content_type="application/x-ndjson"
+            )
+        response["Content-Disposition"] = (
+            f'attachment; filename="statement-{user_id}.{file_format}"'
+        )
+        return response
+
+
+def build_transaction_create_dto(incoming_data: dict) -> TransactionCreateDTO:
+    senders = incoming_data.pop("senders", [])
+    receivers = incoming_data.pop("receivers", [])
+    return TransactionCreateDTO(
+        **incoming_data,
+        senders=[
+            TransactionParticipantCreateDTO(
+                role=TransactionParticipantRole.SENDER, **sender
+            )
+            for sender in senders
+        ],
+        receivers=[
+            TransactionParticipantCreateDTO(
+                role=TransactionParticipantRole.RECEIVER, **receiver
+            )
+            for receiver in receivers
+        ],
+    )
@@ -1,7 +1,12 @@
+from datetime import datetime
 from typing import List
 from uuid import UUID
 
-from pydantic import BaseModel
+from django.db import models
+from pydantic import BaseModel, ConfigDict
+
+from common.exceptions import RootException
+from transactions.models import Transaction, TransactionParticipant
 
 
 class TransactionParticipantCreateDTO(BaseModel):
@@ -16,3 +21,64 @@ class TransactionCreateDTO(BaseModel):
     total_amount: int
     senders: List[TransactionParticipantCreateDTO]
     receivers: List[TransactionParticipantCreateDTO]
+
+
+class TransactionCreateResultDTO(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    transaction: Transaction
+    replayed: bool = False
+
+
+class TransactionParticipantCacheDTO(BaseModel):
+    id: UUID
+    user_id: UUID
+    role: str
+    share: int
+    share_amount: int
+
+
+class TransactionCacheDTO(BaseModel):
+    """
+    A processed transaction as kept in the idempotency cache; bump
+    `TransactionService.IDEMPOTENCY_CACHE_VERSION` when it changes.
+    """
+
+    id: UUID
+    external_id: str
+    total_amount: int
+    created_at: datetime
+    updated_at: datetime
+    participants: List[TransactionParticipantCacheDTO]
+
+
+class TransactionBatchItemStatus(models.TextChoices):
+    CREATED = "CREATED", "Created"
+    EXISTING = "EXISTING", "Existing"
+    FAILED = "FAILED", "Failed"
+
+
+class TransactionBatchItemResultDTO(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    transaction_id: str
+    status: TransactionBatchItemStatus
+    transaction: Transaction | None = None
+    error: RootException | None = None
+
+
+class TransactionHistoryQueryDTO(BaseModel):
+    user_id: UUID
+    limit: int
+    role: str | None = None
+    created_from: datetime | None = None
+    created_to: datetime | None = None
+    # `(created_at, id)` of the last participation of the previous page
+    after: tuple[datetime, UUID] | None = None
+
+
+class TransactionHistoryPageDTO(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    participants: List[TransactionParticipant]
+    has_next: bool
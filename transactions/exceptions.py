@@ -11,3 +11,8 @@ class UserHasNotEnoughFundsException(BadRequestException):
 class TransactionAmountTooSmallException(BadRequestException):
     default_message = "Transaction total amount is too small to distribute"
     error_code = "TransactionAmountTooSmallError"
+
+
+class TransactionConflictException(BadRequestException):
+    default_message = "Transaction conflicts with an existing one"
+    error_code = "TransactionConflictError"
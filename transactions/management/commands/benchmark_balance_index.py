@@ -0,0 +1,224 @@
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from transactions.models import Transaction, TransactionParticipant
+from transactions.selectors import TransactionSelector
+from users.models import User
+
+INDEX_NAME = "participant_balance_idx"
+BENCHMARK_USERNAME_PREFIX = "bench_"
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark balance recompute latency over the full history with "
+        "the covering participant index and with only the history index "
+        "(user, created_at, id) left, and the snapshot roll-forward for "
+        "reference. The covering index is dropped and rebuilt "
+        "concurrently. Seeded rows are not reflected in UserBalance, "
+        "run it against a dedicated PostgreSQL database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed-participants",
+            type=int,
+            default=0,
+            help="Seed this many participants before benchmarking",
+        )
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=10000,
+            help="Number of benchmark users the participants are spread on",
+        )
+        parser.add_argument(
+            "--samples",
+            type=int,
+            default=200,
+            help="Number of balance recomputes measured per run",
+        )
+        parser.add_argument(
+            "--snapshot-age-hours",
+            type=int,
+            default=24,
+            help=(
+                "Age of the snapshot balances are rolled forward from, "
+                "a day for the daily snapshots"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("The benchmark requires PostgreSQL")
+
+        if options["seed_participants"]:
+            self._seed(options["users"], options["seed_participants"])
+
+        with connection.cursor() as cursor:
+            # Index-only scans rely on an up-to-date visibility map
+            cursor.execute(
+                f"VACUUM ANALYZE {TransactionParticipant._meta.db_table}"
+            )
+
+        user_ids = list(
+            User.objects.filter(username__startswith=BENCHMARK_USERNAME_PREFIX)
+            .order_by("?")
+            .values_list("id", flat=True)[: options["samples"]]
+        )
+        if not user_ids:
+            raise CommandError(
+                "No benchmark users found, run with --seed-participants"
+            )
+
+        snapshot_taken_at = timezone.now() - timedelta(
+            hours=options["snapshot_age_hours"]
+        )
+        self._report(
+            "full history, covering index",
+            self._measure(user_ids, created_from=None),
+        )
+        # Filters on created_at, which the covering index does not hold:
+        # it is served by the history index with or without it
+        self._report(
+            "snapshot roll-forward, history index",
+            self._measure(user_ids, created_from=snapshot_taken_at),
+        )
+
+        # Dropped and rebuilt concurrently rather than inside a rolled
+        # back transaction, which would hold an ACCESS EXCLUSIVE lock on
+        # the table for the whole measurement
+        index = next(
+            index
+            for index in TransactionParticipant._meta.indexes
+            if index.name == INDEX_NAME
+        )
+        with connection.schema_editor(atomic=False) as schema_editor:
+            schema_editor.execute(
+                index.remove_sql(
+                    TransactionParticipant, schema_editor, concurrently=True
+                )
+            )
+        try:
+            # participant_history_idx still leads on the user, this is
+            # the covering index against it rather than against none
+            self._report(
+                "full history, history index only",
+                self._measure(user_ids, created_from=None),
+            )
+        finally:
+            self.stdout.write(f"Rebuilding {INDEX_NAME}")
+            with connection.schema_editor(atomic=False) as schema_editor:
+                schema_editor.execute(
+                    index.create_sql(
+                        TransactionParticipant,
+                        schema_editor,
+                        concurrently=True,
+                    )
+                )
+
+    def _seed(self, users_count: int, participants_count: int) -> None:
+        user_table = User._meta.db_table
+        transaction_table = Transaction._meta.db_table
+        participant_table = TransactionParticipant._meta.db_table
+        run_id = uuid.uuid4().hex[:8]
+        # Every seeded transaction has one sender and one receiver
+        transactions_count = participants_count // 2
+        chunk_size = 500_000
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {user_table} (
+                    id, password, is_superuser, username, first_name,
+                    last_name, email, is_staff, is_active, date_joined,
+                    created_at, updated_at
+                )
+                SELECT
+                    gen_random_uuid(), '', false, %s::text || i, '', '', '',
+                    false, true, now(), now(), now()
+                FROM generate_series(1, %s) AS i
+                ON CONFLICT (username) DO NOTHING
+                """,
+                [BENCHMARK_USERNAME_PREFIX, users_count],
+            )
+
+            for start in range(0, transactions_count, chunk_size):
+                stop = min(start + chunk_size, transactions_count)
+                cursor.execute(
+                    f"""
+                    WITH new_transactions AS (
+                        INSERT INTO {transaction_table} (
+                            id, external_id, total_amount,
+                            created_at, updated_at
+                        )
+                        SELECT
+                            gen_random_uuid(), %s::text || i,
+                            1 + floor(random() * 10000)::bigint,
+                            now() - random() * interval '365 days', now()
+                        FROM generate_series(%s, %s) AS i
+                        RETURNING id, total_amount, created_at
+                    ),
+                    benchmark_users AS (
+                        SELECT array_agg(id) AS ids
+                        FROM {user_table}
+                        WHERE username LIKE %s
+                    )
+                    INSERT INTO {participant_table} (
+                        id, transaction_id, user_id, role, share,
+                        share_amount, created_at, updated_at
+                    )
+                    SELECT
+                        gen_random_uuid(), t.id,
+                        u.ids[
+                            1 + floor(random() * array_length(u.ids, 1))::int
+                        ],
+                        r.role, 1, t.total_amount, t.created_at, t.created_at
+                    FROM new_transactions AS t
+                    CROSS JOIN benchmark_users AS u
+                    CROSS JOIN (
+                        VALUES ('SENDER'), ('RECEIVER')
+                    ) AS r(role)
+                    """,
+                    [
+                        f"{BENCHMARK_USERNAME_PREFIX}{run_id}_",
+                        start + 1,
+                        stop,
+                        f"{BENCHMARK_USERNAME_PREFIX}%",
+                    ],
+                )
+                self.stdout.write(
+                    f"Seeded {stop * 2} of {transactions_count * 2} "
+                    "participants"
+                )
+
+    def _measure(
+        self, user_ids: list, created_from: datetime | None
+    ) -> list[float]:
+        """
+        Durations in milliseconds of the balance aggregate of every user,
+        over the participations created since `created_from`.
+        """
+        durations = []
+        for user_id in user_ids:
+            started_at = time.perf_counter()
+            TransactionSelector.get_users_total_amounts(
+                [user_id], created_from=created_from
+            )
+            durations.append((time.perf_counter() - started_at) * 1000)
+
+        return durations
+
+    def _report(self, label: str, durations: list[float]) -> None:
+        percentiles = statistics.quantiles(durations, n=100)
+        self.stdout.write(
+            f"{label}: mean={statistics.mean(durations):.2f}ms "
+            f"p50={percentiles[49]:.2f}ms p95={percentiles[94]:.2f}ms "
+            f"p99={percentiles[98]:.2f}ms ({len(durations)} samples)"
+        )
@@ -0,0 +1,112 @@
+import statistics
+import time
+import uuid
+from io import BytesIO
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from common.parsers import ORJSONParser
+from common.renderers import ORJSONRenderer
+from transactions.api.v1.serializers import TransactionOutputSerializer
+from transactions.models import (
+    Transaction,
+    TransactionParticipant,
+    TransactionParticipantRole,
+)
+
+
+def build_transaction(participants_count: int) -> Transaction:
+    """
+    Unsaved transaction with its participants attached in memory,
+    senders and receivers alternate.
+    """
+    now = timezone.now()
+    transaction = Transaction(
+        id=uuid.uuid4(),
+        external_id=f"benchmark-{uuid.uuid4().hex}",
+        total_amount=participants_count * 1000,
+        created_at=now,
+        updated_at=now,
+    )
+    participants = [
+        TransactionParticipant(
+            id=uuid.uuid4(),
+            transaction=transaction,
+            user_id=uuid.uuid4(),
+            role=(
+                TransactionParticipantRole.SENDER
+                if i % 2
+                else TransactionParticipantRole.RECEIVER
+            ),
+            share=1,
+            share_amount=1000,
+        )
+        for i in range(participants_count)
+    ]
+    transaction.participant_list = participants
+    return transaction
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark rendering and parsing TransactionOutputSerializer "
+        "payloads with DRF's stdlib JSON renderer and parser "
+        "against the orjson ones"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--participants",
+            type=int,
+            nargs="+",
+            default=[10, 100, 1000],
+            help="Participants per transaction payload",
+        )
+        parser.add_argument(
+            "--samples",
+            type=int,
+            default=500,
+            help="Number of renders and parses measured per payload",
+        )
+
+    def handle(self, *args, **options):
+        for participants_count in options["participants"]:
+            data = TransactionOutputSerializer(
+                build_transaction(participants_count)
+            ).data
+
+            for label, renderer, parser in [
+                ("stdlib", JSONRenderer(), JSONParser()),
+                ("orjson", ORJSONRenderer(), ORJSONParser()),
+            ]:
+                content = renderer.render(data)
+                render_durations = self._measure(
+                    lambda: renderer.render(data), options["samples"]
+                )
+                parse_durations = self._measure(
+                    lambda: parser.parse(BytesIO(content)),
+                    options["samples"],
+                )
+                self.stdout.write(
+                    f"{participants_count} participants, {label} "
+                    f"({len(content)} bytes): "
+                    f"render p50={self._median(render_durations)} "
+                    f"parse p50={self._median(parse_durations)}"
+                )
+
+    @staticmethod
+    def _measure(function, samples: int) -> list[float]:
+        durations = []
+        for _ in range(samples):
+            started_at = time.perf_counter()
+            function()
+            durations.append((time.perf_counter() - started_at) * 1000)
+
+        return durations
+
+    @staticmethod
+    def _median(durations: list[float]) -> str:
+        return f"{statistics.median(durations):.3f}ms"
@@ -0,0 +1,292 @@
+import json
+import platform
+import statistics
+import time
+import uuid
+from typing import Any, Callable
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from common.renderers import ORJSONRenderer
+from transactions.api.v1.serializers import (
+    TransactionCreateInputSerializer,
+    TransactionOutputSerializer,
+)
+from transactions.api.v1.views import build_transaction_create_dto
+from transactions.dtos import TransactionParticipantCreateDTO
+from transactions.management.commands.benchmark_json_rendering import (
+    build_transaction,
+)
+from transactions.models import (
+    Transaction,
+    TransactionParticipant,
+    TransactionParticipantRole,
+)
+from transactions.services import TransactionService
+from users.models import User
+from users.services import UserBalanceService
+
+
+class Command(BaseCommand):
+    help = (
+        "Microbenchmark the service layer hot paths: share calculation, "
+        "transaction DTO construction, output rendering and cached "
+        "balance reads, per participant count. Save the results with "
+        "--output to compare them between commits. Balance reads write "
+        "rows that are rolled back, use a dedicated database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--participants",
+            type=int,
+            nargs="+",
+            default=[1, 10, 100, 1000],
+            help=(
+                "Senders and receivers each of the transactions, and "
+                "participations of the user whose balance is read"
+            ),
+        )
+        parser.add_argument(
+            "--samples",
+            type=int,
+            default=200,
+            help="Number of calls measured per benchmark",
+        )
+        parser.add_argument(
+            "--output",
+            help="Path of the JSON file the results are written to",
+        )
+        parser.add_argument(
+            "--label",
+            default="",
+            help="Saved with the results, e.g. the commit under test",
+        )
+
+    def handle(self, *args, **options):
+        if options["samples"] < 2:
+            raise CommandError("At least two samples are required")
+
+        results = []
+        for participants_count in options["participants"]:
+            for name, durations in self._run(
+                participants_count, options["samples"]
+            ):
+                result = self._summarize(name, participants_count, durations)
+                results.append(result)
+                self.stdout.write(
+                    f"{name} x{participants_count}: "
+                    f"p50={result['p50_us']:.1f}us "
+                    f"p95={result['p95_us']:.1f}us "
+                    f"p99={result['p99_us']:.1f}us"
+                )
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(
+                    {
+                        "label": options["label"],
+                        "created_at": timezone.now().isoformat(),
+                        "python": platform.python_version(),
+                        "settings": settings.SETTINGS_MODULE,
+                        "samples": options["samples"],
+                        "results": results,
+                    },
+                    output,
+                    indent=2,
+                )
+            self.stdout.write(
+                self.style.SUCCESS(f"Results written to {options['output']}")
+            )
+
+    def _run(
+        self, participants_count: int, samples: int
+    ) -> list[tuple[str, list[float]]]:
+        service = TransactionService()
+        total_amount = participants_count * 1000
+        senders = self._build_participants(
+            participants_count, TransactionParticipantRole.SENDER
+        )
+        receivers = self._build_participants(
+            participants_count, TransactionParticipantRole.RECEIVER
+        )
+
+        payload = {
+            "transaction_id": f"benchmark-{uuid.uuid4().hex}",
+            "total_amount": total_amount,
+            "senders": [
+                {"user_id": str(sender.user_id), "share": sender.share}
+                for sender in senders
+            ],
+            "receivers": [
+                {"user_id": str(receiver.user_id), "share": receiver.share}
+                for receiver in receivers
+            ],
+        }
+        serializer = TransactionCreateInputSerializer(data=payload)
+        serializer.is_valid(raise_exception=True)
+        validated_data = serializer.validated_data
+
+        transaction = build_transaction(participants_count * 2)
+        renderer = ORJSONRenderer()
+
+        return [
+            (
+                "senders_share_amount",
+                self._measure(
+                    lambda: service._calculate_senders_share_amount(
+                        senders, total_amount
+                    ),
+                    samples,
+                ),
+            ),
+            (
+                "receivers_share_amount",
+                self._measure(
+                    lambda: service._calculate_receivers_share_amount(
+                        receivers, total_amount
+                    ),
+                    samples,
+                ),
+            ),
+            (
+                "input_validation",
+                self._measure(
+                    lambda: TransactionCreateInputSerializer(
+                        data=payload
+                    ).is_valid(),
+                    samples,
+                ),
+            ),
+            (
+                "dto_construction",
+                self._measure(
+                    build_transaction_create_dto,
+                    samples,
+                    # The top level is popped from, pass a copy
+                    setup=lambda: dict(validated_data),
+                ),
+            ),
+            (
+                "output_rendering",
+                self._measure(
+                    lambda: renderer.render(
+                        TransactionOutputSerializer(transaction).data
+                    ),
+                    samples,
+                ),
+            ),
+            *self._measure_balance_reads(participants_count, samples),
+        ]
+
+    def _measure_balance_reads(
+        self, participations_count: int, samples: int
+    ) -> list[tuple[str, list[float]]]:
+        """
+        Balance reads of a user seeded with the given participations,
+        the seeded rows are rolled back.
+        """
+        service = UserBalanceService()
+        with db_transaction.atomic():
+            user_id = self._seed_user(participations_count)
+            service.rebuild([user_id])
+
+            def evict() -> uuid.UUID:
+                service.clear_cache([user_id])
+                return user_id
+
+            miss = self._measure(service.get, samples, setup=evict)
+            service.get(user_id)
+            hit = self._measure(lambda: service.get(user_id), samples)
+
+            service.clear_cache([user_id])
+            db_transaction.set_rollback(True)
+
+        return [("balance_cache_miss", miss), ("balance_cache_hit", hit)]
+
+    @staticmethod
+    def _seed_user(participations_count: int) -> uuid.UUID:
+        """
+        User receiving `participations_count` transfers of 1000.
+        """
+        run_id = uuid.uuid4().hex
+        user, sender = User.objects.bulk_create(
+            [
+                User(username=f"benchmark_{run_id}", password="!"),
+                User(username=f"benchmark_{run_id}_sender", password="!"),
+            ]
+        )
+        transactions = Transaction.objects.bulk_create(
+            [
+                Transaction(
+                    external_id=f"benchmark-{run_id}-{i}", total_amount=1000
+                )
+                for i in range(participations_count)
+            ]
+        )
+        TransactionParticipant.objects.bulk_create(
+            [
+                TransactionParticipant(
+                    transaction=transaction,
+                    user=participant,
+                    role=role,
+                    share=1,
+                    share_amount=1000,
+                )
+                for transaction in transactions
+                for participant, role in [
+                    (sender, TransactionParticipantRole.SENDER),
+                    (user, TransactionParticipantRole.RECEIVER),
+                ]
+            ]
+        )
+        return user.id
+
+    @staticmethod
+    def _build_participants(
+        participants_count: int, role: str
+    ) -> list[TransactionParticipantCreateDTO]:
+        return [
+            TransactionParticipantCreateDTO(
+                user_id=uuid.uuid4(), role=role, share=i % 10 + 1
+            )
+            for i in range(participants_count)
+        ]
+
+    @staticmethod
+    def _measure(
+        function: Callable[..., Any],
+        samples: int,
+        setup: Callable[[], Any] | None = None,
+    ) -> list[float]:
+        """
+        Durations of the calls in microseconds; `setup` runs untimed
+        before every call and its result is passed to the function.
+        """
+        durations = []
+        for _ in range(samples):
+            args = (setup(),) if setup else ()
+            started_at = time.perf_counter()
+            function(*args)
+            durations.append((time.perf_counter() - started_at) * 1_000_000)
+
+        return durations
+
+    @staticmethod
+    def _summarize(
+        name: str, participants_count: int, durations: list[float]
+    ) -> dict[str, Any]:
+        percentiles = statistics.quantiles(durations, n=100)
+        return {
+            "benchmark": name,
+            "participants": participants_count,
+            "samples": len(durations),
+            "min_us": round(min(durations), 3),
+            "mean_us": round(statistics.mean(durations), 3),
+            "p50_us": round(percentiles[49], 3),
+            "p95_us": round(percentiles[94], 3),
+            "p99_us": round(percentiles[98], 3),
+        }
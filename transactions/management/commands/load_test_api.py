@@ -0,0 +1,246 @@
+import json
+import random
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.models import User
+
+SCENARIOS = ["balance", "transaction-create", "mixed"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire concurrent balance reads, transaction creations or a mix "
+        "of both at a running server and report its latency and "
+        "throughput per endpoint. Run it "
+        "against the gevent (config.wsgi) and the uvicorn (config.asgi) "
+        "deployments to compare them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--base-url",
+            default="http://localhost:8000",
+            help="Root URL of the server under test",
+        )
+        parser.add_argument(
+            "--scenario",
+            choices=SCENARIOS,
+            default="balance",
+            help="Endpoint under test",
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=2000,
+            help="Total number of requests sent",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            nargs="+",
+            default=[100],
+            help=(
+                "Number of clients sending requests at the same time, "
+                "several levels are measured one after another"
+            ),
+        )
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=1000,
+            help="Number of existing users the requests are spread on",
+        )
+        parser.add_argument(
+            "--username-prefix",
+            default="",
+            help=(
+                "Spread the requests on users whose username starts with "
+                "it, e.g. the ones of seed_load_test_data"
+            ),
+        )
+        parser.add_argument(
+            "--write-ratio",
+            type=float,
+            default=0.2,
+            help="Share of transaction creations in the mixed scenario",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help=(
+                "Seed of the users and endpoints picked, reuse it to send "
+                "the same traffic; transaction ids stay unique per run so "
+                "that creations are not replayed"
+            ),
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=30,
+            help="Seconds a single request may take",
+        )
+
+    def handle(self, *args, **options):
+        if options["requests"] < 2:
+            raise CommandError("At least two requests are required")
+
+        self._random = random.Random(options["seed"])
+        user_ids = [
+            str(user_id)
+            for user_id in User.objects.filter(
+                username__startswith=options["username_prefix"]
+            )
+            .order_by("username")
+            .values_list("id", flat=True)[: options["users"]]
+        ]
+        if len(user_ids) < 2:
+            raise CommandError("At least two users are required")
+
+        base_url = options["base_url"].rstrip("/")
+        for concurrency in options["concurrency"]:
+            requests = [
+                self._build_request(
+                    options["scenario"],
+                    options["write_ratio"],
+                    base_url,
+                    user_ids,
+                )
+                for _ in range(options["requests"])
+            ]
+
+            started_at = time.perf_counter()
+            with ThreadPoolExecutor(concurrency) as executor:
+                results = list(
+                    executor.map(
+                        lambda request: self._send(
+                            request[1], options["timeout"]
+                        ),
+                        requests,
+                    )
+                )
+            elapsed = time.perf_counter() - started_at
+
+            label = f"{options['scenario']} x{concurrency}"
+            self._report(label, results, elapsed)
+            endpoints = {endpoint for endpoint, _ in requests}
+            if len(endpoints) > 1:
+                for endpoint in sorted(endpoints):
+                    self._report(
+                        f"  {endpoint}",
+                        [
+                            result
+                            for (request_endpoint, _), result in zip(
+                                requests, results
+                            )
+                            if request_endpoint == endpoint
+                        ],
+                        elapsed,
+                    )
+
+    def _build_request(
+        self,
+        scenario: str,
+        write_ratio: float,
+        base_url: str,
+        user_ids: list[str],
+    ) -> tuple[str, Request]:
+        """
+        Request of the scenario and the name of the URL it targets.
+        """
+        if scenario == "mixed":
+            scenario = (
+                "transaction-create"
+                if self._random.random() < write_ratio
+                else "balance"
+            )
+
+        if scenario == "balance":
+            return "user-balance", self._build_balance_request(
+                base_url, user_ids
+            )
+
+        return "transaction-create", self._build_transaction_create_request(
+            base_url, user_ids
+        )
+
+    def _build_balance_request(
+        self, base_url: str, user_ids: list[str]
+    ) -> Request:
+        user_id = self._random.choice(user_ids)
+        return Request(f"{base_url}/api/v1/users/{user_id}/balance/")
+
+    def _build_transaction_create_request(
+        self, base_url: str, user_ids: list[str]
+    ) -> Request:
+        sender_id, receiver_id = self._random.sample(user_ids, 2)
+        body = {
+            "transaction_id": f"load-test-{uuid.uuid4().hex}",
+            "total_amount": 1,
+            "senders": [{"user_id": sender_id, "share": 1}],
+            "receivers": [{"user_id": receiver_id, "share": 1}],
+        }
+        return Request(
+            f"{base_url}/api/v1/transactions/",
+            data=json.dumps(body).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+
+    @staticmethod
+    def _send(request: Request, timeout: float) -> tuple[int, float]:
+        """
+        Status code and latency in milliseconds of a request,
+        status 0 stands for a connection error or a timeout.
+        """
+        started_at = time.perf_counter()
+        try:
+            with urlopen(request, timeout=timeout) as response:
+                response.read()
+                status = response.status
+        except HTTPError as error:
+            status = error.code
+        except (URLError, TimeoutError):
+            status = 0
+
+        return status, (time.perf_counter() - started_at) * 1000
+
+    def _report(
+        self,
+        label: str,
+        results: list[tuple[int, float]],
+        elapsed: float,
+    ) -> None:
+        statuses = {}
+        for status, _ in results:
+            statuses[status] = statuses.get(status, 0) + 1
+
+        # Percentiles need two samples, an endpoint of the mixed scenario
+        # may get fewer
+        durations = [duration for _, duration in results]
+        if len(durations) < 2:
+            latency = "too few requests for percentiles"
+        else:
+            percentiles = statistics.quantiles(durations, n=100)
+            latency = (
+                f"p50={percentiles[49]:.2f}ms p95={percentiles[94]:.2f}ms "
+                f"p99={percentiles[98]:.2f}ms"
+            )
+
+        self.stdout.write(
+            f"{label}: {len(results) / elapsed:.1f} req/s {latency} "
+            f"({len(results)} requests, "
+            "statuses: "
+            + ", ".join(
+                f"{status}={count}"
+                for status, count in sorted(statuses.items())
+            )
+            + ")"
+        )
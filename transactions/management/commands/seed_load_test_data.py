@@ -0,0 +1,318 @@
+import random
+from datetime import datetime, timedelta
+from uuid import UUID
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction as db_transaction
+from django.utils import timezone
+from faker import Faker
+
+from transactions.dtos import TransactionParticipantCreateDTO
+from transactions.models import (
+    Transaction,
+    TransactionParticipant,
+    TransactionParticipantRole,
+)
+from users.models import User
+from users.services import UserBalanceService
+
+LOAD_TEST_USERNAME_PREFIX = "load_"
+# Participant counts and their weights: most transfers are one to one,
+# a few are split bills or payouts to many receivers
+SENDER_COUNTS = [(1, 85), (2, 10), (3, 5)]
+RECEIVER_COUNTS = [(1, 60), (2, 15), (3, 10), (5, 8), (10, 5), (50, 2)]
+HISTORY_DAYS = 365
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed users and a transaction history with realistic participant "
+        "counts for load tests, then rebuild their balances. Users are "
+        "funded by a treasury user whose balance goes negative."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=1000,
+            help="Number of users created",
+        )
+        parser.add_argument(
+            "--transactions",
+            type=int,
+            default=10000,
+            help=(
+                "Number of transfers between the users created, the "
+                "treasury top-ups funding them are created on top"
+            ),
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Seed of the generated data, reuse it for the same data",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of rows inserted per query",
+        )
+
+    def handle(self, *args, **options):
+        if options["users"] < 2:
+            raise CommandError("At least two users are required")
+
+        prefix = f"{LOAD_TEST_USERNAME_PREFIX}{options['seed']}_"
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f"Users of seed {options['seed']} already exist, "
+                "use another --seed or a fresh database"
+            )
+
+        self._faker = Faker()
+        self._faker.seed_instance(options["seed"])
+        self._random = random.Random(options["seed"])
+        self._batch_size = options["batch_size"]
+        self._started_at = timezone.now() - timedelta(days=HISTORY_DAYS)
+        self._top_ups_count = 0
+
+        with db_transaction.atomic():
+            treasury, user_ids = self._create_users(
+                prefix,
+                # Outside of the prefix, load tests do not pick it
+                f"{LOAD_TEST_USERNAME_PREFIX}treasury_{options['seed']}",
+                options["users"],
+            )
+            self._create_transactions(
+                treasury.id, user_ids, options["transactions"]
+            )
+
+        balance_service = UserBalanceService()
+        all_user_ids = [treasury.id, *user_ids]
+        for start in range(0, len(all_user_ids), self._batch_size):
+            balance_service.rebuild(
+                all_user_ids[start : start + self._batch_size]
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Seeded {len(user_ids)} users, {options['transactions']} "
+                f"transfers and {self._top_ups_count} treasury top-ups "
+                f"(usernames prefixed with {prefix})"
+            )
+        )
+
+    def _create_users(
+        self, prefix: str, treasury_username: str, users_count: int
+    ) -> tuple[User, list[UUID]]:
+        treasury = User(
+            username=treasury_username,
+            password="!",
+            date_joined=self._started_at,
+            created_at=self._started_at,
+        )
+        users = [treasury]
+        for i in range(users_count):
+            first_name = self._faker.first_name()
+            last_name = self._faker.last_name()
+            users.append(
+                User(
+                    username=f"{prefix}{i}_{self._faker.user_name()}",
+                    # Unusable password, load tests do not authenticate
+                    password="!",
+                    first_name=first_name,
+                    last_name=last_name,
+                    email=self._faker.email(),
+                    date_joined=self._started_at,
+                    created_at=self._started_at,
+                )
+            )
+
+        User.objects.bulk_create(users, batch_size=self._batch_size)
+        return treasury, [user.id for user in users[1:]]
+
+    def _create_transactions(
+        self, treasury_id: UUID, user_ids: list[UUID], transfers_count: int
+    ) -> None:
+        """
+        Generate transfers in chronological order, topping up senders
+        from the treasury whenever they cannot afford their share.
+        """
+        balances = dict.fromkeys(user_ids, 0)
+        timestamps = sorted(
+            self._faker.date_time_between(
+                start_date=self._started_at,
+                end_date="now",
+                tzinfo=timezone.get_current_timezone(),
+            )
+            for _ in range(transfers_count)
+        )
+
+        transactions: list[Transaction] = []
+        participants: list[TransactionParticipant] = []
+        for created_at in timestamps:
+            senders, receivers, total_amount = self._draw_transfer(user_ids)
+            for sender in senders:
+                missing = sender.share_amount - balances[sender.user_id]
+                if missing > 0:
+                    top_up = missing + self._draw_amount()
+                    self._add_transaction(
+                        transactions,
+                        participants,
+                        created_at - timedelta(seconds=1),
+                        top_up,
+                        [
+                            self._build_top_up(
+                                treasury_id,
+                                TransactionParticipantRole.SENDER,
+                                top_up,
+                            )
+                        ],
+                        [
+                            self._build_top_up(
+                                sender.user_id,
+                                TransactionParticipantRole.RECEIVER,
+                                top_up,
+                            )
+                        ],
+                    )
+                    balances[sender.user_id] += top_up
+                    self._top_ups_count += 1
+
+            for sender in senders:
+                balances[sender.user_id] -= sender.share_amount
+            for receiver in receivers:
+                balances[receiver.user_id] += receiver.share_amount
+
+            self._add_transaction(
+                transactions,
+                participants,
+                created_at,
+                total_amount,
+                senders,
+                receivers,
+            )
+            if len(participants) >= self._batch_size:
+                self._flush(transactions, participants)
+
+        self._flush(transactions, participants)
+
+    def _draw_transfer(self, user_ids: list[UUID]) -> tuple[
+        list[TransactionParticipantCreateDTO],
+        list[TransactionParticipantCreateDTO],
+        int,
+    ]:
+        senders_count = min(self._draw_count(SENDER_COUNTS), len(user_ids) - 1)
+        receivers_count = self._draw_count(RECEIVER_COUNTS)
+        participant_ids = self._random.sample(
+            user_ids, min(senders_count + receivers_count, len(user_ids))
+        )
+        senders = self._draw_shares(
+            participant_ids[:senders_count], TransactionParticipantRole.SENDER
+        )
+        receivers = self._draw_shares(
+            participant_ids[senders_count:],
+            TransactionParticipantRole.RECEIVER,
+        )
+
+        # Every share amount is at least 1 when the total covers the shares
+        total_amount = max(
+            self._draw_amount(),
+            sum(sender.share for sender in senders),
+            sum(receiver.share for receiver in receivers),
+        )
+        return (
+            self._split(senders, total_amount),
+            self._split(receivers, total_amount),
+            total_amount,
+        )
+
+    @staticmethod
+    def _split(
+        participants: list[TransactionParticipantCreateDTO], total_amount: int
+    ) -> list[TransactionParticipantCreateDTO]:
+        """
+        Share amounts in proportion to the shares, rounded down the same
+        way TransactionService splits a transfer.
+        """
+        share_sum = sum(participant.share for participant in participants)
+        for participant in participants:
+            participant.share_amount = (
+                participant.share * total_amount
+            ) // share_sum
+
+        return participants
+
+    @staticmethod
+    def _build_top_up(
+        user_id: UUID, role: str, amount: int
+    ) -> TransactionParticipantCreateDTO:
+        return TransactionParticipantCreateDTO(
+            user_id=user_id, role=role, share=1, share_amount=amount
+        )
+
+    def _draw_shares(
+        self, user_ids: list[UUID], role: str
+    ) -> list[TransactionParticipantCreateDTO]:
+        # Even splits are the most common
+        even = self._random.random() < 0.7
+        return [
+            TransactionParticipantCreateDTO(
+                user_id=user_id,
+                role=role,
+                share=1 if even else self._random.randint(1, 100),
+            )
+            for user_id in user_ids
+        ]
+
+    def _draw_count(self, counts: list[tuple[int, int]]) -> int:
+        values, weights = zip(*counts)
+        return self._random.choices(values, weights)[0]
+
+    def _draw_amount(self) -> int:
+        # Log-normal amounts in cents, a median of about 30.00
+        return int(self._random.lognormvariate(8, 1.2)) + 1
+
+    def _add_transaction(
+        self,
+        transactions: list[Transaction],
+        participants: list[TransactionParticipant],
+        created_at: datetime,
+        total_amount: int,
+        senders: list[TransactionParticipantCreateDTO],
+        receivers: list[TransactionParticipantCreateDTO],
+    ) -> None:
+        transaction = Transaction(
+            external_id=f"load-{self._faker.uuid4()}",
+            total_amount=total_amount,
+            created_at=created_at,
+        )
+        transactions.append(transaction)
+
+        for participant in senders + receivers:
+            participants.append(
+                TransactionParticipant(
+                    transaction=transaction,
+                    user_id=participant.user_id,
+                    role=participant.role,
+                    share=participant.share,
+                    share_amount=participant.share_amount,
+                    created_at=created_at,
+                )
+            )
+
+    def _flush(
+        self,
+        transactions: list[Transaction],
+        participants: list[TransactionParticipant],
+    ) -> None:
+        Transaction.objects.bulk_create(
+            transactions, batch_size=self._batch_size
+        )
+        TransactionParticipant.objects.bulk_create(
+            participants, batch_size=self._batch_size
+        )
+        transactions.clear()
+        participants.clear()
@@ -0,0 +1,42 @@
+from prometheus_client import Counter, Histogram
+
+from transactions.exceptions import (
+    TransactionAmountTooSmallException,
+    UserHasNotEnoughFundsException,
+)
+
+SHARE_CALCULATION_SECONDS = Histogram(
+    "transaction_share_calculation_seconds",
+    "Time spent calculating the share amounts of participants",
+)
+
+WRITE_SECONDS = Histogram(
+    "transaction_write_seconds",
+    "Time spent in the atomic block writing transactions",
+    ["operation"],
+)
+
+REPLAYS = Counter(
+    "transaction_replays_total",
+    "Transactions returned as already existing instead of being created",
+    ["operation"],
+)
+
+REJECTIONS = Counter(
+    "transaction_rejections_total",
+    "Transactions rejected for lack of funds or a too small amount",
+    ["operation", "error_code"],
+)
+
+REJECTION_EXCEPTIONS = (
+    UserHasNotEnoughFundsException,
+    TransactionAmountTooSmallException,
+)
+
+
+def record_rejection(operation: str, error: Exception) -> None:
+    """
+    Count the error if it is a rejection, other errors are ignored.
+    """
+    if isinstance(error, REJECTION_EXCEPTIONS):
+        REJECTIONS.labels(operation, error.error_code).inc()
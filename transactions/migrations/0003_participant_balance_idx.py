@@ -0,0 +1,27 @@
+# Generated by Django 5.1.15 on 2026-10-18 09:53
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Building the index concurrently does not block transfers
+    atomic = False
+
+    dependencies = [
+        ("transactions", "0002_auto_20240923_0908"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="transactionparticipant",
+            index=models.Index(
+                fields=["user", "role"],
+                include=("share_amount",),
+                name="participant_balance_idx",
+            ),
+        ),
+    ]
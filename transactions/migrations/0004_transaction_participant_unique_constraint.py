@@ -0,0 +1,61 @@
+# Generated by Django 5.1.15 on 2026-10-18 09:54
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def merge_duplicate_participants(apps, schema_editor):
+    """
+    Merge participants listed more than once with the same role in a
+    transaction into the earliest one, summing their shares and amounts
+    so balances stay the same
+    """
+    TransactionParticipant = apps.get_model(
+        "transactions", "TransactionParticipant"
+    )
+
+    duplicates = (
+        TransactionParticipant.objects.values(
+            "transaction_id", "user_id", "role"
+        )
+        .annotate(
+            count=Count("id"),
+            total_share=Sum("share"),
+            total_share_amount=Sum("share_amount"),
+        )
+        .filter(count__gt=1)
+        .order_by()
+    )
+    for duplicate in list(duplicates):
+        participants = TransactionParticipant.objects.filter(
+            transaction_id=duplicate["transaction_id"],
+            user_id=duplicate["user_id"],
+            role=duplicate["role"],
+        ).order_by("created_at", "id")
+        kept = participants.first()
+        participants.exclude(id=kept.id).delete()
+        kept.share = duplicate["total_share"]
+        kept.share_amount = duplicate["total_share_amount"]
+        kept.save(update_fields=["share", "share_amount"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0003_participant_balance_idx"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_participants, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name="transactionparticipant",
+            constraint=models.UniqueConstraint(
+                fields=("transaction_id", "user_id", "role"),
+                name="transaction_participant_unique_constraint",
+            ),
+        ),
+    ]
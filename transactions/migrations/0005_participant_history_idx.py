@@ -0,0 +1,26 @@
+# Generated by Django 5.1.15 on 2026-10-18 10:12
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Building the index concurrently does not block transfers
+    atomic = False
+
+    dependencies = [
+        ("transactions", "0004_transaction_participant_unique_constraint"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="transactionparticipant",
+            index=models.Index(
+                fields=["user", "created_at", "id"],
+                name="participant_history_idx",
+            ),
+        ),
+    ]
@@ -8,6 +8,16 @@ class Transaction(BaseModel):
     external_id = models.CharField(max_length=100, unique=True)
     total_amount = models.BigIntegerField()  # ISO (cents)
 
+    # Participants loaded with the transaction, either prefetched with
+    # `to_attr` or the rows just inserted along with it
+    participant_list: list["TransactionParticipant"] | None = None
+
+    def get_participants(self):
+        if self.participant_list is not None:
+            return self.participant_list
+
+        return self.participants.all()
+
 
 class TransactionParticipantRole(models.TextChoices):
     SENDER = "SENDER", "Sender"
@@ -18,8 +28,10 @@ class TransactionParticipant(BaseModel):
     transaction = models.ForeignKey(
         Transaction, on_delete=models.CASCADE, related_name="participants"
     )
+    # Lookups by user are served by participant_balance_idx,
+    # which starts with the user
     user = models.ForeignKey(
-        settings.AUTH_USER_MODEL, on_delete=models.CASCADE
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False
     )
     role = models.CharField(
         choices=TransactionParticipantRole.choices, max_length=10
@@ -27,9 +39,23 @@ class TransactionParticipant(BaseModel):
     share = models.IntegerField()
     share_amount = models.BigIntegerField()  # ISO (cents)
 
-    constraints = [
-        models.UniqueConstraint(
-            fields=["transaction_id", "user_id", "role"],
-            name="transaction_participant_unique_constraint",
-        )
-    ]
+    class Meta:
+        indexes = [
+            # Serves balance aggregates with index-only scans
+            models.Index(
+                fields=["user", "role"],
+                include=["share_amount"],
+                name="participant_balance_idx",
+            ),
+            # Serves keyset pagination of a user's transaction history
+            models.Index(
+                fields=["user", "created_at", "id"],
+                name="participant_history_idx",
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["transaction_id", "user_id", "role"],
+                name="transaction_participant_unique_constraint",
+            )
+        ]
@@ -1,21 +1,41 @@
+from datetime import datetime
+from typing import Iterator
 from uuid import UUID
 
-from django.db.models import Sum
+from django.db.models import Case, F, Prefetch, Q, Sum, When
 from django.db.models.functions import Coalesce
 
+from transactions.dtos import TransactionHistoryQueryDTO
 from transactions.models import (
     Transaction,
     TransactionParticipant,
     TransactionParticipantRole,
 )
 
+# See Transaction.participant_list
+PARTICIPANTS_PREFETCH = Prefetch("participants", to_attr="participant_list")
+
 
 class TransactionSelector:
     @staticmethod
     def get_by_external_id_or_none(
         external_id: str,
     ) -> Transaction | None:
-        return Transaction.objects.filter(external_id=external_id).first()
+        return (
+            Transaction.objects.filter(external_id=external_id)
+            .prefetch_related(PARTICIPANTS_PREFETCH)
+            .first()
+        )
+
+    @staticmethod
+    def get_by_external_ids(external_ids: list[str]) -> dict[str, Transaction]:
+        transactions = Transaction.objects.filter(
+            external_id__in=external_ids
+        ).prefetch_related(PARTICIPANTS_PREFETCH)
+        return {
+            transaction.external_id: transaction
+            for transaction in transactions
+        }
 
     @staticmethod
     def get_user_total_sent_amount(user_id: UUID) -> int:
@@ -30,3 +50,89 @@ class TransactionSelector:
         ).aggregate(total_received=Coalesce(Sum("share_amount"), 0))[
             "total_received"
         ]
+
+    @staticmethod
+    def get_users_total_amounts(
+        user_ids: list[UUID],
+        created_from: datetime | None = None,
+        created_to: datetime | None = None,
+    ) -> dict[UUID, int]:
+        """
+        Net amount (received minus sent) per user, in a single grouped query,
+        optionally limited to participations created within
+        `[created_from, created_to)`. Users without participations
+        are omitted.
+        """
+        queryset = TransactionParticipant.objects.filter(user_id__in=user_ids)
+        if created_from:
+            queryset = queryset.filter(created_at__gte=created_from)
+        if created_to:
+            queryset = queryset.filter(created_at__lt=created_to)
+
+        totals = (
+            queryset.values("user_id")
+            .annotate(
+                total=Sum(
+                    Case(
+                        When(
+                            role=TransactionParticipantRole.RECEIVER,
+                            then=F("share_amount"),
+                        ),
+                        default=-F("share_amount"),
+                    )
+                )
+            )
+            .order_by()
+        )
+        return {total["user_id"]: total["total"] for total in totals}
+
+    @staticmethod
+    def get_user_participations(
+        query: TransactionHistoryQueryDTO,
+    ) -> list[TransactionParticipant]:
+        """
+        A page of the user's participations, newest first, with their
+        transactions. Pages are keyed on `(created_at, id)` instead of
+        an OFFSET, so deep pages cost the same as the first one.
+        """
+        queryset = (
+            TransactionParticipant.objects.filter(user_id=query.user_id)
+            .select_related("transaction")
+            .order_by("-created_at", "-id")
+        )
+        if query.role:
+            queryset = queryset.filter(role=query.role)
+        if query.created_from:
+            queryset = queryset.filter(created_at__gte=query.created_from)
+        if query.created_to:
+            queryset = queryset.filter(created_at__lt=query.created_to)
+        if query.after:
+            created_at, last_id = query.after
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at)
+                | Q(created_at=created_at, id__lt=last_id)
+            )
+
+        return list(queryset[: query.limit])
+
+    @staticmethod
+    def iterate_user_statement(user_id: UUID, chunk_size: int) -> Iterator:
+        """
+        Every participation of the user with its transaction, oldest
+        first, read through a server-side cursor `chunk_size` rows at
+        a time so memory does not grow with the history.
+        """
+        return (
+            TransactionParticipant.objects.filter(user_id=user_id)
+            .order_by("created_at", "id")
+            .values_list(
+                "created_at",
+                "transaction_id",
+                "transaction__external_id",
+                "transaction__total_amount",
+                "role",
+                "share_amount",
+                named=True,
+            )
+            .iterator(chunk_size=chunk_size)
+        )
@@ -1,14 +1,45 @@
-from typing import List
+from collections import defaultdict
+from typing import Iterable, Iterator, List
+from uuid import UUID
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError
 from django.db import transaction as db_transaction
 
+from common.exceptions import RootException
 from transactions.dtos import (
+    TransactionBatchItemResultDTO,
+    TransactionBatchItemStatus,
+    TransactionCacheDTO,
     TransactionCreateDTO,
+    TransactionCreateResultDTO,
+    TransactionHistoryPageDTO,
+    TransactionHistoryQueryDTO,
+    TransactionParticipantCacheDTO,
     TransactionParticipantCreateDTO,
 )
-from transactions.exceptions import TransactionAmountTooSmallException
-from transactions.models import Transaction, TransactionParticipant
+from transactions.exceptions import (
+    TransactionAmountTooSmallException,
+    TransactionConflictException,
+    UserHasNotEnoughFundsException,
+)
+from transactions.metrics import (
+    REPLAYS,
+    SHARE_CALCULATION_SECONDS,
+    WRITE_SECONDS,
+    record_rejection,
+)
+from transactions.models import (
+    Transaction,
+    TransactionParticipant,
+    TransactionParticipantRole,
+)
 from transactions.selectors import TransactionSelector
+from users.exceptions import UserNotFoundException
+from users.models import UserBalance
+from users.selectors import UserSelector
 from users.services import UserBalanceService, UserService
 
 
@@ -25,60 +56,428 @@ class TransactionService:
         _balance_service (UserBalanceService): Service for managing user balances.
     """
 
+    # Columns of a user's statement, in order
+    STATEMENT_FIELDS = [
+        "created_at",
+        "transaction_id",
+        "external_id",
+        "total_amount",
+        "role",
+        "amount",
+        "balance",
+    ]
+
+    # Part of the idempotency cache keys, entries of an older
+    # TransactionCacheDTO shape are then never read
+    IDEMPOTENCY_CACHE_VERSION = 1
+
     def __init__(self):
         self._user_service = UserService()
         self._balance_service = UserBalanceService()
 
-    def create(self, data: TransactionCreateDTO) -> Transaction:
+    def create(self, data: TransactionCreateDTO) -> TransactionCreateResultDTO:
         """
         Create a new transaction if it doesn't exist;
         if it does exist, return the existing transaction, ensuring idempotence.
 
+        Recently processed transactions are replayed from the idempotency
+        cache without touching the database. Otherwise the insert runs
+        first and relies on the unique external id, so only conflicting
+        or failing requests pay the idempotency lookup.
+
         Calculates the share amounts for senders and receivers, and
         clears balance cache for involved users.
         """
-        transaction = TransactionSelector.get_by_external_id_or_none(
-            data.transaction_id
-        )
-        if transaction:
-            return transaction
+        cached = cache.get(self.get_cache_key(data.transaction_id))
+        if cached is not None:
+            REPLAYS.labels("create").inc()
+            return TransactionCreateResultDTO(
+                transaction=self._load_cached_transaction(cached),
+                replayed=True,
+            )
 
-        data.senders = self._calculate_senders_share_amount(
-            data.senders, data.total_amount
+        return self._create_or_replay(data)
+
+    async def acreate(
+        self, data: TransactionCreateDTO
+    ) -> TransactionCreateResultDTO:
+        """
+        Async counterpart of `create`.
+
+        Replays are served from the idempotency cache on the event loop.
+        The write itself runs in a worker thread, as Django has no async
+        transactions or row locks.
+        """
+        cached = await cache.aget(self.get_cache_key(data.transaction_id))
+        if cached is not None:
+            REPLAYS.labels("create").inc()
+            return TransactionCreateResultDTO(
+                transaction=self._load_cached_transaction(cached),
+                replayed=True,
+            )
+
+        return await sync_to_async(self._create_or_replay)(data)
+
+    def _create_or_replay(
+        self, data: TransactionCreateDTO
+    ) -> TransactionCreateResultDTO:
+        try:
+            self._user_service.validate_many_exist(
+                list(
+                    {
+                        participant.user_id
+                        for participant in data.senders + data.receivers
+                    }
+                )
+            )
+            data.senders = self._calculate_senders_share_amount(
+                data.senders, data.total_amount
+            )
+            data.receivers = self._calculate_receivers_share_amount(
+                data.receivers, data.total_amount
+            )
+            transaction = self._create_reserving_funds(data)
+        except TransactionAmountTooSmallException as error:
+            record_rejection("create", error)
+            raise
+        except (IntegrityError, UserHasNotEnoughFundsException) as error:
+            # A replay conflicts on the external id, or fails the funds
+            # check once the original transfer has been applied
+            transaction = TransactionSelector.get_by_external_id_or_none(
+                data.transaction_id
+            )
+            if transaction is None:
+                record_rejection("create", error)
+                raise
+
+            REPLAYS.labels("create").inc()
+            self._cache_transactions([transaction])
+            return TransactionCreateResultDTO(
+                transaction=transaction, replayed=True
+            )
+
+        self._cache_transactions([transaction])
+        return TransactionCreateResultDTO(transaction=transaction)
+
+    def create_batch(
+        self, items: List[TransactionCreateDTO]
+    ) -> List[TransactionBatchItemResultDTO]:
+        """
+        Create many transactions at once; each item succeeds or fails
+        on its own and known transaction ids are replayed.
+
+        Known transactions and participants are looked up with one query
+        each, and new transactions are written with bulk inserts
+        inside a single atomic block.
+        """
+        cache_keys = {
+            self.get_cache_key(item.transaction_id): item.transaction_id
+            for item in items
+        }
+        existing = {
+            cache_keys[cache_key]: self._load_cached_transaction(cached)
+            for cache_key, cached in cache.get_many(list(cache_keys)).items()
+        }
+        existing |= TransactionSelector.get_by_external_ids(
+            [
+                item.transaction_id
+                for item in items
+                if item.transaction_id not in existing
+            ]
         )
-        data.receivers = self._calculate_receivers_share_amount(
-            data.receivers, data.total_amount
+        existing_user_ids = UserSelector.get_existing_ids(
+            list(
+                {
+                    participant.user_id
+                    for item in items
+                    for participant in item.senders + item.receivers
+                }
+            )
         )
 
-        transaction = self._create(data)
+        results: dict[str, TransactionBatchItemResultDTO] = {}
+        pending: List[TransactionCreateDTO] = []
+        for item in items:
+            if item.transaction_id in results:
+                continue
+
+            if item.transaction_id in existing:
+                results[item.transaction_id] = TransactionBatchItemResultDTO(
+                    transaction_id=item.transaction_id,
+                    status=TransactionBatchItemStatus.EXISTING,
+                    transaction=existing[item.transaction_id],
+                )
+                continue
+
+            try:
+                self._prepare_batch_item(item, existing_user_ids)
+            except RootException as error:
+                results[item.transaction_id] = TransactionBatchItemResultDTO(
+                    transaction_id=item.transaction_id,
+                    status=TransactionBatchItemStatus.FAILED,
+                    error=error,
+                )
+                continue
+
+            results[item.transaction_id] = TransactionBatchItemResultDTO(
+                transaction_id=item.transaction_id,
+                status=TransactionBatchItemStatus.CREATED,
+            )
+            pending.append(item)
+
+        if pending:
+            self._create_batch(pending, results)
 
-        self._balance_service.clear_cache(
+        self._record_batch_outcomes(list(results.values()))
+        self._cache_transactions(
             [
-                participant.user_id
-                for participant in data.senders + data.receivers
+                result.transaction
+                for result in results.values()
+                if result.transaction is not None
             ]
         )
-        return transaction
+        return [results[item.transaction_id] for item in items]
 
-    def _calculate_senders_share_amount(
-        self, senders: List[TransactionParticipantCreateDTO], total_amount: int
-    ) -> List[TransactionParticipantCreateDTO]:
+    def get_user_history(
+        self, query: TransactionHistoryQueryDTO
+    ) -> TransactionHistoryPageDTO:
+        """
+        Retrieve a page of the user's transaction history, newest first.
+        """
+        self._user_service.get_by_id_or_raise(query.user_id)
+
+        # One extra row tells whether another page follows
+        participants = TransactionSelector.get_user_participations(
+            query.model_copy(update={"limit": query.limit + 1})
+        )
+        return TransactionHistoryPageDTO(
+            participants=participants[: query.limit],
+            has_next=len(participants) > query.limit,
+        )
+
+    def get_user_statement(self, user_id: UUID) -> Iterator[dict]:
+        """
+        Stream the user's full statement, oldest first, with the running
+        balance after every participation.
+
+        The user is checked right away; rows are produced lazily while
+        the result is consumed.
+        """
+        self._user_service.get_by_id_or_raise(user_id)
+
+        return self._build_statement_rows(
+            TransactionSelector.iterate_user_statement(
+                user_id, settings.TRANSACTION_EXPORT_CHUNK_SIZE
+            )
+        )
+
+    def _build_statement_rows(
+        self, participations: Iterable
+    ) -> Iterator[dict]:
+        balance = 0
+        for participation in participations:
+            amount = (
+                participation.share_amount
+                if participation.role == TransactionParticipantRole.RECEIVER
+                else -participation.share_amount
+            )
+            balance += amount
+            yield {
+                "created_at": participation.created_at.isoformat(),
+                "transaction_id": str(participation.transaction_id),
+                "external_id": participation.transaction__external_id,
+                "total_amount": participation.transaction__total_amount,
+                "role": participation.role,
+                "amount": amount,
+                "balance": balance,
+            }
+
+    def _prepare_batch_item(
+        self, item: TransactionCreateDTO, existing_user_ids: set[UUID]
+    ) -> None:
+        for participant in item.senders + item.receivers:
+            if participant.user_id not in existing_user_ids:
+                raise UserNotFoundException(
+                    f"User not found with id: {participant.user_id}"
+                )
+
+        item.senders = self._calculate_share_amounts(
+            item.senders, item.total_amount
+        )
+        item.receivers = self._calculate_share_amounts(
+            item.receivers, item.total_amount
+        )
+
+    def _create_batch(
+        self,
+        items: List[TransactionCreateDTO],
+        results: dict[str, TransactionBatchItemResultDTO],
+    ) -> None:
+        """
+        Lock balances of every participant once, validate items
+        in order against the running balances and bulk insert
+        the accepted ones.
+
+        If a concurrent request inserted one of the transactions since
+        the lookup, the bulk insert is rolled back and the items are
+        written one by one, each in its own savepoint, so only the
+        conflicting ones are replayed.
+        """
+        with WRITE_SECONDS.labels("batch").time(), db_transaction.atomic():
+            balances = self._balance_service.lock_balances(
+                list(
+                    {
+                        participant.user_id
+                        for item in items
+                        for participant in item.senders + item.receivers
+                    }
+                )
+            )
+            try:
+                with db_transaction.atomic():
+                    written = self._write_batch_items(items, balances, results)
+            except IntegrityError:
+                written = []
+                for item in items:
+                    try:
+                        with db_transaction.atomic():
+                            written += self._write_batch_items(
+                                [item], balances, results
+                            )
+                    except IntegrityError as error:
+                        self._replay_batch_item(item, error, results)
+
+            deltas: dict[UUID, int] = defaultdict(int)
+            for item, _, _ in written:
+                for user_id, delta in self._get_balance_deltas(item).items():
+                    deltas[user_id] += delta
+            self._balance_service.add_amounts(balances, dict(deltas))
+
+        for item, transaction, participants in written:
+            transaction.participant_list = participants
+            results[item.transaction_id].transaction = transaction
+
+    def _write_batch_items(
+        self,
+        items: List[TransactionCreateDTO],
+        balances: dict[UUID, UserBalance],
+        results: dict[str, TransactionBatchItemResultDTO],
+    ) -> List[
+        tuple[TransactionCreateDTO, Transaction, List[TransactionParticipant]]
+    ]:
+        """
+        Validate items in order against the running balances and bulk
+        insert the accepted ones. Running balances are restored when
+        the insert fails.
         """
-        Calculate the share amounts for senders based on their share percentage
-        and validate the amount they can send.
+        amounts = {
+            participant.user_id: balances[participant.user_id].amount
+            for item in items
+            for participant in item.senders + item.receivers
+        }
+        accepted: List[TransactionCreateDTO] = []
+        for item in items:
+            item_deltas = self._get_balance_deltas(item)
+            result = results[item.transaction_id]
+            try:
+                self._balance_service.validate_deltas(balances, item_deltas)
+            except RootException as error:
+                result.status = TransactionBatchItemStatus.FAILED
+                result.error = error
+                continue
+
+            result.status = TransactionBatchItemStatus.CREATED
+            result.error = None
+            for user_id, delta in item_deltas.items():
+                balances[user_id].amount += delta
+            accepted.append(item)
 
+        try:
+            transactions = Transaction.objects.bulk_create(
+                [
+                    Transaction(
+                        external_id=item.transaction_id,
+                        total_amount=item.total_amount,
+                    )
+                    for item in accepted
+                ]
+            )
+            participants = [
+                self._build_participants(transaction, item)
+                for item, transaction in zip(accepted, transactions)
+            ]
+            TransactionParticipant.objects.bulk_create(
+                [
+                    participant
+                    for transaction_participants in participants
+                    for participant in transaction_participants
+                ]
+            )
+        except IntegrityError:
+            for user_id, amount in amounts.items():
+                balances[user_id].amount = amount
+            raise
+
+        return list(zip(accepted, transactions, participants))
+
+    def _replay_batch_item(
+        self,
+        item: TransactionCreateDTO,
+        error: IntegrityError,
+        results: dict[str, TransactionBatchItemResultDTO],
+    ) -> None:
         """
-        share_sum = sum([sender.share for sender in senders])
-        for sender in senders:
-            self._user_service.get_by_id_or_raise(sender.user_id)
+        Report an item whose insert conflicted as the transaction
+        a concurrent request created with the same id.
+        """
+        result = results[item.transaction_id]
+        transaction = TransactionSelector.get_by_external_id_or_none(
+            item.transaction_id
+        )
+        if transaction is None:
+            result.status = TransactionBatchItemStatus.FAILED
+            result.error = TransactionConflictException(str(error))
+            return
+
+        result.status = TransactionBatchItemStatus.EXISTING
+        result.transaction = transaction
 
-            share_amount = (sender.share * total_amount) // share_sum
-            self._balance_service.validate_amount_to_send(
-                sender.user_id, share_amount
+    @staticmethod
+    def _record_batch_outcomes(
+        results: List[TransactionBatchItemResultDTO],
+    ) -> None:
+        for result in results:
+            if result.status == TransactionBatchItemStatus.EXISTING:
+                REPLAYS.labels("batch").inc()
+            elif result.status == TransactionBatchItemStatus.FAILED:
+                record_rejection("batch", result.error)
+
+    @SHARE_CALCULATION_SECONDS.time()
+    def _calculate_share_amounts(
+        self,
+        participants: List[TransactionParticipantCreateDTO],
+        total_amount: int,
+    ) -> List[TransactionParticipantCreateDTO]:
+        """
+        Calculate the share amounts of participants based on their share
+        percentage, without any database lookups.
+        """
+        share_sum = sum([participant.share for participant in participants])
+        for participant in participants:
+            share_amount = (participant.share * total_amount) // share_sum
+            participant.share_amount = self._validate_share_amount(
+                share_amount
             )
-            sender.share_amount = self._validate_share_amount(share_amount)
 
-        return senders
+        return participants
+
+    def _calculate_senders_share_amount(
+        self, senders: List[TransactionParticipantCreateDTO], total_amount: int
+    ) -> List[TransactionParticipantCreateDTO]:
+        """
+        Calculate the share amounts for senders based on their share percentage.
+        """
+        return self._calculate_share_amounts(senders, total_amount)
 
     def _calculate_receivers_share_amount(
         self,
@@ -88,14 +487,7 @@ class TransactionService:
         """
         Calculate the share amounts for receivers based on their share percentage.
         """
-        share_sum = sum([receiver.share for receiver in receivers])
-        for receiver in receivers:
-            self._user_service.get_by_id_or_raise(receiver.user_id)
-
-            share_amount = (receiver.share * total_amount) // share_sum
-            receiver.share_amount = self._validate_share_amount(share_amount)
-
-        return receivers
+        return self._calculate_share_amounts(receivers, total_amount)
 
     def _validate_share_amount(self, share_amount: int) -> int:
         if share_amount == 0:
@@ -103,19 +495,139 @@ class TransactionService:
 
         return share_amount
 
-    def _create(self, data: TransactionCreateDTO) -> Transaction:
-        with db_transaction.atomic():
+    def _create_reserving_funds(
+        self, data: TransactionCreateDTO
+    ) -> Transaction:
+        """
+        Reserve sender funds against cached balances to reject early,
+        then write the transaction. The reservation is released with
+        the debit of the cached balances once the write commits, or
+        right away if the write fails.
+
+        Funds are enforced under row locks when balances are written.
+        """
+        sending_amounts: dict[UUID, int] = defaultdict(int)
+        for sender in data.senders:
+            sending_amounts[sender.user_id] += sender.share_amount
+
+        reserved_amounts = self._balance_service.reserve_amounts_to_send(
+            dict(sending_amounts)
+        )
+        try:
+            return self._create(data, reserved_amounts)
+        except BaseException:
+            self._balance_service.release_amounts(reserved_amounts)
+            raise
+
+    def _create(
+        self,
+        data: TransactionCreateDTO,
+        reserved_amounts: dict[UUID, int] | None = None,
+    ) -> Transaction:
+        with WRITE_SECONDS.labels("create").time(), db_transaction.atomic():
             transaction = Transaction.objects.create(
                 external_id=data.transaction_id, total_amount=data.total_amount
             )
-            TransactionParticipant.objects.bulk_create(
-                [
-                    TransactionParticipant(
-                        transaction_id=transaction.id,
-                        **participant.model_dump()
-                    )
-                    for participant in data.senders + data.receivers
-                ]
+            participants = TransactionParticipant.objects.bulk_create(
+                self._build_participants(transaction, data)
+            )
+            # Balance rows are locked last to hold the locks only until commit
+            self._balance_service.apply_deltas(
+                self._get_balance_deltas(data), reserved_amounts
             )
 
+        transaction.participant_list = participants
         return transaction
+
+    def _build_participants(
+        self, transaction: Transaction, data: TransactionCreateDTO
+    ) -> List[TransactionParticipant]:
+        return [
+            TransactionParticipant(
+                transaction=transaction, **participant.model_dump()
+            )
+            for participant in data.senders + data.receivers
+        ]
+
+    def _get_balance_deltas(
+        self, data: TransactionCreateDTO
+    ) -> dict[UUID, int]:
+        """
+        Signed balance change per user: senders are debited,
+        receivers are credited.
+        """
+        deltas: dict[UUID, int] = defaultdict(int)
+        for sender in data.senders:
+            deltas[sender.user_id] -= sender.share_amount
+        for receiver in data.receivers:
+            deltas[receiver.user_id] += receiver.share_amount
+
+        return dict(deltas)
+
+    def _cache_transactions(self, transactions: List[Transaction]) -> None:
+        """
+        Remember processed transactions for a short time, so retries
+        are replayed without reaching the database.
+        """
+        cache.set_many(
+            {
+                self.get_cache_key(
+                    transaction.external_id
+                ): self._dump_cached_transaction(transaction)
+                for transaction in transactions
+            },
+            timeout=settings.TRANSACTION_IDEMPOTENCY_CACHE_TIMEOUT,
+        )
+
+    @staticmethod
+    def _dump_cached_transaction(transaction: Transaction) -> dict:
+        """
+        Idempotency cache entry of a transaction, a plain dict rather
+        than a pickled model.
+        """
+        return TransactionCacheDTO(
+            id=transaction.id,
+            external_id=transaction.external_id,
+            total_amount=transaction.total_amount,
+            created_at=transaction.created_at,
+            updated_at=transaction.updated_at,
+            participants=[
+                TransactionParticipantCacheDTO(
+                    id=participant.id,
+                    user_id=participant.user_id,
+                    role=participant.role,
+                    share=participant.share,
+                    share_amount=participant.share_amount,
+                )
+                for participant in transaction.get_participants()
+            ],
+        ).model_dump(mode="json")
+
+    @staticmethod
+    def _load_cached_transaction(cached: dict) -> Transaction:
+        """
+        Unsaved transaction with its participants attached, built from
+        an idempotency cache entry.
+        """
+        data = TransactionCacheDTO.model_validate(cached)
+        transaction = Transaction(
+            id=data.id,
+            external_id=data.external_id,
+            total_amount=data.total_amount,
+            created_at=data.created_at,
+            updated_at=data.updated_at,
+        )
+        transaction.participant_list = [
+            TransactionParticipant(
+                transaction=transaction, **participant.model_dump()
+            )
+            for participant in data.participants
+        ]
+        return transaction
+
+    @classmethod
+    def get_cache_key(cls, external_id: str) -> str:
+        return (
+            f"{settings.TRANSACTION_IDEMPOTENCY_CACHE_KEY_PREFIX}"
+            f"v{cls.IDEMPOTENCY_CACHE_VERSION}:{external_id}"
+        )
@@ -68,3 +68,33 @@ class TransactionSelectorTests(TestCase):
             self.user.id
         )
         self.assertEqual(result, 600)
+
+    def test_get_users_total_amounts(self):
+        other_user = User.objects.create(
+            username="username2", password="hashed_password"
+        )
+        TransactionParticipant.objects.create(
+            transaction=self.transaction,
+            user=self.user,
+            role=TransactionParticipantRole.RECEIVER,
+            share=1,
+            share_amount=400,
+        )
+        TransactionParticipant.objects.create(
+            transaction=self.transaction2,
+            user=self.user,
+            role=TransactionParticipantRole.SENDER,
+            share=1,
+            share_amount=100,
+        )
+        TransactionParticipant.objects.create(
+            transaction=self.transaction2,
+            user=other_user,
+            role=TransactionParticipantRole.RECEIVER,
+            share=1,
+            share_amount=100,
+        )
+        result = TransactionSelector.get_users_total_amounts(
+            [self.user.id, other_user.id]
+        )
+        self.assertEqual(result, {self.user.id: 300, other_user.id: 100})
@@ -1,25 +1,45 @@
 import unittest
-from unittest.mock import patch, MagicMock
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
 from uuid import uuid4
 
+from django.core.cache import cache
+from django.db import IntegrityError, connection
+from django.test import (
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+    skipUnlessDBFeature,
+)
+from django.utils import timezone
+from prometheus_client import REGISTRY
+
+from common.cache import get_redis_client
 from transactions.dtos import (
+    TransactionBatchItemStatus,
     TransactionCreateDTO,
     TransactionParticipantCreateDTO,
 )
-from transactions.exceptions import TransactionAmountTooSmallException
+from transactions.exceptions import (
+    TransactionAmountTooSmallException,
+    UserHasNotEnoughFundsException,
+)
 from transactions.models import Transaction
 from transactions.services import TransactionService
+from users.exceptions import UserNotFoundException
+from users.models import User, UserBalance
+from users.services import UserBalanceService, balance_cache
 
 
 class TestTransactionService(unittest.TestCase):
     def setUp(self):
         self.service = TransactionService()
 
+    @patch("transactions.services.cache")
     @patch(
         "transactions.selectors.TransactionSelector.get_by_external_id_or_none"
     )
-    @patch("transactions.services.UserBalanceService.clear_cache")
-    @patch("transactions.services.TransactionService._create")
+    @patch("transactions.services.TransactionService._create_reserving_funds")
     @patch(
         "transactions.services.TransactionService._calculate_senders_share_amount"
     )
@@ -31,11 +51,15 @@ class TestTransactionService(unittest.TestCase):
         mock_calculate_receivers,
         mock_calculate_senders,
         mock_create,
-        mock_clear_cache,
         mock_get_by_external_id,
+        mock_cache,
     ):
         # Test when transaction already exists
-        mock_get_by_external_id.return_value = MagicMock(spec=Transaction)
+        mock_cache.get.return_value = None
+        mock_get_by_external_id.return_value = make_transaction("existing_id")
+        mock_calculate_senders.return_value = []
+        mock_calculate_receivers.return_value = []
+        mock_create.side_effect = IntegrityError()
 
         data = TransactionCreateDTO(
             transaction_id="existing_id",
@@ -43,20 +67,75 @@ class TestTransactionService(unittest.TestCase):
             senders=[],
             receivers=[],
         )
-        transaction = self.service.create(data)
+        result = self.service.create(data)
 
         mock_get_by_external_id.assert_called_once_with(data.transaction_id)
-        self.assertFalse(mock_calculate_senders.called)
-        self.assertFalse(mock_calculate_receivers.called)
+        mock_cache.set_many.assert_called_once()
+        self.assertEqual(
+            result.transaction, mock_get_by_external_id.return_value
+        )
+        self.assertTrue(result.replayed)
+
+    @patch("transactions.services.cache")
+    @patch(
+        "transactions.selectors.TransactionSelector.get_by_external_id_or_none"
+    )
+    @patch("transactions.services.TransactionService._create_reserving_funds")
+    def test_create_cached_transaction(
+        self, mock_create, mock_get_by_external_id, mock_cache
+    ):
+        cached_transaction = make_transaction("cached_id")
+        mock_cache.get.return_value = self.service._dump_cached_transaction(
+            cached_transaction
+        )
+
+        data = TransactionCreateDTO(
+            transaction_id="cached_id",
+            total_amount=1000,
+            senders=[],
+            receivers=[],
+        )
+        result = self.service.create(data)
+
+        mock_cache.get.assert_called_once_with(
+            self.service.get_cache_key(data.transaction_id)
+        )
+        self.assertFalse(mock_get_by_external_id.called)
         self.assertFalse(mock_create.called)
-        self.assertFalse(mock_clear_cache.called)
-        self.assertEqual(transaction, mock_get_by_external_id.return_value)
+        self.assertEqual(result.transaction, cached_transaction)
+        self.assertEqual(result.transaction.external_id, "cached_id")
+        self.assertEqual(result.transaction.participant_list, [])
+        self.assertTrue(result.replayed)
 
+    @patch("transactions.services.cache")
     @patch(
         "transactions.selectors.TransactionSelector.get_by_external_id_or_none"
     )
-    @patch("transactions.services.UserBalanceService.clear_cache")
-    @patch("transactions.services.TransactionService._create")
+    @patch("transactions.services.TransactionService._create_reserving_funds")
+    def test_create_raises_error__when_not_enough_funds(
+        self, mock_create, mock_get_by_external_id, mock_cache
+    ):
+        mock_cache.get.return_value = None
+        mock_get_by_external_id.return_value = None
+        mock_create.side_effect = UserHasNotEnoughFundsException()
+
+        data = TransactionCreateDTO(
+            transaction_id="new_id",
+            total_amount=1000,
+            senders=[],
+            receivers=[],
+        )
+        with self.assertRaises(UserHasNotEnoughFundsException):
+            self.service.create(data)
+
+        mock_get_by_external_id.assert_called_once_with(data.transaction_id)
+
+    @patch("transactions.services.cache")
+    @patch(
+        "transactions.selectors.TransactionSelector.get_by_external_id_or_none"
+    )
+    @patch("transactions.services.UserService.validate_many_exist")
+    @patch("transactions.services.TransactionService._create_reserving_funds")
     @patch(
         "transactions.services.TransactionService._calculate_senders_share_amount"
     )
@@ -68,10 +147,12 @@ class TestTransactionService(unittest.TestCase):
         mock_calculate_receivers,
         mock_calculate_senders,
         mock_create,
-        mock_clear_cache,
+        mock_get_users,
         mock_get_by_external_id,
+        mock_cache,
     ):
         # Test when transaction is new
+        mock_cache.get.return_value = None
         mock_get_by_external_id.return_value = None
 
         senders = [
@@ -96,11 +177,16 @@ class TestTransactionService(unittest.TestCase):
 
         mock_calculate_senders.return_value = senders
         mock_calculate_receivers.return_value = receivers
-        mock_create.return_value = MagicMock(spec=Transaction)
+        mock_create.return_value = make_transaction("new_id")
 
-        transaction = self.service.create(data)
+        result = self.service.create(data)
 
-        mock_get_by_external_id.assert_called_once_with(data.transaction_id)
+        self.assertFalse(mock_get_by_external_id.called)
+        mock_get_users.assert_called_once()
+        self.assertEqual(
+            set(mock_get_users.call_args.args[0]),
+            {participant.user_id for participant in senders + receivers},
+        )
         mock_calculate_senders.assert_called_once_with(
             senders, data.total_amount
         )
@@ -108,14 +194,11 @@ class TestTransactionService(unittest.TestCase):
             receivers, data.total_amount
         )
         mock_create.assert_called_once_with(data)
-        mock_clear_cache.assert_called_once()
-        self.assertEqual(transaction, mock_create.return_value)
+        mock_cache.set_many.assert_called_once()
+        self.assertEqual(result.transaction, mock_create.return_value)
+        self.assertFalse(result.replayed)
 
-    @patch("transactions.services.UserService.get_by_id_or_raise")
-    @patch("transactions.services.UserBalanceService.validate_amount_to_send")
-    def test_calculate_senders_share_amount(
-        self, mock_validate_amount, mock_get_user
-    ):
+    def test_calculate_senders_share_amount(self):
         # Test calculating sender's share amounts
         senders = [
             TransactionParticipantCreateDTO(
@@ -133,11 +216,25 @@ class TestTransactionService(unittest.TestCase):
 
         self.assertEqual(result[0].share_amount, 600)
         self.assertEqual(result[1].share_amount, 400)
-        mock_get_user.assert_called()
-        mock_validate_amount.assert_called()
 
-    @patch("transactions.services.UserService.get_by_id_or_raise")
-    def test_calculate_receivers_share_amount(self, mock_get_user):
+    @patch("transactions.services.UserBalanceService.release_amounts")
+    @patch("transactions.services.UserBalanceService.reserve_amounts_to_send")
+    @patch("transactions.services.TransactionService._create")
+    def test_create_reserving_funds__releases_reservation_on_failure(
+        self, mock_create, mock_reserve, mock_release
+    ):
+        sender_id = uuid4()
+        data = make_transfer_data("failed_id", sender_id, uuid4(), 300)
+        mock_reserve.return_value = {sender_id: 300}
+        mock_create.side_effect = IntegrityError()
+
+        with self.assertRaises(IntegrityError):
+            self.service._create_reserving_funds(data)
+
+        mock_reserve.assert_called_once_with({sender_id: 300})
+        mock_release.assert_called_once_with({sender_id: 300})
+
+    def test_calculate_receivers_share_amount(self):
         # Test calculating receiver's share amounts
         receivers = [
             TransactionParticipantCreateDTO(
@@ -155,7 +252,6 @@ class TestTransactionService(unittest.TestCase):
 
         self.assertEqual(result[0].share_amount, 750)
         self.assertEqual(result[1].share_amount, 250)
-        mock_get_user.assert_called()
 
     def test_validate_share_amount(self):
         # Test validating share amount
@@ -165,3 +261,402 @@ class TestTransactionService(unittest.TestCase):
 
         with self.assertRaises(TransactionAmountTooSmallException):
             self.service._validate_share_amount(0)
+
+
+def get_count(name, labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def make_transaction(external_id: str) -> Transaction:
+    """
+    Unsaved transaction without participants.
+    """
+    transaction = Transaction(
+        id=uuid4(),
+        external_id=external_id,
+        total_amount=1000,
+        created_at=timezone.now(),
+        updated_at=timezone.now(),
+    )
+    transaction.participant_list = []
+    return transaction
+
+
+def make_transfer_data(
+    transaction_id, sender_id, receiver_id, amount, calculated=True
+):
+    return TransactionCreateDTO(
+        transaction_id=transaction_id,
+        total_amount=amount,
+        senders=[
+            TransactionParticipantCreateDTO(
+                user_id=sender_id,
+                role="SENDER",
+                share=1,
+                share_amount=amount if calculated else None,
+            ),
+        ],
+        receivers=[
+            TransactionParticipantCreateDTO(
+                user_id=receiver_id,
+                role="RECEIVER",
+                share=1,
+                share_amount=amount if calculated else None,
+            ),
+        ],
+    )
+
+
+class TransactionServiceCreateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.service = TransactionService()
+        self.sender = User.objects.create(
+            username="sender", password="password"
+        )
+        self.receiver = User.objects.create(
+            username="receiver", password="password"
+        )
+        UserBalance.objects.create(user=self.sender, amount=1000)
+
+    def test_create_updates_balances(self):
+        data = make_transfer_data(
+            "new_id", self.sender.id, self.receiver.id, 600
+        )
+
+        transaction = self.service._create(data)
+
+        self.assertEqual(transaction.participants.count(), 2)
+        self.assertEqual(UserBalance.objects.get(user=self.sender).amount, 400)
+        self.assertEqual(
+            UserBalance.objects.get(user=self.receiver).amount, 600
+        )
+
+    def test_create__raises_error__when_not_enough_funds(self):
+        data = make_transfer_data(
+            "new_id", self.sender.id, self.receiver.id, 1200
+        )
+
+        with self.assertRaises(UserHasNotEnoughFundsException):
+            self.service._create(data)
+
+        self.assertFalse(Transaction.objects.filter(external_id="new_id"))
+        self.assertEqual(
+            UserBalance.objects.get(user=self.sender).amount, 1000
+        )
+
+    def test_create__returns_existing_transaction__when_replayed(self):
+        result = self.service.create(
+            make_transfer_data(
+                "new_id", self.sender.id, self.receiver.id, 1000, False
+            )
+        )
+        cache.delete(self.service.get_cache_key("new_id"))
+
+        # The sender has no funds left for a second transfer
+        replayed_result = self.service.create(
+            make_transfer_data(
+                "new_id", self.sender.id, self.receiver.id, 1000, False
+            )
+        )
+
+        self.assertFalse(result.replayed)
+        self.assertTrue(replayed_result.replayed)
+        self.assertEqual(replayed_result.transaction, result.transaction)
+        self.assertEqual(
+            Transaction.objects.filter(external_id="new_id").count(), 1
+        )
+        self.assertEqual(UserBalance.objects.get(user=self.sender).amount, 0)
+
+    def test_create__replays_from_cache_without_queries(self):
+        data = make_transfer_data(
+            "new_id", self.sender.id, self.receiver.id, 100, False
+        )
+        result = self.service.create(data)
+        self.assertIsInstance(
+            cache.get(self.service.get_cache_key("new_id")), dict
+        )
+
+        with self.assertNumQueries(0):
+            replayed_result = self.service.create(data)
+            self.assertEqual(
+                len(replayed_result.transaction.participant_list), 2
+            )
+
+        self.assertTrue(replayed_result.replayed)
+        self.assertEqual(replayed_result.transaction, result.transaction)
+
+    def test_create__records_replays_and_rejections(self):
+        replays = get_count(
+            "transaction_replays_total", {"operation": "create"}
+        )
+        rejection_labels = {
+            "operation": "create",
+            "error_code": UserHasNotEnoughFundsException.error_code,
+        }
+        rejections = get_count(
+            "transaction_rejections_total", rejection_labels
+        )
+        data = make_transfer_data(
+            "new_id", self.sender.id, self.receiver.id, 100, False
+        )
+
+        self.service.create(data)
+        self.service.create(data)
+        with self.assertRaises(UserHasNotEnoughFundsException):
+            self.service.create(
+                make_transfer_data(
+                    "other_id", self.sender.id, self.receiver.id, 5000, False
+                )
+            )
+
+        self.assertEqual(
+            get_count("transaction_replays_total", {"operation": "create"}),
+            replays + 1,
+        )
+        self.assertEqual(
+            get_count("transaction_rejections_total", rejection_labels),
+            rejections + 1,
+        )
+
+
+class TransactionServiceCreateBatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.service = TransactionService()
+        self.sender = User.objects.create(
+            username="sender", password="password"
+        )
+        self.receiver = User.objects.create(
+            username="receiver", password="password"
+        )
+        UserBalance.objects.create(user=self.sender, amount=1000)
+        self.existing_transaction = Transaction.objects.create(
+            external_id="existing_id", total_amount=100
+        )
+
+    def _make_item(self, transaction_id, amount, sender_id=None):
+        return make_transfer_data(
+            transaction_id,
+            sender_id or self.sender.id,
+            self.receiver.id,
+            amount,
+            calculated=False,
+        )
+
+    def test_create_batch(self):
+        items = [
+            self._make_item("new_id_1", 600),
+            self._make_item("existing_id", 100),
+            self._make_item("new_id_2", 600),
+            self._make_item("new_id_3", 400, sender_id=uuid4()),
+            self._make_item("new_id_4", 400),
+            self._make_item("new_id_1", 600),
+        ]
+
+        results = self.service.create_batch(items)
+
+        self.assertEqual(
+            [result.status for result in results],
+            [
+                TransactionBatchItemStatus.CREATED,
+                TransactionBatchItemStatus.EXISTING,
+                TransactionBatchItemStatus.FAILED,
+                TransactionBatchItemStatus.FAILED,
+                TransactionBatchItemStatus.CREATED,
+                TransactionBatchItemStatus.CREATED,
+            ],
+        )
+        self.assertIsInstance(results[2].error, UserHasNotEnoughFundsException)
+        self.assertIsInstance(results[3].error, UserNotFoundException)
+        self.assertEqual(results[1].transaction, self.existing_transaction)
+        self.assertIs(results[5], results[0])
+        self.assertEqual(UserBalance.objects.get(user=self.sender).amount, 0)
+        self.assertEqual(
+            UserBalance.objects.get(user=self.receiver).amount, 1000
+        )
+        self.assertEqual(
+            sorted(
+                Transaction.objects.filter(
+                    external_id__startswith="new_id"
+                ).values_list("external_id", flat=True)
+            ),
+            ["new_id_1", "new_id_4"],
+        )
+
+    @patch("transactions.selectors.TransactionSelector.get_by_external_ids")
+    def test_create_batch__replays_transaction_created_concurrently(
+        self, mock_get_by_external_ids
+    ):
+        # Created by a concurrent request after the lookup
+        concurrent_transaction = Transaction.objects.create(
+            external_id="new_id_1", total_amount=600
+        )
+        mock_get_by_external_ids.return_value = {}
+        replays = get_count(
+            "transaction_replays_total", {"operation": "batch"}
+        )
+        rejection_labels = {
+            "operation": "batch",
+            "error_code": "UserHasNotEnoughFundsError",
+        }
+        rejections = get_count(
+            "transaction_rejections_total", rejection_labels
+        )
+
+        results = self.service.create_batch(
+            [
+                self._make_item("new_id_1", 600),
+                self._make_item("new_id_2", 1000),
+                self._make_item("new_id_3", 1),
+            ]
+        )
+
+        self.assertEqual(
+            [result.status for result in results],
+            [
+                TransactionBatchItemStatus.EXISTING,
+                TransactionBatchItemStatus.CREATED,
+                TransactionBatchItemStatus.FAILED,
+            ],
+        )
+        self.assertEqual(results[0].transaction, concurrent_transaction)
+        self.assertEqual(results[1].transaction.external_id, "new_id_2")
+        self.assertIsInstance(results[2].error, UserHasNotEnoughFundsException)
+        self.assertEqual(UserBalance.objects.get(user=self.sender).amount, 0)
+        self.assertEqual(
+            UserBalance.objects.get(user=self.receiver).amount, 1000
+        )
+        self.assertEqual(
+            get_count("transaction_replays_total", {"operation": "batch"}),
+            replays + 1,
+        )
+        self.assertEqual(
+            get_count("transaction_rejections_total", rejection_labels),
+            rejections + 1,
+        )
+
+    def test_create_batch__query_count_does_not_depend_on_size(self):
+        items = [self._make_item(f"new_id_{i}", 10) for i in range(20)]
+
+        # Including the savepoint of the bulk insert
+        with self.assertNumQueries(11):
+            results = self.service.create_batch(items)
+            self.assertEqual(len(results[0].transaction.participant_list), 2)
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class TransactionServiceConcurrencyTests(TransactionTestCase):
+    transfers_count = 200
+    transfer_amount = 10
+
+    def setUp(self):
+        cache.clear()
+        self.sender = User.objects.create(
+            username="sender", password="password"
+        )
+        self.receiver = User.objects.create(
+            username="receiver", password="password"
+        )
+        UserBalance.objects.create(user=self.sender, amount=1000)
+
+    def _transfer(self, index):
+        data = make_transfer_data(
+            f"concurrent_{index}",
+            self.sender.id,
+            self.receiver.id,
+            self.transfer_amount,
+            calculated=False,
+        )
+        try:
+            TransactionService().create(data)
+            return True
+        except UserHasNotEnoughFundsException:
+            return False
+        finally:
+            connection.close()
+
+    def test_concurrent_transfers_never_overdraw_sender(self):
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            results = list(
+                executor.map(self._transfer, range(self.transfers_count))
+            )
+
+        succeeded = results.count(True)
+        sender_balance = UserBalance.objects.get(user=self.sender).amount
+        receiver_balance = UserBalance.objects.get(user=self.receiver).amount
+
+        self.assertEqual(succeeded, 1000 // self.transfer_amount)
+        self.assertEqual(sender_balance, 0)
+        self.assertEqual(receiver_balance, 1000)
+        self.assertEqual(
+            Transaction.objects.filter(
+                external_id__startswith="concurrent_"
+            ).count(),
+            succeeded,
+        )
+
+
+@override_settings(USER_BALANCE_RESERVATIONS_ENABLED=True)
+class TransactionServiceReservationTests(TransactionTestCase):
+    def setUp(self):
+        if get_redis_client() is None:
+            self.skipTest("Requires the Redis cache backend")
+
+        cache.clear()
+        self.sender = User.objects.create(
+            username="sender", password="password"
+        )
+        self.receiver = User.objects.create(
+            username="receiver", password="password"
+        )
+        UserBalance.objects.create(user=self.sender, amount=1000)
+
+    def test_back_to_back_transfers_use_up_exact_balance(self):
+        create = TransactionService._create
+        results = []
+
+        def create_then_transfer_rest(service, data, *args):
+            transaction = create(service, data, *args)
+            if data.transaction_id == "first":
+                # The first transfer is committed and its debit cached,
+                # its reservation must no longer count against the rest
+                results.append(
+                    TransactionService().create(
+                        make_transfer_data(
+                            "second",
+                            self.sender.id,
+                            self.receiver.id,
+                            400,
+                            calculated=False,
+                        )
+                    )
+                )
+            return transaction
+
+        with patch.object(
+            TransactionService,
+            "_create",
+            autospec=True,
+            side_effect=create_then_transfer_rest,
+        ):
+            TransactionService().create(
+                make_transfer_data(
+                    "first",
+                    self.sender.id,
+                    self.receiver.id,
+                    600,
+                    calculated=False,
+                )
+            )
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(UserBalance.objects.get(user=self.sender).amount, 0)
+        self.assertEqual(UserBalanceService().get(self.sender.id), 0)
+        self.assertIsNone(
+            cache.get(
+                balance_cache._get_reserved_key(
+                    balance_cache.make_key(self.sender.id)
+                )
+            )
+        )
@@ -1,6 +1,20 @@
+from django.conf import settings
 from rest_framework import serializers
 
 
 class UserBalanceSerializer(serializers.ModelSerializer):
     user_id = serializers.UUIDField()
     balance = serializers.IntegerField()
+
+
+class UserBalancesInputSerializer(serializers.Serializer):
+    user_ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        allow_empty=False,
+        max_length=settings.USER_BALANCES_MAX_SIZE,
+    )
+
+
+class UserBalanceOutputSerializer(serializers.Serializer):
+    user_id = serializers.UUIDField()
+    balance = serializers.IntegerField()
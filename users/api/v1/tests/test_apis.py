@@ -1,11 +1,15 @@
 from unittest.mock import patch
+from uuid import uuid4
 
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
 from django.urls import reverse
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.test import APIRequestFactory, APITestCase
 
+from users.api.v1.views import AsyncUserBalanceAPIView
 from users.exceptions import UserNotFoundException
-from users.models import User
+from users.models import User, UserBalance
 
 
 class UserAPITests(APITestCase):
@@ -43,3 +47,95 @@ class UserAPITests(APITestCase):
                 "error_code": UserNotFoundException.error_code,
             },
         )
+
+
+class AsyncUserBalanceAPITests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(
+            username="username", password="hashed_password"
+        )
+        UserBalance.objects.create(user=self.user, amount=1000)
+        self.view = AsyncUserBalanceAPIView.as_view()
+        self.factory = APIRequestFactory()
+
+    def get_balance(self, user_id):
+        request = self.factory.get(f"/api/v1/users/{user_id}/balance/")
+        return async_to_sync(self.view)(request, user_id=user_id)
+
+    def test_get_user_balance__success(self):
+        with self.assertNumQueries(1):
+            response = self.get_balance(self.user.id)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data, {"user_id": self.user.id, "balance": 1000}
+        )
+
+        # Served from the cache
+        with self.assertNumQueries(0):
+            response = self.get_balance(self.user.id)
+        self.assertEqual(response.data["balance"], 1000)
+
+    def test_get_user_balance__raises_error__when_user_not_found(self):
+        response = self.get_balance(uuid4())
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class UserBalancesAPITests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(
+            username="username", password="hashed_password"
+        )
+        self.other_user = User.objects.create(
+            username="otheruser", password="hashed_password"
+        )
+        UserBalance.objects.create(user=self.user, amount=1000)
+        self.url = reverse("user-balances")
+
+    def test_get_user_balances__success(self):
+        user_ids = [str(self.other_user.id), str(self.user.id)]
+
+        with self.assertNumQueries(1):
+            response = self.client.post(
+                self.url, {"user_ids": user_ids}, format="json"
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.json(),
+            {
+                "balances": [
+                    {"user_id": str(self.other_user.id), "balance": 0},
+                    {"user_id": str(self.user.id), "balance": 1000},
+                ]
+            },
+        )
+
+        # Cached balances belong to existing users
+        with self.assertNumQueries(0):
+            self.client.post(self.url, {"user_ids": user_ids}, format="json")
+
+    def test_get_user_balances__raises_error__when_user_not_found(self):
+        # The existing user is served from cache
+        self.client.post(
+            self.url, {"user_ids": [str(self.user.id)]}, format="json"
+        )
+
+        response = self.client.post(
+            self.url,
+            {"user_ids": [str(self.user.id), str(uuid4())]},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(
+            response.json()["error_code"], UserNotFoundException.error_code
+        )
+
+    def test_get_user_balances__raises_error__when_no_user_ids(self):
+        response = self.client.post(self.url, {"user_ids": []}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -1,11 +1,23 @@
+from django.conf import settings
 from django.urls import path
 
 from users.api.v1 import views
 
+# Native async views, for ASGI deployments
+if settings.ASYNC_VIEWS_ENABLED:
+    user_balance_view = views.AsyncUserBalanceAPIView.as_view()
+else:
+    user_balance_view = views.UserBalanceAPIView.as_view()
+
 urlpatterns = [
     path(
         "api/v1/users/<uuid:user_id>/balance/",
-        views.UserBalanceAPIView.as_view(),
+        user_balance_view,
         name="user-balance",
     ),
+    path(
+        "api/v1/users/balances/",
+        views.UserBalancesAPIView.as_view(),
+        name="user-balances",
+    ),
 ]
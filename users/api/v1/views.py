@@ -1,5 +1,6 @@
 from uuid import UUID
 
+from adrf.views import APIView as AsyncAPIView
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
@@ -7,8 +8,16 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from common.typing import HttpRequestWithData
-from common.utils.api import get_exception_response, get_response
-from users.api.v1.serializers import UserBalanceSerializer
+from common.utils.api import (
+    get_exception_response,
+    get_response,
+    is_serializer_valid,
+)
+from users.api.v1.serializers import (
+    UserBalanceOutputSerializer,
+    UserBalanceSerializer,
+    UserBalancesInputSerializer,
+)
 from users.services import UserBalanceService
 
 
@@ -32,3 +41,72 @@ class UserBalanceAPIView(APIView):
             return get_response({"user_id": user_id, "balance": balance}, 200)
         except Exception as error:
             return get_exception_response(error)
+
+
+class AsyncUserBalanceAPIView(AsyncAPIView):
+    serializer_class = UserBalanceSerializer
+
+    @swagger_auto_schema(
+        tags=["balance"],
+        operation_id="Get user balance",
+        responses={
+            status.HTTP_200_OK: openapi.Response(
+                "Get user balance successfully",
+            ),
+            status.HTTP_404_NOT_FOUND: openapi.Response("User not found"),
+        },
+    )
+    async def get(
+        self, request: HttpRequestWithData, user_id: UUID
+    ) -> Response:
+        service = UserBalanceService()
+        try:
+            balance = await service.aget(user_id)
+            return get_response({"user_id": user_id, "balance": balance}, 200)
+        except Exception as error:
+            return get_exception_response(error)
+
+
+class UserBalancesAPIView(APIView):
+    input_serializer_class = UserBalancesInputSerializer
+    output_serializer_class = UserBalanceOutputSerializer
+
+    @swagger_auto_schema(
+        tags=["balance"],
+        operation_id="Get balances of many users",
+        request_body=input_serializer_class,
+        responses={
+            status.HTTP_200_OK: openapi.Response(
+                "Get user balances successfully",
+                output_serializer_class(many=True),
+            ),
+            status.HTTP_400_BAD_REQUEST: openapi.Response(
+                "The request validation has failed"
+            ),
+            status.HTTP_404_NOT_FOUND: openapi.Response("Users not found"),
+        },
+    )
+    def post(self, request: HttpRequestWithData) -> Response:
+        serializer = self.input_serializer_class(data=request.data)
+        if error := is_serializer_valid(serializer):
+            return error
+
+        service = UserBalanceService()
+        try:
+            balances = service.get_many_or_raise(
+                list(dict.fromkeys(serializer.validated_data["user_ids"]))
+            )
+            return get_response(
+                {
+                    "balances": self.output_serializer_class(
+                        [
+                            {"user_id": user_id, "balance": balance}
+                            for user_id, balance in balances.items()
+                        ],
+                        many=True,
+                    ).data
+                },
+                200,
+            )
+        except Exception as error:
+            return get_exception_response(error)
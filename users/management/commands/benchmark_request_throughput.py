@@ -0,0 +1,76 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure in-process request throughput of the balance endpoint "
+        "through the full middleware stack of the current settings. Run "
+        "it with the dev and the prod settings to compare them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=5000,
+            help="Number of requests measured",
+        )
+        parser.add_argument(
+            "--warmup",
+            type=int,
+            default=100,
+            help="Number of requests sent before measuring",
+        )
+
+    def handle(self, *args, **options):
+        user_id = User.objects.values_list("id", flat=True).first()
+        if user_id is None:
+            raise CommandError("At least one user is required")
+
+        url = reverse("user-balance", kwargs={"user_id": user_id})
+        client = Client(HTTP_HOST=self._get_host())
+
+        for _ in range(options["warmup"]):
+            self._get(client, url)
+
+        durations = []
+        started_at = time.perf_counter()
+        for _ in range(options["requests"]):
+            request_started_at = time.perf_counter()
+            self._get(client, url)
+            durations.append((time.perf_counter() - request_started_at) * 1000)
+        elapsed = time.perf_counter() - started_at
+
+        percentiles = statistics.quantiles(durations, n=100)
+        self.stdout.write(
+            f"{settings.SETTINGS_MODULE} (DEBUG={settings.DEBUG}, "
+            f"{len(settings.MIDDLEWARE)} middleware): "
+            f"{len(durations) / elapsed:.1f} req/s "
+            f"p50={percentiles[49]:.2f}ms p95={percentiles[94]:.2f}ms "
+            f"p99={percentiles[98]:.2f}ms ({len(durations)} requests)"
+        )
+
+    @staticmethod
+    def _get(client: Client, url: str) -> None:
+        response = client.get(url)
+        if response.status_code != 200:
+            raise CommandError(
+                f"Unexpected response {response.status_code}: "
+                f"{response.content[:200]!r}"
+            )
+
+    @staticmethod
+    def _get_host() -> str:
+        for host in settings.ALLOWED_HOSTS:
+            if host != "*" and not host.startswith("."):
+                return host
+
+        return "localhost"
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from users.models import User
+from users.services import UserBalanceService
+
+
+class Command(BaseCommand):
+    help = "Rebuild materialized user balances from transaction participants"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user-id",
+            action="append",
+            dest="user_ids",
+            help="Rebuild only the given user, can be repeated",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of users rebuilt per database transaction",
+        )
+
+    def handle(self, *args, **options):
+        service = UserBalanceService()
+        batch_size = options["batch_size"]
+
+        queryset = User.objects.order_by("id")
+        if options["user_ids"]:
+            queryset = queryset.filter(id__in=options["user_ids"])
+
+        rebuilt = 0
+        batch = []
+        for user_id in queryset.values_list("id", flat=True).iterator(
+            chunk_size=batch_size
+        ):
+            batch.append(user_id)
+            if len(batch) == batch_size:
+                service.rebuild(batch)
+                rebuilt += len(batch)
+                batch = []
+
+        if batch:
+            service.rebuild(batch)
+            rebuilt += len(batch)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt balances of {rebuilt} users")
+        )
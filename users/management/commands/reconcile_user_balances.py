@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users.models import User
+from users.services import UserBalanceService
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare cached user balances with the materialized balances "
+        "in the database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user-id",
+            action="append",
+            dest="user_ids",
+            help="Check only the given user, can be repeated",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of users checked per cache round trip",
+        )
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Drop mismatching balances from the cache",
+        )
+
+    def handle(self, *args, **options):
+        service = UserBalanceService()
+        batch_size = options["batch_size"]
+
+        queryset = User.objects.order_by("id")
+        if options["user_ids"]:
+            queryset = queryset.filter(id__in=options["user_ids"])
+
+        checked = 0
+        mismatches = {}
+        batch = []
+        for user_id in queryset.values_list("id", flat=True).iterator(
+            chunk_size=batch_size
+        ):
+            batch.append(user_id)
+            if len(batch) == batch_size:
+                mismatches.update(
+                    service.reconcile_cache(batch, fix=options["fix"])
+                )
+                checked += len(batch)
+                batch = []
+
+        if batch:
+            mismatches.update(
+                service.reconcile_cache(batch, fix=options["fix"])
+            )
+            checked += len(batch)
+
+        for user_id, (cached, stored) in mismatches.items():
+            self.stdout.write(
+                f"{user_id}: cached {cached[0]} (version {cached[1]}), "
+                f"stored {stored[0]} (version {stored[1]})"
+            )
+
+        if mismatches and not options["fix"]:
+            raise CommandError(
+                f"{len(mismatches)} of {checked} cached balances "
+                "differ from the database"
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Checked {checked} users, "
+                f"dropped {len(mismatches)} cached balances"
+                if options["fix"]
+                else f"Checked {checked} users, cached balances are in sync"
+            )
+        )
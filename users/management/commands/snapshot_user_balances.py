@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from users.models import User
+from users.services import UserBalanceService
+
+
+class Command(BaseCommand):
+    help = (
+        "Snapshot user balances at a checkpoint, "
+        "meant to run daily shortly after midnight"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--taken-at",
+            help="ISO datetime of the checkpoint, defaults to today's midnight",
+        )
+        parser.add_argument(
+            "--user-id",
+            action="append",
+            dest="user_ids",
+            help="Snapshot only the given user, can be repeated",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of users snapshotted per query",
+        )
+
+    def handle(self, *args, **options):
+        service = UserBalanceService()
+        batch_size = options["batch_size"]
+
+        if options["taken_at"]:
+            taken_at = parse_datetime(options["taken_at"])
+            if taken_at is None:
+                raise CommandError("--taken-at must be an ISO datetime")
+            if timezone.is_naive(taken_at):
+                taken_at = timezone.make_aware(taken_at)
+        else:
+            taken_at = timezone.now().replace(
+                hour=0, minute=0, second=0, microsecond=0
+            )
+
+        queryset = User.objects.order_by("id")
+        if options["user_ids"]:
+            queryset = queryset.filter(id__in=options["user_ids"])
+
+        snapshotted = 0
+        batch = []
+        for user_id in queryset.values_list("id", flat=True).iterator(
+            chunk_size=batch_size
+        ):
+            batch.append(user_id)
+            if len(batch) == batch_size:
+                service.snapshot(batch, taken_at)
+                snapshotted += len(batch)
+                batch = []
+
+        if batch:
+            service.snapshot(batch, taken_at)
+            snapshotted += len(batch)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Snapshotted balances of {snapshotted} users "
+                f"at {taken_at.isoformat()}"
+            )
+        )
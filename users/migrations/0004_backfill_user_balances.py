@@ -0,0 +1,48 @@
+# Generated by Django 5.1.15 on 2026-10-18 09:47
+
+from django.db import migrations
+from django.db.models import Case, F, Sum, When
+
+
+def backfill_user_balances(apps, schema_editor):
+    """
+    Materialize balances of users that already have transactions
+    """
+    UserBalance = apps.get_model("users", "UserBalance")
+    TransactionParticipant = apps.get_model(
+        "transactions", "TransactionParticipant"
+    )
+
+    totals = (
+        TransactionParticipant.objects.values("user_id")
+        .annotate(
+            amount=Sum(
+                Case(
+                    When(role="RECEIVER", then=F("share_amount")),
+                    default=-F("share_amount"),
+                )
+            )
+        )
+        .order_by()
+    )
+    UserBalance.objects.bulk_create(
+        [
+            UserBalance(user_id=total["user_id"], amount=total["amount"])
+            for total in totals
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0003_userbalance"),
+        ("transactions", "0002_auto_20240923_0908"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            backfill_user_balances, migrations.RunPython.noop
+        ),
+    ]
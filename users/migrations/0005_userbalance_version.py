@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 10:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0004_backfill_user_balances"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userbalance",
+            name="version",
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
+from django.db import models
 from django.utils.translation import gettext_lazy as _
 
 from common.models import BaseModel
@@ -35,3 +36,30 @@ class User(BaseModel, AbstractUser):
 
     def __str__(self) -> str:
         return self.username
+
+
+class UserBalance(BaseModel):
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, related_name="balance"
+    )
+    amount = models.BigIntegerField(default=0)  # ISO (cents)
+    # Bumped on every amount change, orders cached balances
+    version = models.BigIntegerField(default=0)
+
+
+class UserBalanceSnapshot(BaseModel):
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="balance_snapshots"
+    )
+    # Balance of every participation created before this moment
+    taken_at = models.DateTimeField()
+    amount = models.BigIntegerField()  # ISO (cents)
+
+    class Meta:
+        constraints = [
+            # Also serves lookups of the latest snapshot before a moment
+            models.UniqueConstraint(
+                fields=["user", "taken_at"],
+                name="user_balance_snapshot_unique_constraint",
+            )
+        ]
@@ -1,7 +1,19 @@
+from collections import defaultdict
+from datetime import datetime
 from uuid import UUID
 
+from django.db.models import OuterRef, Subquery
+
 from users.exceptions import UserNotFoundException
-from users.models import User
+from users.models import User, UserBalance, UserBalanceSnapshot
+
+
+def raise_users_not_found(missing_ids: set[UUID]) -> None:
+    if missing_ids:
+        raise UserNotFoundException(
+            "Users not found with ids: "
+            + ", ".join(sorted(str(user_id) for user_id in missing_ids))
+        )
 
 
 class UserSelector:
@@ -12,3 +24,144 @@ class UserSelector:
             return User.objects.get(id=user_id)
         except User.DoesNotExist:
             raise UserNotFoundException(f"User not found with id: {user_id}")
+
+    @staticmethod
+    def get_existing_ids(user_ids: list[UUID]) -> set[UUID]:
+        return set(
+            User.objects.filter(id__in=user_ids)
+            .order_by()
+            .values_list("id", flat=True)
+        )
+
+    @staticmethod
+    def validate_many_exist(user_ids: list[UUID]) -> None:
+        raise_users_not_found(
+            set(user_ids) - UserSelector.get_existing_ids(user_ids)
+        )
+
+
+class UserBalanceSelector:
+
+    @staticmethod
+    def get_versioned_amount_or_raise(user_id: UUID) -> tuple[int, int]:
+        """
+        Materialized balance of the user with its version, checking the
+        user exists in the same query; users without a balance row have
+        never participated in a transaction.
+        """
+        try:
+            amount, version = User.objects.values_list(
+                "balance__amount", "balance__version"
+            ).get(id=user_id)
+        except User.DoesNotExist:
+            raise UserNotFoundException(f"User not found with id: {user_id}")
+
+        return amount or 0, version or 0
+
+    @staticmethod
+    async def aget_versioned_amount_or_raise(
+        user_id: UUID,
+    ) -> tuple[int, int]:
+        try:
+            amount, version = await User.objects.values_list(
+                "balance__amount", "balance__version"
+            ).aget(id=user_id)
+        except User.DoesNotExist:
+            raise UserNotFoundException(f"User not found with id: {user_id}")
+
+        return amount or 0, version or 0
+
+    @staticmethod
+    def get_versioned_amounts(
+        user_ids: list[UUID],
+    ) -> dict[UUID, tuple[int, int]]:
+        """
+        Materialized balances of the given users with their versions;
+        users without a balance row are omitted.
+        """
+        return {
+            user_id: (amount, version)
+            for user_id, amount, version in UserBalance.objects.filter(
+                user_id__in=user_ids
+            ).values_list("user_id", "amount", "version")
+        }
+
+    @staticmethod
+    def get_versioned_amounts_or_raise(
+        user_ids: list[UUID],
+    ) -> dict[UUID, tuple[int, int]]:
+        """
+        Materialized balances of the given users with their versions,
+        checking the users exist in the same query; users without a
+        balance row have never participated in a transaction.
+        """
+        amounts = {
+            user_id: (amount or 0, version or 0)
+            for user_id, amount, version in User.objects.filter(
+                id__in=user_ids
+            )
+            .order_by()
+            .values_list("id", "balance__amount", "balance__version")
+        }
+        raise_users_not_found(set(user_ids) - amounts.keys())
+
+        return amounts
+
+    @staticmethod
+    def get_for_update(user_ids: list[UUID]) -> dict[UUID, UserBalance]:
+        """
+        Lock balance rows of the given users until the end of the
+        surrounding atomic block. Rows are locked in user id order so
+        concurrent transfers touching the same users cannot deadlock.
+        """
+        return {
+            balance.user_id: balance
+            for balance in UserBalance.objects.select_for_update()
+            .filter(user_id__in=user_ids)
+            .order_by("user_id")
+            .only("user_id", "amount", "version")
+        }
+
+    @staticmethod
+    def get_latest_snapshots(
+        user_ids: list[UUID], at: datetime, inclusive: bool = True
+    ) -> dict[UUID, UserBalanceSnapshot]:
+        """
+        Latest balance snapshot of each user taken no later than `at`,
+        or strictly before it unless `inclusive`; users without one
+        are omitted.
+        """
+        taken_at_lookup = "taken_at__lte" if inclusive else "taken_at__lt"
+        latest_taken_at = (
+            UserBalanceSnapshot.objects.filter(
+                user_id=OuterRef("user_id"), **{taken_at_lookup: at}
+            )
+            .order_by("-taken_at")
+            .values("taken_at")[:1]
+        )
+        return {
+            snapshot.user_id: snapshot
+            for snapshot in UserBalanceSnapshot.objects.filter(
+                user_id__in=user_ids, taken_at=Subquery(latest_taken_at)
+            )
+        }
+
+    @staticmethod
+    def get_snapshot_users_after(
+        user_ids: list[UUID], after: datetime
+    ) -> dict[datetime, list[UUID]]:
+        """
+        Users of the given ones having a snapshot taken after `after`,
+        by the time it was taken, oldest first.
+        """
+        users_by_taken_at = defaultdict(list)
+        for user_id, taken_at in (
+            UserBalanceSnapshot.objects.filter(
+                user_id__in=user_ids, taken_at__gt=after
+            )
+            .order_by("taken_at")
+            .values_list("user_id", "taken_at")
+        ):
+            users_by_taken_at[taken_at].append(user_id)
+
+        return users_by_taken_at
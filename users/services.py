@@ -1,21 +1,37 @@
+from collections import defaultdict
+from datetime import datetime
 from uuid import UUID
 
 from django.conf import settings
-from django.core.cache import cache
+from django.db import transaction as db_transaction
+from django.db.models import BigIntegerField, Case, F, Value, When
+from django.utils import timezone
 
+from common.cache import ReservationStatus, VersionedReadThroughCache
 from transactions.exceptions import UserHasNotEnoughFundsException
 from transactions.selectors import TransactionSelector
-from users.models import User
-from users.selectors import UserSelector
+from users.models import User, UserBalance, UserBalanceSnapshot
+from users.selectors import UserBalanceSelector, UserSelector
+
+balance_cache = VersionedReadThroughCache(
+    key_prefix=settings.USER_BALANCE_CACHE_KEY_PREFIX,
+    timeout=settings.USER_BALANCE_CACHE_TIMEOUT,
+    early_expiration_beta=settings.USER_BALANCE_CACHE_EARLY_EXPIRATION_BETA,
+    name="user_balance",
+)
 
 
 class UserService:
     """
     Service class for user-related operations.
     """
+
     def get_by_id_or_raise(self, user_id: UUID) -> User:
         return UserSelector.get_by_id_or_raise(user_id)
 
+    def validate_many_exist(self, user_ids: list[UUID]) -> None:
+        UserSelector.validate_many_exist(user_ids)
+
 
 class UserBalanceService:
     """
@@ -23,28 +39,148 @@ class UserBalanceService:
 
     including balance retrieval and validation of funds.
     """
+
     def get(self, user_id: UUID) -> int:
         """
         Retrieve the balance for a specific user,
         utilizing caching to improve performance.
+
+        Only users that exist have a cached balance, a cache miss checks
+        the user and reads the balance with a single query.
         """
-        user = UserSelector.get_by_id_or_raise(user_id)
+        return balance_cache.get(
+            user_id,
+            lambda: UserBalanceSelector.get_versioned_amount_or_raise(user_id),
+        )
 
-        cache_key = self.get_cache_key(user_id)
+    async def aget(self, user_id: UUID) -> int:
+        """
+        Async counterpart of `get`.
+        """
+        return await balance_cache.aget(
+            user_id,
+            lambda: UserBalanceSelector.aget_versioned_amount_or_raise(
+                user_id
+            ),
+        )
 
-        balance = cache.get(cache_key)
-        if balance:
-            return balance
+    def get_many(self, user_ids: list[UUID]) -> dict[UUID, int]:
+        """
+        Retrieve balances of many users with one cache round trip
+        and one query for the cache misses.
+
+        Users are expected to exist, unknown ids get a zero balance.
+        """
+        return balance_cache.get_many(user_ids, self._get_versioned_amounts)
 
-        sent_amount = TransactionSelector.get_user_total_sent_amount(user.id)
-        received_amount = TransactionSelector.get_user_total_received_amount(
+    def get_many_or_raise(self, user_ids: list[UUID]) -> dict[UUID, int]:
+        """
+        Retrieve balances of many existing users, in the given order.
+
+        Cached balances belong to existing users, only the cache misses
+        are checked, in the query that reads their balances.
+        """
+        balances = balance_cache.get_many(
+            user_ids, UserBalanceSelector.get_versioned_amounts_or_raise
+        )
+
+        return {user_id: balances[user_id] for user_id in user_ids}
+
+    def get_as_of(self, user_id: UUID, at: datetime) -> int:
+        """
+        Balance of the user including every participation created
+        before `at`: the latest snapshot plus the participations
+        created since it was taken.
+        """
+        user = UserSelector.get_by_id_or_raise(user_id)
+
+        snapshot = UserBalanceSelector.get_latest_snapshots([user.id], at).get(
             user.id
         )
-        balance = received_amount - sent_amount
+        totals = TransactionSelector.get_users_total_amounts(
+            [user.id],
+            created_from=snapshot.taken_at if snapshot else None,
+            created_to=at,
+        )
+        return (snapshot.amount if snapshot else 0) + totals.get(user.id, 0)
 
-        cache.set(cache_key, balance)
+    def snapshot(self, user_ids: list[UUID], taken_at: datetime) -> None:
+        """
+        Store balances of the given users as of `taken_at`, rolling
+        their previous snapshots forward over the participations
+        created since. Their later snapshots are rolled forward again
+        from it, so recomputing an older checkpoint (e.g. after a
+        backfill) leaves none of them stale.
 
-        return balance
+        Participations are stamped before they commit, so `taken_at`
+        should lag behind now by more than any transfer takes.
+        """
+        previous = UserBalanceSelector.get_latest_snapshots(
+            user_ids, taken_at, inclusive=False
+        )
+        amounts = dict.fromkeys(user_ids, 0)
+        checkpoints = dict.fromkeys(user_ids)
+        for user_id, snapshot in previous.items():
+            amounts[user_id] = snapshot.amount
+            checkpoints[user_id] = snapshot.taken_at
+
+        snapshots = self._roll_snapshots_forward(
+            user_ids, taken_at, amounts, checkpoints
+        )
+        later_snapshot_users = UserBalanceSelector.get_snapshot_users_after(
+            user_ids, taken_at
+        )
+        for later_taken_at, later_user_ids in later_snapshot_users.items():
+            snapshots += self._roll_snapshots_forward(
+                later_user_ids, later_taken_at, amounts, checkpoints
+            )
+
+        UserBalanceSnapshot.objects.bulk_create(
+            snapshots,
+            update_conflicts=True,
+            unique_fields=["user", "taken_at"],
+            update_fields=["amount", "updated_at"],
+        )
+
+    @staticmethod
+    def _roll_snapshots_forward(
+        user_ids: list[UUID],
+        taken_at: datetime,
+        amounts: dict[UUID, int],
+        checkpoints: dict[UUID, datetime | None],
+    ) -> list[UserBalanceSnapshot]:
+        """
+        Snapshots of the users as of `taken_at`, adding the participations
+        created since their checkpoint to their amount; both are moved
+        to `taken_at`.
+        """
+        # Users sharing the previous checkpoint need one aggregate
+        users_by_checkpoint = defaultdict(list)
+        for user_id in user_ids:
+            users_by_checkpoint[checkpoints[user_id]].append(user_id)
+
+        for checkpoint, checkpoint_user_ids in users_by_checkpoint.items():
+            totals = TransactionSelector.get_users_total_amounts(
+                checkpoint_user_ids,
+                created_from=checkpoint,
+                created_to=taken_at,
+            )
+            for user_id in checkpoint_user_ids:
+                amounts[user_id] += totals.get(user_id, 0)
+                checkpoints[user_id] = taken_at
+
+        return [
+            UserBalanceSnapshot(
+                user_id=user_id, taken_at=taken_at, amount=amounts[user_id]
+            )
+            for user_id in user_ids
+        ]
+
+    def get_cache_stats(self) -> dict[str, int]:
+        """
+        Balance cache hits, misses and recomputes of this process.
+        """
+        return balance_cache.stats.as_dict()
 
     def validate_amount_to_send(
         self, user_id: UUID, sending_amount: int
@@ -58,11 +194,212 @@ class UserBalanceService:
                 f"User with id: {user_id} has not enough funds to send"
             )
 
-    def clear_cache(self, user_ids: list[UUID]) -> None:
-        cache.delete_many(
-            [self.get_cache_key(user_id) for user_id in user_ids]
+    def validate_amounts_to_send(self, amounts: dict[UUID, int]) -> None:
+        """
+        Validate whether users have enough funds to send the specified
+        amounts, fetching all balances at once.
+        """
+        balances = self.get_many(list(amounts))
+        for user_id, sending_amount in amounts.items():
+            if balances[user_id] < sending_amount:
+                raise UserHasNotEnoughFundsException(
+                    f"User with id: {user_id} has not enough funds to send"
+                )
+
+    def reserve_amounts_to_send(
+        self, amounts: dict[UUID, int]
+    ) -> dict[UUID, int]:
+        """
+        Reserve the amounts users are about to send against their cached
+        balances, in one atomic Redis call for all senders, so concurrent
+        transfers cannot spend the same funds.
+
+        Falls back to `validate_amounts_to_send` when reservations are
+        disabled or balances cannot be cached. Returns the reserved
+        amounts: pass them to `apply_deltas` to release them along with
+        the debit of the cached balances, or release them on failure.
+        """
+        if not settings.USER_BALANCE_RESERVATIONS_ENABLED:
+            self.validate_amounts_to_send(amounts)
+            return {}
+
+        status, user_id = balance_cache.reserve_many(
+            amounts, settings.USER_BALANCE_RESERVATION_TIMEOUT
+        )
+        if status == ReservationStatus.NOT_CACHED:
+            # Warm the cache with the missing balances and retry once
+            self.get_many(list(amounts))
+            status, user_id = balance_cache.reserve_many(
+                amounts, settings.USER_BALANCE_RESERVATION_TIMEOUT
+            )
+
+        if status == ReservationStatus.INSUFFICIENT:
+            raise UserHasNotEnoughFundsException(
+                f"User with id: {user_id} has not enough funds to send"
+            )
+        if status == ReservationStatus.RESERVED:
+            return amounts
+
+        self.validate_amounts_to_send(amounts)
+        return {}
+
+    def release_amounts(self, amounts: dict[UUID, int]) -> None:
+        balance_cache.release_many(amounts)
+
+    def apply_deltas(
+        self,
+        deltas: dict[UUID, int],
+        reserved_amounts: dict[UUID, int] | None = None,
+    ) -> None:
+        """
+        Add signed amounts to the materialized balances of the given users.
+
+        Must run inside the atomic block that writes the participants,
+        so balances never drift from the transaction history. Balance rows
+        are locked and debits are validated against the locked amounts,
+        so concurrent transfers cannot overdraw a sender. Call it as late
+        as possible in the block to keep the locks short.
+
+        `reserved_amounts` are released when the cached balances are
+        debited, see `add_amounts`.
+        """
+        if not deltas:
+            return
+
+        balances = self.lock_balances(list(deltas))
+        self.validate_deltas(balances, deltas)
+        self.add_amounts(balances, deltas, reserved_amounts)
+
+    def validate_deltas(
+        self, balances: dict[UUID, UserBalance], deltas: dict[UUID, int]
+    ) -> None:
+        """
+        Validate that no debited user ends up with a negative balance.
+        """
+        for user_id, delta in deltas.items():
+            if delta < 0 and balances[user_id].amount + delta < 0:
+                raise UserHasNotEnoughFundsException(
+                    f"User with id: {user_id} has not enough funds to send"
+                )
+
+    def lock_balances(self, user_ids: list[UUID]) -> dict[UUID, UserBalance]:
+        """
+        Lock balance rows of the given users, creating missing ones,
+        and return them. Must run inside an atomic block.
+        """
+        user_ids = sorted(user_ids)
+        UserBalance.objects.bulk_create(
+            [UserBalance(user_id=user_id) for user_id in user_ids],
+            ignore_conflicts=True,
         )
+        return UserBalanceSelector.get_for_update(user_ids)
+
+    def add_amounts(
+        self,
+        balances: dict[UUID, UserBalance],
+        deltas: dict[UUID, int],
+        reserved_amounts: dict[UUID, int] | None = None,
+    ) -> None:
+        """
+        Add signed amounts to locked balance rows in a single UPDATE,
+        without validating funds.
+
+        Cached balances are updated in place once the surrounding
+        transaction commits, so they stay warm under write load.
+        Reservations of the debited amounts are released in the same
+        cache call, so a concurrent transfer never counts them twice.
+        """
+        if not deltas:
+            return
+
+        UserBalance.objects.filter(user_id__in=deltas).update(
+            amount=F("amount")
+            + Case(
+                *[
+                    When(user_id=user_id, then=Value(delta))
+                    for user_id, delta in deltas.items()
+                ],
+                output_field=BigIntegerField(),
+            ),
+            version=F("version") + 1,
+            updated_at=timezone.now(),
+        )
+
+        cache_deltas = {
+            user_id: (delta, balances[user_id].version + 1)
+            for user_id, delta in deltas.items()
+        }
+        db_transaction.on_commit(
+            lambda: balance_cache.incr_many(cache_deltas, reserved_amounts)
+        )
+
+    def rebuild(self, user_ids: list[UUID]) -> None:
+        """
+        Recompute materialized balances of the given users
+        from their transaction participants.
+        """
+        with db_transaction.atomic():
+            # Concurrent transfers wait for the rebuild to commit
+            balances = UserBalanceSelector.get_for_update(user_ids)
+            totals = TransactionSelector.get_users_total_amounts(user_ids)
+            versioned_amounts = {}
+            for user_id in user_ids:
+                version = (
+                    balances[user_id].version if user_id in balances else 0
+                )
+                versioned_amounts[user_id] = (
+                    totals.get(user_id, 0),
+                    version + 1,
+                )
+
+            UserBalance.objects.bulk_create(
+                [
+                    UserBalance(
+                        user_id=user_id, amount=amount, version=version
+                    )
+                    for user_id, (amount, version) in versioned_amounts.items()
+                ],
+                update_conflicts=True,
+                unique_fields=["user"],
+                update_fields=["amount", "version", "updated_at"],
+            )
+            db_transaction.on_commit(
+                lambda: balance_cache.set_many(versioned_amounts)
+            )
+
+    def reconcile_cache(
+        self, user_ids: list[UUID], fix: bool = False
+    ) -> dict[UUID, tuple[tuple[int, int | None], tuple[int, int]]]:
+        """
+        Compare cached balances of the given users with the database.
+
+        Returns `(cached, stored)` amount and version pairs of every
+        cached balance that differs; with `fix` they are dropped from
+        the cache. Transfers in flight can show up as transient
+        differences.
+        """
+        cached = balance_cache.get_versioned_many(user_ids)
+        stored = self._get_versioned_amounts(list(cached))
+        mismatches = {
+            user_id: (cached[user_id], stored[user_id])
+            for user_id in cached
+            if cached[user_id] != stored[user_id]
+        }
+        if fix and mismatches:
+            self.clear_cache(list(mismatches))
+
+        return mismatches
+
+    def clear_cache(self, user_ids: list[UUID]) -> None:
+        balance_cache.delete_many(user_ids)
 
     @staticmethod
     def get_cache_key(user_id: UUID) -> str:
-        return f"{settings.USER_BALANCE_CACHE_KEY_PREFIX}{user_id}"
+        return balance_cache.make_key(user_id)
+
+    @staticmethod
+    def _get_versioned_amounts(
+        user_ids: list[UUID],
+    ) -> dict[UUID, tuple[int, int]]:
+        amounts = UserBalanceSelector.get_versioned_amounts(user_ids)
+        return {user_id: amounts.get(user_id, (0, 0)) for user_id in user_ids}
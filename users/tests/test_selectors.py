@@ -1,9 +1,13 @@
-from django.test import TestCase
-from uuid import uuid4
+from datetime import timedelta
 from unittest.mock import patch
-from users.models import User
-from users.selectors import UserSelector
+from uuid import uuid4
+
+from django.test import TestCase
+from django.utils import timezone
+
 from users.exceptions import UserNotFoundException
+from users.models import User, UserBalance, UserBalanceSnapshot
+from users.selectors import UserBalanceSelector, UserSelector
 
 
 class UserSelectorTests(TestCase):
@@ -28,3 +32,100 @@ class UserSelectorTests(TestCase):
         user = UserSelector.get_by_id_or_raise(self.user.id)
         self.assertEqual(user, self.user)
         mock_get.assert_called_once_with(id=self.user.id)
+
+    def test_validate_many_exist_success(self):
+        other_user = User.objects.create(
+            username="otheruser", password="password"
+        )
+        with self.assertNumQueries(1):
+            UserSelector.validate_many_exist([self.user.id, other_user.id])
+
+    def test_validate_many_exist_failure(self):
+        missing_ids = [uuid4(), uuid4()]
+        with self.assertRaises(UserNotFoundException) as context:
+            UserSelector.validate_many_exist([self.user.id, *missing_ids])
+        for missing_id in missing_ids:
+            self.assertIn(str(missing_id), context.exception.message)
+
+
+class UserBalanceSelectorTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username="testuser", password="password"
+        )
+
+    def test_get_versioned_amount_or_raise(self):
+        UserBalance.objects.create(user=self.user, amount=1500, version=3)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                UserBalanceSelector.get_versioned_amount_or_raise(
+                    self.user.id
+                ),
+                (1500, 3),
+            )
+
+    def test_get_versioned_amount_or_raise__when_no_balance_row(self):
+        self.assertEqual(
+            UserBalanceSelector.get_versioned_amount_or_raise(self.user.id),
+            (0, 0),
+        )
+
+    def test_get_versioned_amount_or_raise__raises_error__when_no_user(self):
+        with self.assertRaises(UserNotFoundException):
+            UserBalanceSelector.get_versioned_amount_or_raise(uuid4())
+
+    def test_get_versioned_amounts(self):
+        other_user = User.objects.create(
+            username="otheruser", password="password"
+        )
+        UserBalance.objects.create(user=self.user, amount=1500, version=3)
+
+        self.assertEqual(
+            UserBalanceSelector.get_versioned_amounts(
+                [self.user.id, other_user.id]
+            ),
+            {self.user.id: (1500, 3)},
+        )
+
+    def test_get_versioned_amounts_or_raise(self):
+        other_user = User.objects.create(
+            username="otheruser", password="password"
+        )
+        UserBalance.objects.create(user=self.user, amount=1500, version=3)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                UserBalanceSelector.get_versioned_amounts_or_raise(
+                    [self.user.id, other_user.id]
+                ),
+                {self.user.id: (1500, 3), other_user.id: (0, 0)},
+            )
+
+        missing_id = uuid4()
+        with self.assertRaises(UserNotFoundException) as context:
+            UserBalanceSelector.get_versioned_amounts_or_raise(
+                [self.user.id, missing_id]
+            )
+        self.assertIn(str(missing_id), context.exception.message)
+
+    def test_get_latest_snapshots(self):
+        other_user = User.objects.create(
+            username="otheruser", password="password"
+        )
+        now = timezone.now()
+        for days, amount in [(3, 100), (2, 200), (1, 300)]:
+            UserBalanceSnapshot.objects.create(
+                user=self.user, taken_at=now - timedelta(days), amount=amount
+            )
+
+        snapshots = UserBalanceSelector.get_latest_snapshots(
+            [self.user.id, other_user.id], now - timedelta(2)
+        )
+        earlier_snapshots = UserBalanceSelector.get_latest_snapshots(
+            [self.user.id], now - timedelta(2), inclusive=False
+        )
+
+        self.assertEqual(list(snapshots), [self.user.id])
+        self.assertEqual(snapshots[self.user.id].amount, 200)
+        self.assertEqual(earlier_snapshots[self.user.id].amount, 100)
@@ -1,10 +1,22 @@
-from django.test import TestCase
+from datetime import timedelta
 from unittest.mock import patch
 from uuid import uuid4
 
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from common.cache import ReservationStatus
 from transactions.exceptions import UserHasNotEnoughFundsException
-from users.models import User
-from users.services import UserService, UserBalanceService
+from transactions.models import (
+    Transaction,
+    TransactionParticipant,
+    TransactionParticipantRole,
+)
+from users.exceptions import UserNotFoundException
+from users.models import User, UserBalance, UserBalanceSnapshot
+from users.services import UserBalanceService, UserService, balance_cache
 
 
 class UserServiceTests(TestCase):
@@ -27,84 +39,150 @@ class UserServiceTests(TestCase):
 
 class UserBalanceServiceTests(TestCase):
     def setUp(self):
+        cache.clear()
         self.balance_service = UserBalanceService()
         self.user_id = uuid4()
         self.user = User.objects.create(
             username="testuser", password="password"
         )
 
-    @patch(
-        "transactions.selectors.TransactionSelector.get_user_total_sent_amount"
-    )
-    @patch(
-        "transactions.selectors.TransactionSelector.get_user_total_received_amount"
-    )
-    @patch("users.selectors.UserSelector.get_by_id_or_raise")
-    def test_get_balance(
-        self,
-        mock_get_by_id_or_raise,
-        mock_get_total_received,
-        mock_get_total_sent,
-    ):
-        mock_get_by_id_or_raise.return_value = self.user
-        mock_get_total_received.return_value = 1000
-        mock_get_total_sent.return_value = 500
+    @patch("users.selectors.UserBalanceSelector.get_versioned_amount_or_raise")
+    def test_get_balance(self, mock_get_versioned_amount):
+        mock_get_versioned_amount.return_value = (500, 1)
 
         balance = self.balance_service.get(self.user_id)
 
         self.assertEqual(balance, 500)
-        mock_get_by_id_or_raise.assert_called_once_with(self.user_id)
-        mock_get_total_received.assert_called_once_with(self.user.id)
-        mock_get_total_sent.assert_called_once_with(self.user.id)
+        mock_get_versioned_amount.assert_called_once_with(self.user_id)
 
-    @patch(
-        "transactions.selectors.TransactionSelector.get_user_total_sent_amount"
-    )
-    @patch(
-        "transactions.selectors.TransactionSelector.get_user_total_received_amount"
-    )
-    @patch("users.selectors.UserSelector.get_by_id_or_raise")
-    @patch("django.core.cache.cache.get")
-    @patch("django.core.cache.cache.set")
-    def test_get_balance_with_cache(
-        self,
-        mock_cache_set,
-        mock_cache_get,
-        mock_get_by_id_or_raise,
-        mock_get_total_received,
-        mock_get_total_sent,
-    ):
-        mock_get_by_id_or_raise.return_value = self.user
-        mock_get_total_received.return_value = 1000
-        mock_get_total_sent.return_value = 500
-        mock_cache_get.return_value = None
+    def test_get_balance__takes_one_query_on_cache_miss(self):
+        UserBalance.objects.create(user=self.user, amount=700, version=2)
 
-        balance = self.balance_service.get(self.user_id)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.balance_service.get(self.user.id), 700)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.balance_service.get(self.user.id), 700)
 
-        self.assertEqual(balance, 500)
-        mock_cache_get.assert_called_once_with(
-            f"{self.balance_service.get_cache_key(self.user_id)}"
+    def test_get_balance__raises_error__when_user_not_found(self):
+        with self.assertRaises(UserNotFoundException):
+            self.balance_service.get(self.user_id)
+
+        self.assertIsNone(
+            cache.get(self.balance_service.get_cache_key(self.user_id))
         )
-        mock_cache_set.assert_called_once_with(
-            f"{self.balance_service.get_cache_key(self.user_id)}", 500
+
+    @patch("users.selectors.UserBalanceSelector.get_versioned_amount_or_raise")
+    def test_get_balance_with_cache(self, mock_get_versioned_amount):
+        mock_get_versioned_amount.return_value = (500, 1)
+        hits = balance_cache.stats.get("hits")
+
+        self.assertEqual(self.balance_service.get(self.user.id), 500)
+        self.assertEqual(self.balance_service.get(self.user.id), 500)
+
+        mock_get_versioned_amount.assert_called_once_with(self.user.id)
+        self.assertEqual(
+            cache.get(self.balance_service.get_cache_key(self.user.id)), 500
         )
+        self.assertEqual(balance_cache.stats.get("hits"), hits + 1)
 
-    @patch("users.selectors.UserSelector.get_by_id_or_raise")
-    @patch(
-        "transactions.selectors.TransactionSelector.get_user_total_sent_amount"
-    )
-    @patch(
-        "transactions.selectors.TransactionSelector.get_user_total_received_amount"
-    )
-    def test_validate_amount_to_send_success(
-        self,
-        mock_get_total_received,
-        mock_get_total_sent,
-        mock_get_by_id_or_raise,
+    @patch("users.selectors.UserBalanceSelector.get_versioned_amount_or_raise")
+    def test_get_balance__caches_zero_balance(self, mock_get_versioned_amount):
+        mock_get_versioned_amount.return_value = (0, 1)
+
+        self.assertEqual(self.balance_service.get(self.user.id), 0)
+        self.assertEqual(self.balance_service.get(self.user.id), 0)
+
+        mock_get_versioned_amount.assert_called_once_with(self.user.id)
+
+    @patch("common.cache.time.sleep")
+    @patch("users.selectors.UserBalanceSelector.get_versioned_amount_or_raise")
+    def test_get_balance__waits_for_recompute_in_progress(
+        self, mock_get_versioned_amount, mock_sleep
     ):
-        mock_get_by_id_or_raise.return_value = self.user
-        mock_get_total_received.return_value = 1000
-        mock_get_total_sent.return_value = 500
+        cache_key = self.balance_service.get_cache_key(self.user.id)
+        cache.add(f"{cache_key}:lock", 1)
+        # The lock holder stores the balance while we wait
+        mock_sleep.side_effect = lambda seconds: cache.set(cache_key, 300)
+
+        balance = self.balance_service.get(self.user.id)
+
+        self.assertEqual(balance, 300)
+        mock_sleep.assert_called_once()
+        mock_get_versioned_amount.assert_not_called()
+
+    @patch("common.cache.time.sleep")
+    def test_get_balance__stops_waiting__when_lock_holder_fails(
+        self, mock_sleep
+    ):
+        cache_key = self.balance_service.get_cache_key(self.user_id)
+        cache.add(f"{cache_key}:lock", 1)
+        # The lock holder fails and releases the lock without a value
+        mock_sleep.side_effect = lambda seconds: cache.delete(
+            f"{cache_key}:lock"
+        )
+
+        with self.assertRaises(UserNotFoundException):
+            self.balance_service.get(self.user_id)
+
+        mock_sleep.assert_called_once()
+
+    @patch("common.cache.asyncio.sleep")
+    def test_aget_balance__stops_waiting__when_lock_holder_fails(
+        self, mock_sleep
+    ):
+        cache_key = self.balance_service.get_cache_key(self.user_id)
+        cache.add(f"{cache_key}:lock", 1)
+
+        async def release_lock(seconds):
+            await cache.adelete(f"{cache_key}:lock")
+
+        mock_sleep.side_effect = release_lock
+
+        with self.assertRaises(UserNotFoundException):
+            async_to_sync(self.balance_service.aget)(self.user_id)
+
+        mock_sleep.assert_called_once()
+
+    @patch("users.selectors.UserBalanceSelector.get_versioned_amount_or_raise")
+    def test_get_balance__rereads_cache_after_taking_lock(
+        self, mock_get_versioned_amount
+    ):
+        cache_key = self.balance_service.get_cache_key(self.user.id)
+        acquire_lock = balance_cache._acquire_lock
+
+        def store_then_acquire_lock(key):
+            # The previous lock holder stored the balance after our miss
+            cache.set(cache_key, 300)
+            return acquire_lock(key)
+
+        with patch.object(
+            balance_cache, "_acquire_lock", side_effect=store_then_acquire_lock
+        ):
+            balance = self.balance_service.get(self.user.id)
+
+        self.assertEqual(balance, 300)
+        mock_get_versioned_amount.assert_not_called()
+        self.assertIsNone(cache.get(f"{cache_key}:lock"))
+
+    @patch("users.selectors.UserBalanceSelector.get_versioned_amount_or_raise")
+    def test_get_balance__recomputes_early_when_about_to_expire(
+        self, mock_get_versioned_amount
+    ):
+        mock_get_versioned_amount.return_value = (500, 1)
+        cache_key = self.balance_service.get_cache_key(self.user.id)
+        cache.set_many(
+            {cache_key: 100, f"{cache_key}:meta": (1.0, 0.0)}, timeout=60
+        )
+
+        balance = self.balance_service.get(self.user.id)
+
+        self.assertEqual(balance, 500)
+        mock_get_versioned_amount.assert_called_once_with(self.user.id)
+        self.assertEqual(cache.get(cache_key), 500)
+
+    @patch("users.selectors.UserBalanceSelector.get_versioned_amount_or_raise")
+    def test_validate_amount_to_send_success(self, mock_get_versioned_amount):
+        mock_get_versioned_amount.return_value = (500, 1)
 
         try:
             self.balance_service.validate_amount_to_send(self.user_id, 300)
@@ -113,26 +191,125 @@ class UserBalanceServiceTests(TestCase):
                 "validate_amount_to_send raised UserHasNotEnoughFundsException unexpectedly!"
             )
 
-    @patch("users.selectors.UserSelector.get_by_id_or_raise")
-    @patch(
-        "transactions.selectors.TransactionSelector.get_user_total_sent_amount"
-    )
-    @patch(
-        "transactions.selectors.TransactionSelector.get_user_total_received_amount"
-    )
-    def test_validate_amount_to_send_failure(
-        self,
-        mock_get_total_received,
-        mock_get_total_sent,
-        mock_get_by_id_or_raise,
-    ):
-        mock_get_by_id_or_raise.return_value = self.user
-        mock_get_total_received.return_value = 1000
-        mock_get_total_sent.return_value = 900
+    @patch("users.selectors.UserBalanceSelector.get_versioned_amount_or_raise")
+    def test_validate_amount_to_send_failure(self, mock_get_versioned_amount):
+        mock_get_versioned_amount.return_value = (100, 1)
 
         with self.assertRaises(UserHasNotEnoughFundsException):
             self.balance_service.validate_amount_to_send(self.user_id, 200)
 
+    def test_get_many(self):
+        other_user = User.objects.create(
+            username="otheruser", password="password"
+        )
+        UserBalance.objects.create(user=self.user, amount=700)
+        self.balance_service.clear_cache([self.user.id, other_user.id])
+
+        with self.assertNumQueries(1):
+            balances = self.balance_service.get_many(
+                [self.user.id, other_user.id]
+            )
+        self.assertEqual(balances, {self.user.id: 700, other_user.id: 0})
+
+        with self.assertNumQueries(0):
+            cached_balances = self.balance_service.get_many(
+                [self.user.id, other_user.id]
+            )
+        self.assertEqual(cached_balances, balances)
+
+    @patch("users.services.UserBalanceService.get_many")
+    def test_validate_amounts_to_send(self, mock_get_many):
+        other_user_id = uuid4()
+        mock_get_many.return_value = {self.user_id: 500, other_user_id: 100}
+
+        self.balance_service.validate_amounts_to_send(
+            {self.user_id: 500, other_user_id: 100}
+        )
+        with self.assertRaises(UserHasNotEnoughFundsException):
+            self.balance_service.validate_amounts_to_send(
+                {self.user_id: 300, other_user_id: 200}
+            )
+
+    @override_settings(USER_BALANCE_RESERVATIONS_ENABLED=False)
+    @patch("users.services.balance_cache.reserve_many")
+    @patch("users.services.UserBalanceService.validate_amounts_to_send")
+    def test_reserve_amounts_to_send__when_disabled(
+        self, mock_validate_amounts, mock_reserve_many
+    ):
+        reserved = self.balance_service.reserve_amounts_to_send(
+            {self.user_id: 300}
+        )
+
+        self.assertEqual(reserved, {})
+        mock_validate_amounts.assert_called_once_with({self.user_id: 300})
+        self.assertFalse(mock_reserve_many.called)
+
+    @override_settings(USER_BALANCE_RESERVATIONS_ENABLED=True)
+    @patch("users.services.balance_cache.reserve_many")
+    def test_reserve_amounts_to_send(self, mock_reserve_many):
+        mock_reserve_many.return_value = (ReservationStatus.RESERVED, None)
+
+        reserved = self.balance_service.reserve_amounts_to_send(
+            {self.user_id: 300}
+        )
+
+        self.assertEqual(reserved, {self.user_id: 300})
+        mock_reserve_many.assert_called_once_with({self.user_id: 300}, 30)
+
+    @override_settings(USER_BALANCE_RESERVATIONS_ENABLED=True)
+    @patch("users.services.balance_cache.reserve_many")
+    def test_reserve_amounts_to_send__raises_error__when_not_enough_funds(
+        self, mock_reserve_many
+    ):
+        mock_reserve_many.return_value = (
+            ReservationStatus.INSUFFICIENT,
+            self.user_id,
+        )
+
+        with self.assertRaises(UserHasNotEnoughFundsException):
+            self.balance_service.reserve_amounts_to_send({self.user_id: 300})
+
+    @override_settings(USER_BALANCE_RESERVATIONS_ENABLED=True)
+    @patch("users.services.UserBalanceService.validate_amounts_to_send")
+    @patch("users.services.UserBalanceService.get_many")
+    @patch("users.services.balance_cache.reserve_many")
+    def test_reserve_amounts_to_send__falls_back__when_not_cached(
+        self, mock_reserve_many, mock_get_many, mock_validate_amounts
+    ):
+        mock_reserve_many.return_value = (
+            ReservationStatus.NOT_CACHED,
+            self.user_id,
+        )
+
+        reserved = self.balance_service.reserve_amounts_to_send(
+            {self.user_id: 300}
+        )
+
+        self.assertEqual(reserved, {})
+        self.assertEqual(mock_reserve_many.call_count, 2)
+        mock_get_many.assert_called_once_with([self.user_id])
+        mock_validate_amounts.assert_called_once_with({self.user_id: 300})
+
+    def test_reconcile_cache(self):
+        other_user = User.objects.create(
+            username="otheruser", password="password"
+        )
+        UserBalance.objects.create(user=self.user, amount=1000, version=2)
+        UserBalance.objects.create(user=other_user, amount=500, version=1)
+        balance_cache.set_many(
+            {self.user.id: (900, 2), other_user.id: (500, 1)}
+        )
+
+        mismatches = self.balance_service.reconcile_cache(
+            [self.user.id, other_user.id], fix=True
+        )
+
+        self.assertEqual(mismatches, {self.user.id: ((900, 2), (1000, 2))})
+        self.assertEqual(
+            balance_cache.get_versioned_many([self.user.id, other_user.id]),
+            {other_user.id: (500, 1)},
+        )
+
     @patch("django.core.cache.cache.delete_many")
     def test_clear_cache(self, mock_cache_delete_many):
         user_ids = [self.user_id, uuid4()]
@@ -142,4 +319,204 @@ class UserBalanceServiceTests(TestCase):
         cache_keys = [
             self.balance_service.get_cache_key(user_id) for user_id in user_ids
         ]
-        mock_cache_delete_many.assert_called_once_with(cache_keys)
+        mock_cache_delete_many.assert_called_once_with(
+            cache_keys
+            + [f"{cache_key}:meta" for cache_key in cache_keys]
+            + [f"{cache_key}:version" for cache_key in cache_keys]
+        )
+
+    @patch("users.services.balance_cache.incr_many")
+    def test_apply_deltas(self, mock_incr_many):
+        other_user = User.objects.create(
+            username="otheruser", password="password"
+        )
+        UserBalance.objects.create(user=self.user, amount=1000, version=4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.balance_service.apply_deltas(
+                {self.user.id: -300, other_user.id: 300}
+            )
+            self.assertFalse(mock_incr_many.called)
+
+        balance = UserBalance.objects.get(user=self.user)
+        other_balance = UserBalance.objects.get(user=other_user)
+        self.assertEqual((balance.amount, balance.version), (700, 5))
+        self.assertEqual(
+            (other_balance.amount, other_balance.version), (300, 1)
+        )
+        mock_incr_many.assert_called_once_with(
+            {self.user.id: (-300, 5), other_user.id: (300, 1)}, None
+        )
+
+    def test_apply_deltas__updates_cached_balance_after_commit(self):
+        UserBalance.objects.create(user=self.user, amount=1000)
+        self.assertEqual(self.balance_service.get(self.user.id), 1000)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.balance_service.apply_deltas({self.user.id: -300})
+
+        self.assertEqual(self.balance_service.get(self.user.id), 700)
+
+    @patch("common.cache.get_redis_client")
+    def test_apply_deltas__increments_cached_balance_on_redis(
+        self, mock_get_redis_client
+    ):
+        UserBalance.objects.create(user=self.user, amount=1000, version=2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.balance_service.apply_deltas({self.user.id: -300})
+
+        cache_key = self.balance_service.get_cache_key(self.user.id)
+        mock_get_redis_client.return_value.eval.assert_called_once_with(
+            balance_cache.INCR_SCRIPT,
+            3,
+            cache.make_key(cache_key),
+            cache.make_key(f"{cache_key}:version"),
+            cache.make_key(f"{cache_key}:reserved"),
+            balance_cache.timeout,
+            -300,
+            3,
+            0,
+        )
+
+    def test_apply_deltas__raises_error__when_not_enough_funds(self):
+        other_user = User.objects.create(
+            username="otheruser", password="password"
+        )
+        UserBalance.objects.create(user=self.user, amount=100)
+
+        with self.assertRaises(UserHasNotEnoughFundsException):
+            self.balance_service.apply_deltas(
+                {self.user.id: -300, other_user.id: 300}
+            )
+
+        self.assertEqual(UserBalance.objects.get(user=self.user).amount, 100)
+        self.assertEqual(UserBalance.objects.get(user=other_user).amount, 0)
+
+    @patch("users.services.balance_cache.set_many")
+    @patch(
+        "transactions.selectors.TransactionSelector.get_users_total_amounts"
+    )
+    def test_rebuild(self, mock_get_totals, mock_cache_set_many):
+        other_user = User.objects.create(
+            username="otheruser", password="password"
+        )
+        UserBalance.objects.create(user=self.user, amount=1, version=2)
+        mock_get_totals.return_value = {self.user.id: 800}
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.balance_service.rebuild([self.user.id, other_user.id])
+
+        self.assertEqual(UserBalance.objects.get(user=self.user).amount, 800)
+        self.assertEqual(UserBalance.objects.get(user=other_user).amount, 0)
+        mock_get_totals.assert_called_once_with([self.user.id, other_user.id])
+        mock_cache_set_many.assert_called_once_with(
+            {self.user.id: (800, 3), other_user.id: (0, 1)}
+        )
+
+
+class UserBalanceSnapshotTests(TestCase):
+    def setUp(self):
+        self.balance_service = UserBalanceService()
+        self.user = User.objects.create(
+            username="testuser", password="password"
+        )
+        self.day = timezone.now().replace(
+            hour=0, minute=0, second=0, microsecond=0
+        ) - timedelta(days=3)
+        # Received 1000 on day 0, sent 300 on day 1, received 50 on day 2
+        for index, (role, amount) in enumerate(
+            [
+                (TransactionParticipantRole.RECEIVER, 1000),
+                (TransactionParticipantRole.SENDER, 300),
+                (TransactionParticipantRole.RECEIVER, 50),
+            ]
+        ):
+            TransactionParticipant.objects.create(
+                transaction=Transaction.objects.create(
+                    external_id=f"external_id_{index}", total_amount=amount
+                ),
+                user=self.user,
+                role=role,
+                share=1,
+                share_amount=amount,
+                created_at=self.day + timedelta(days=index, hours=12),
+            )
+
+    def test_snapshot(self):
+        self.balance_service.snapshot([self.user.id], self.day + timedelta(1))
+        self.balance_service.snapshot([self.user.id], self.day + timedelta(2))
+
+        self.assertEqual(
+            list(
+                UserBalanceSnapshot.objects.order_by("taken_at").values_list(
+                    "taken_at", "amount"
+                )
+            ),
+            [
+                (self.day + timedelta(1), 1000),
+                (self.day + timedelta(2), 700),
+            ],
+        )
+
+    def test_snapshot__rolls_previous_snapshot_forward(self):
+        UserBalanceSnapshot.objects.create(
+            user=self.user, taken_at=self.day + timedelta(1), amount=5000
+        )
+
+        self.balance_service.snapshot([self.user.id], self.day + timedelta(2))
+
+        self.assertEqual(
+            UserBalanceSnapshot.objects.get(
+                taken_at=self.day + timedelta(2)
+            ).amount,
+            4700,
+        )
+
+    def test_snapshot__rolls_later_snapshots_forward(self):
+        self.balance_service.snapshot([self.user.id], self.day + timedelta(1))
+        self.balance_service.snapshot([self.user.id], self.day + timedelta(2))
+        # Backfilled on day 0, after both snapshots were taken
+        TransactionParticipant.objects.create(
+            transaction=Transaction.objects.create(
+                external_id="external_id_backfilled", total_amount=200
+            ),
+            user=self.user,
+            role=TransactionParticipantRole.RECEIVER,
+            share=1,
+            share_amount=200,
+            created_at=self.day + timedelta(hours=18),
+        )
+
+        self.balance_service.snapshot([self.user.id], self.day + timedelta(1))
+
+        self.assertEqual(
+            list(
+                UserBalanceSnapshot.objects.order_by("taken_at").values_list(
+                    "taken_at", "amount"
+                )
+            ),
+            [
+                (self.day + timedelta(1), 1200),
+                (self.day + timedelta(2), 900),
+            ],
+        )
+
+    def test_get_as_of(self):
+        self.balance_service.snapshot([self.user.id], self.day + timedelta(1))
+
+        with self.assertNumQueries(3):
+            balance = self.balance_service.get_as_of(
+                self.user.id, self.day + timedelta(days=2, hours=13)
+            )
+
+        self.assertEqual(balance, 750)
+        self.assertEqual(
+            self.balance_service.get_as_of(self.user.id, self.day), 0
+        )
+        self.assertEqual(
+            self.balance_service.get_as_of(
+                self.user.id, self.day + timedelta(1)
+            ),
+            1000,
+        )